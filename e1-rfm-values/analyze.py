@@ -2,15 +2,214 @@ import argparse
 import os
 import json
 import re
+from pathlib import Path
+import sys
 
-def parse_json_files(directory_path):
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from mcsee import artifacts
+
+import spd
+
+# Index of the decoded RFM fields of all SPD files (JSON or raw dumps) of a directory, stored in the directory itself.
+INDEX_NAME = ".rfm_index.npz"
+INDEX_VERSION = 2
+
+SDRAM_KEYS = ["sdram_0", "sdram_1"]
+SUB_KEYS = ["A", "B", "C"]
+FIELDS = ["rfm_req", "raaimt", "raammt"]
+
+# Per-file status in the index.
+STATUS_OK = 0
+STATUS_NO_ARFM = 1        # parsed, but no 'arfm' object
+STATUS_BAD_JSON = 2       # not parsed, invalid JSON
+STATUS_LOAD_ERROR = 3     # not parsed, other error (message in the index)
+STATUS_PARSE_ERROR = 4    # parsed, but the 'arfm' object is malformed (message in the index)
+
+# Define the custom sorting order for initial letters
+letter_order = {'M': 0, 'H': 1, 'S': 2, 'U': 3}
+
+
+def custom_sort_key(filename):
+    """
+    Custom key for sorting filenames.
+    Prioritizes M, H, S, U, then sorts by numeric part.
+    """
+    base_name = os.path.splitext(filename)[0] # Get filename without extension
+
+    first_char = base_name[0].upper() if base_name else ''
+
+    # Assign priority based on the defined letter_order, default to a high number for others
+    priority = letter_order.get(first_char, 999)
+
+    # Extract numeric part from the filename (e.g., "file10" -> 10)
+    # Use regex to find digits at the end or after the first character
+    match = re.search(r'(\d+)$', base_name)
+    numeric_part = int(match.group(1)) if match else 0 # Default to 0 if no number found
+
+    return (priority, numeric_part, base_name) # Include base_name for stable sort of non-numeric parts
+
+
+def parse_spd_file(filepath):
+    """
+    Decodes the RFM fields of one SPD JSON file.
+
+    Args:
+        filepath (str): The path to the JSON file.
+
+    Returns:
+        tuple: (status, message, values, present), where `values` holds the string of every field of every
+        <sdram, ARFM level> ("N/A" if it is missing) as a nested list indexed [sdram][level][field], and `present`
+        whether the ARFM level exists as a nested list indexed [sdram][level].
+    """
+    values = [[["N/A"] * len(FIELDS) for _ in SUB_KEYS] for _ in SDRAM_KEYS]
+    present = [[False] * len(SUB_KEYS) for _ in SDRAM_KEYS]
+    try:
+        with open(filepath, 'r') as f:
+            data = json.load(f)
+    except json.JSONDecodeError:
+        return STATUS_BAD_JSON, "", values, present
+    except Exception as e:
+        return STATUS_LOAD_ERROR, str(e), values, present
+
+    try:
+        if "arfm" not in data:
+            return STATUS_NO_ARFM, "", values, present
+        arfm_data = data["arfm"]
+        for s, sdram_k in enumerate(SDRAM_KEYS):
+            if sdram_k not in arfm_data:
+                continue
+            sdram_block = arfm_data[sdram_k]
+            for i, sub_k in enumerate(SUB_KEYS):
+                if sub_k in sdram_block:
+                    sub_block = sdram_block[sub_k]
+                    values[s][i] = [str(sub_block.get(field, "N/A")) for field in FIELDS]
+                    present[s][i] = True
+    except Exception as e:
+        return STATUS_PARSE_ERROR, str(e), values, present
+    return STATUS_OK, "", values, present
+
+
+def load_index(directory_path):
+    """
+    Loads the RFM index of a directory.
+
+    Args:
+        directory_path (str): The path to the directory containing JSON files.
+
+    Returns:
+        dict: The columns of the index, or None if there is no valid index.
+    """
+    try:
+        with np.load(os.path.join(directory_path, INDEX_NAME), allow_pickle=False) as index:
+            if int(index["version"]) != INDEX_VERSION:
+                return None
+            return {name: index[name] for name in index.files}
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def update_index(directory_path, json_files, rebuild=False):
+    """
+    Brings the RFM index of a directory up to date with `json_files`, parsing only files that are new or whose size
+    or modification time changed, and writes it back if anything changed. Raw SPD dumps are decoded in one batch.
+
+    Args:
+        directory_path (str): The path to the directory containing JSON files.
+        json_files (list): The names of the SPD files (JSON or raw dumps, see spd.py) in the directory.
+        rebuild (bool): Whether to ignore an existing index and parse all files.
+
+    Returns:
+        dict: The columns of the index, with one row per file of `json_files` in the same order. Field values are
+        dictionary-encoded: `codes` (files x sdram x level x field) indexes into `strings`.
+    """
+    old = None if rebuild else load_index(directory_path)
+    old_rows = {}
+    strings = ["N/A"]
+    if old is not None:
+        old_rows = {name: i for i, name in enumerate(old["names"].tolist())}
+        strings = old["strings"].tolist()
+    string_codes = {string: code for code, string in enumerate(strings)}
+
+    stats = [os.stat(os.path.join(directory_path, filename)) for filename in json_files]
+    sizes = np.array([stat.st_size for stat in stats], dtype=np.int64)
+    mtimes = np.array([stat.st_mtime_ns for stat in stats], dtype=np.int64)
+    status = np.zeros(len(json_files), dtype=np.int8)
+    messages = [""] * len(json_files)
+    codes = np.zeros((len(json_files), len(SDRAM_KEYS), len(SUB_KEYS), len(FIELDS)), dtype=np.uint16)
+    present = np.zeros((len(json_files), len(SDRAM_KEYS), len(SUB_KEYS)), dtype=bool)
+
+    def string_code(string):
+        if string not in string_codes:
+            string_codes[string] = len(strings)
+            strings.append(string)
+        return string_codes[string]
+
+    spd_dumps = []
+    num_parsed = 0
+    for i, filename in enumerate(json_files):
+        j = old_rows.get(filename)
+        if j is not None and old["sizes"][j] == sizes[i] and old["mtimes"][j] == mtimes[i]:
+            status[i], messages[i] = old["status"][j], str(old["messages"][j])
+            codes[i], present[i] = old["codes"][j], old["present"][j]
+            continue
+        num_parsed += 1
+        if filename.endswith(spd.SPD_SUFFIXES):
+            spd_dumps.append(i)
+            continue
+        status[i], messages[i], values, present[i] = parse_spd_file(os.path.join(directory_path, filename))
+        for code_idx, string in np.ndenumerate(np.array(values, dtype=object)):
+            codes[i][code_idx] = string_code(string)
+
+    # Raw SPD dumps are decoded all at once, and their encodings are mapped to codes of the index with lookup tables.
+    if spd_dumps:
+        raw, errors = spd.read_dumps([os.path.join(directory_path, json_files[i]) for i in spd_dumps])
+        fields, supported = spd.decode_arfm(raw)
+        field_strings = [spd.RFM_REQ_STRINGS, spd.RAAIMT_STRINGS, spd.RAAMMT_STRINGS]
+        for f, (encodings, field_string) in enumerate(zip(fields, field_strings)):
+            lookup = np.array([string_code(string) for string in field_string], dtype=np.uint16)
+            # Like in the decoder's JSON output, unsupported levels are missing ("N/A").
+            codes[spd_dumps, ..., f] = np.where(supported, lookup[encodings], string_code("N/A"))
+        present[spd_dumps] = supported
+        for i, error in zip(spd_dumps, errors):
+            if error is not None:
+                status[i], messages[i] = STATUS_LOAD_ERROR, error
+                codes[i], present[i] = 0, False
+
+    index = {
+        "version": np.array(INDEX_VERSION),
+        "names": np.array(json_files, dtype=str),
+        "sizes": sizes,
+        "mtimes": mtimes,
+        "status": status,
+        "messages": np.array(messages, dtype=str),
+        "codes": codes,
+        "present": present,
+        "strings": np.array(strings, dtype=str),
+    }
+    if num_parsed or old is None or len(old["names"]) != len(json_files):
+        # The temporary name keeps the '.npz' suffix, so np.savez() does not append another one.
+        try:
+            with artifacts.atomic_outputs(os.path.join(directory_path, INDEX_NAME)) as (tmp_path,):
+                np.savez(tmp_path, **index)
+        except OSError as e:
+            print(f"Warning: Could not write index '{INDEX_NAME}': {e}")
+    return index
+
+
+def parse_json_files(directory_path, rebuild_index=False):
     """
     Parses JSON files in the given directory, extracts specific 'arfm' data,
     and prints a summary for each file with formatted values and filename,
     sorted by custom criteria. Also prints summary statistics at the end.
 
+    The decoded values are kept in an index in the directory, such that only
+    new or changed files are parsed again.
+
     Args:
         directory_path (str): The path to the directory containing JSON files.
+        rebuild_index (bool): Whether to parse all files again.
     """
     # Check if the provided directory path exists
     if not os.path.isdir(directory_path):
@@ -19,128 +218,50 @@ def parse_json_files(directory_path):
 
     print(f"Parsing JSON files in: {directory_path}\n")
 
+    # Besides the JSON output of the SPD decoder, raw SPD dumps are read directly.
     json_files = []
     for filename in os.listdir(directory_path):
-        if filename.endswith(".json"):
+        if filename.endswith(".json") or filename.endswith(spd.SPD_SUFFIXES):
             json_files.append(filename)
 
-    # Define the custom sorting order for initial letters
-    letter_order = {'M': 0, 'H': 1, 'S': 2, 'U': 3}
-
-    def custom_sort_key(filename):
-        """
-        Custom key for sorting filenames.
-        Prioritizes M, H, S, U, then sorts by numeric part.
-        """
-        base_name = os.path.splitext(filename)[0] # Get filename without extension
-        
-        first_char = base_name[0].upper() if base_name else ''
-        
-        # Assign priority based on the defined letter_order, default to a high number for others
-        priority = letter_order.get(first_char, 999)
-
-        # Extract numeric part from the filename (e.g., "file10" -> 10)
-        # Use regex to find digits at the end or after the first character
-        match = re.search(r'(\d+)$', base_name)
-        numeric_part = int(match.group(1)) if match else 0 # Default to 0 if no number found
-
-        return (priority, numeric_part, base_name) # Include base_name for stable sort of non-numeric parts
-
     # Sort the list of JSON files using the custom key
     json_files.sort(key=custom_sort_key)
 
-    # Initialize counters for statistics
-    files_with_non_rfu_values = 0
-    files_with_rfm_req_one = 0
-    total_parsed_files = 0
+    index = update_index(directory_path, json_files, rebuild_index)
+    status, codes, present = index["status"], index["codes"], index["present"]
+    strings = [str(s) for s in index["strings"].tolist()]
 
-    # Iterate through the sorted files
-    for filename in json_files:
-        filepath = os.path.join(directory_path, filename)
-        
-        # Flags for current file's statistics
-        current_file_has_non_rfu = False
-        current_file_has_rfm_req_one = False
+    # Per-string predicates, looked up for all fields of all files at once.
+    is_rfu = np.array([s.strip().upper() == "RFU" for s in strings], dtype=bool)
+    is_zero = np.array([s.strip() == "0" for s in strings], dtype=bool)
+    is_one = np.array([s.strip() == "1" for s in strings], dtype=bool)
+    raaimt, raammt = codes[..., FIELDS.index("raaimt")], codes[..., FIELDS.index("raammt")]
+    valid_rfm = present & ~is_rfu[raaimt] & ~is_rfu[raammt] & ~is_zero[raammt] & ~is_zero[raaimt]
+    rfm_req_one = present & is_one[codes[..., FIELDS.index("rfm_req")]]
+    parsed = np.isin(status, [STATUS_OK, STATUS_NO_ARFM, STATUS_PARSE_ERROR])
 
-        try:
-            with open(filepath, 'r') as f:
-                data = json.load(f)
-            
-            total_parsed_files += 1
-
-            # Check if the 'arfm' key exists in the JSON data
-            if "arfm" in data:
-                arfm_data = data["arfm"]
-                all_sdram_summary_parts = [] # List to hold formatted strings for sdram_0 and sdram_1
-
-                # Define the structure to iterate through
-                sdram_keys = ["sdram_0", "sdram_1"]
-                sub_keys = ["A", "B", "C"]
-                
-                # Iterate through sdram_0 and sdram_1
-                for sdram_k in sdram_keys:
-                    current_sdram_block_parts = [] # List to hold formatted strings for A, B, C within current sdram
-                    if sdram_k in arfm_data:
-                        sdram_block = arfm_data[sdram_k]
-                        # Iterate through A, B, C
-                        for i, sub_k in enumerate(sub_keys):
-                            if sub_k in sdram_block:
-                                sub_block = sdram_block[sub_k]
-                                
-                                # Get values, defaulting to "N/A" if missing
-                                # Format rfm_req, raaimt, and raammt to be right-aligned with 3 characters
-                                rfm_req_val = str(sub_block.get("rfm_req", "N/A")).rjust(3)
-                                raaimt_val = str(sub_block.get("raaimt", "N/A")).rjust(3)
-                                raammt_val = str(sub_block.get("raammt", "N/A")).rjust(3)
-                                
-                                # Check for statistics
-                                if raaimt_val.strip().upper() != "RFU" and raammt_val.strip().upper() != "RFU" and raammt_val.strip() != "0" and raaimt_val.strip() != "0": 
-                                    current_file_has_non_rfu = True
-                                if rfm_req_val.strip() == "1":
-                                    current_file_has_rfm_req_one = True
-
-                                # Join these three values with commas
-                                current_sdram_block_parts.append(f"{rfm_req_val}, {raaimt_val}, {raammt_val}")
-                            else:
-                                # If sub-block (A, B, or C) is missing, append N/A for all its values
-                                current_sdram_block_parts.append(f"{'N/A'.rjust(3)}, {'N/A'.rjust(3)}, {'N/A'.rjust(3)}")
-
-                            # Add 3 spaces after A and B blocks, but not after C (the last one)
-                            if i < len(sub_keys) - 1:
-                                current_sdram_block_parts.append("   ") # Three spaces
-
-                    else:
-                        # If sdram_0 or sdram_1 block is missing, append N/A for all its sub-blocks
-                        for i, sub_k in enumerate(sub_keys):
-                            current_sdram_block_parts.append(f"{'N/A'.rjust(3)}, {'N/A'.rjust(3)}, {'N/A'.rjust(3)}")
-                            if i < len(sub_keys) - 1:
-                                current_sdram_block_parts.append("   ")
-                    
-                    # Join the parts for the current sdram block (e.g., sdram_0)
-                    all_sdram_summary_parts.append("".join(current_sdram_block_parts))
-
-                # Format the filename to a fixed width (e.g., 12 characters, left-aligned)
-                formatted_filename = f"{filename:<12}" # Adjust 12 as needed for your longest filename
-
-                # Print the summary line for the current file, joining sdram_0 and sdram_1 blocks with three spaces
-                print(f"{formatted_filename} {'   '.join(all_sdram_summary_parts)}")
-            else:
-                print(f"Warning: File '{filename}' does not contain an 'arfm' object.")
-        except json.JSONDecodeError:
+    # Format rfm_req, raaimt, and raammt to be right-aligned with 3 characters
+    formatted = [s.rjust(3) for s in strings]
+    for i, filename in enumerate(json_files):
+        if status[i] == STATUS_OK:
+            # Join the three values of an ARFM level with commas, the levels with three spaces, and sdram_0 and
+            # sdram_1 with three spaces
+            sdram_parts = ["   ".join(", ".join(formatted[c] for c in level) for level in sdram)
+                           for sdram in codes[i].tolist()]
+            # Format the filename to a fixed width (e.g., 12 characters, left-aligned)
+            formatted_filename = f"{filename:<12}" # Adjust 12 as needed for your longest filename
+            print(f"{formatted_filename} {'   '.join(sdram_parts)}")
+        elif status[i] == STATUS_NO_ARFM:
+            print(f"Warning: File '{filename}' does not contain an 'arfm' object.")
+        elif status[i] == STATUS_BAD_JSON:
             print(f"Error: Could not decode JSON from file '{filename}'. Skipping.")
-        except Exception as e:
-            print(f"An unexpected error occurred while processing '{filename}': {e}")
-        
-        # Update global counters based on current file's flags
-        if current_file_has_non_rfu:
-            files_with_non_rfu_values += 1
-        if current_file_has_rfm_req_one:
-            files_with_rfm_req_one += 1
+        else:
+            print(f"An unexpected error occurred while processing '{filename}': {index['messages'][i]}")
 
     print("\n--- Summary Statistics ---")
-    print(f"Total files parsed: {total_parsed_files}")
-    print(f"Files with valid RFM values: {files_with_non_rfu_values}")
-    print(f"Files with RFM Required bit set: {files_with_rfm_req_one}")
+    print(f"Total files parsed: {np.count_nonzero(parsed)}")
+    print(f"Files with valid RFM values: {np.count_nonzero(valid_rfm.any(axis=(1, 2)))}")
+    print(f"Files with RFM Required bit set: {np.count_nonzero(rfm_req_one.any(axis=(1, 2)))}")
 
 
 if __name__ == "__main__":
@@ -149,13 +270,18 @@ if __name__ == "__main__":
         description="Parse JSON files in a directory and summarize 'arfm' data with formatted values and filename."
     )
     parser.add_argument(
-        "directory", 
-        type=str, 
+        "directory",
+        type=str,
         help="The path to the directory containing JSON files."
     )
-    
+    parser.add_argument(
+        "--rebuild-index",
+        action="store_true",
+        help=f"Parse all JSON files again instead of reusing the values stored in '{INDEX_NAME}'."
+    )
+
     # Parse command-line arguments
     args = parser.parse_args()
-    
+
     # Call the main parsing function
-    parse_json_files(args.directory)
+    parse_json_files(args.directory, args.rebuild_index)
@@ -0,0 +1,84 @@
+"""
+Decodes the adaptive refresh management (ARFM) fields of raw DDR5 SPD dumps.
+
+The SPD (JESD400-5) holds, for the first and the second SDRAM type of a module,
+two Refresh Management bytes followed by two bytes per ARFM level (A, B, C).
+The first byte of a level encodes
+    bit 0:    RFM required
+    bits 4:1: RAAIMT, in multiples of 8 ACTs
+    bits 7:5: RAAMMT, as a multiple of RAAIMT
+with the same encoding as the RFM mode registers (JESD79-5, MR58), and bit 7 of
+its second byte whether the level is supported at all. The values of supported
+levels are decoded into the same strings as the `arfm` object of the SPD
+decoder's JSON output, e.g., rfm_req "1", raaimt "80", raammt "6x", or "RFU" for
+reserved encodings; unsupported levels are missing from that object.
+"""
+import numpy as np
+
+SPD_SUFFIXES = (".bin", ".spd")
+
+DEVICE_TYPE_BYTE = 2
+DEVICE_TYPE_DDR5 = 0x12
+
+# Offset of the first byte of ARFM level A, B, C for the first and the second SDRAM. Bytes 30-31 and 38-39 are the
+# plain Refresh Management bytes of the two SDRAMs.
+ARFM_BYTES = np.array([[32, 34, 36], [40, 42, 44]])
+SPD_MIN_SIZE = int(ARFM_BYTES.max()) + 2
+
+# Bit of the second byte of an ARFM level that is set if the level is supported.
+ARFM_SUPPORTED = 0x80
+
+RAAIMT_STEP = 8
+RAAIMT_CODES = range(4, 11)   # 32 to 80, others RFU
+RAAMMT_CODES = range(3, 7)    # 3x to 6x, others RFU
+
+# Strings of every encoding of the fields (index = encoding).
+RFM_REQ_STRINGS = ["0", "1"]
+RAAIMT_STRINGS = [str(code * RAAIMT_STEP) if code in RAAIMT_CODES else "RFU" for code in range(16)]
+RAAMMT_STRINGS = [f"{code}x" if code in RAAMMT_CODES else "RFU" for code in range(8)]
+
+
+def read_dumps(paths):
+    """
+    Memory-maps SPD dumps and collects the bytes up to the ARFM fields of all of them in one array.
+
+    Args:
+        paths (list): The paths to the SPD dumps.
+
+    Returns:
+        tuple: (raw, errors), where `raw` is a uint8 array (dumps x SPD_MIN_SIZE) and `errors` holds an error
+        message for every dump that could not be read or is not a DDR5 SPD (and None for all others).
+    """
+    raw = np.zeros((len(paths), SPD_MIN_SIZE), dtype=np.uint8)
+    errors = [None] * len(paths)
+    for i, path in enumerate(paths):
+        try:
+            dump = np.memmap(path, dtype=np.uint8, mode="r")
+        except (OSError, ValueError) as e:
+            errors[i] = str(e)
+            continue
+        if len(dump) < SPD_MIN_SIZE:
+            errors[i] = f"SPD dump has {len(dump)} bytes, expected at least {SPD_MIN_SIZE}"
+            continue
+        raw[i] = dump[:SPD_MIN_SIZE]
+        if raw[i, DEVICE_TYPE_BYTE] != DEVICE_TYPE_DDR5:
+            errors[i] = f"not a DDR5 SPD (device type 0x{raw[i, DEVICE_TYPE_BYTE]:02x})"
+        del dump
+    return raw, errors
+
+
+def decode_arfm(raw):
+    """
+    Extracts the ARFM fields of all dumps at once.
+
+    Args:
+        raw (np.ndarray): The bytes of the dumps as returned by read_dumps().
+
+    Returns:
+        tuple: (fields, supported), where `fields` holds for rfm_req, raaimt, and raammt an array (dumps x sdram x
+        level) with the encodings of the field, which index into RFM_REQ_STRINGS, RAAIMT_STRINGS, and RAAMMT_STRINGS,
+        respectively, and `supported` (dumps x sdram x level) whether the ARFM level is supported.
+    """
+    arfm = raw[:, ARFM_BYTES]
+    supported = (raw[:, ARFM_BYTES + 1] & ARFM_SUPPORTED) != 0
+    return (arfm & 0x1, (arfm >> 1) & 0xF, arfm >> 5), supported
@@ -1,141 +1,177 @@
 #!/usr/bin/env python3
 import argparse
-import glob
+import contextlib
+import io
+import multiprocessing
+import re
 import statistics
-from collections import defaultdict
+from pathlib import Path
 from statistics import mean, median
+from typing import NamedTuple
 import sys
 import os
 
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from mcsee import activations, ddr4
+
 """
 This script calculates the distance between consecutive ACT commands to the same row in a DDR4 memory trace.
 It assumes decoded trace files (`--data-path <directory>`) as provided in the mcsee-data archive under e2-sledgehammer/decoded/.
+All bank counts (or the one given by `--nbanks`) are processed in one run, writing act2act_distances_per_bank.csv and result.txt.
+If a binary `_cmd.npy` trace exists next to a `_cmd.csv` file (see `--write-binary` of activation_throughput.py), it is used instead.
 """
 
 
+# Number of <bg,bk,row> keys, and the smallest type that holds all of them.
+NUM_KEYS = 1 << sum(ddr4.KEY_WIDTHS)
+KEY_DTYPE = np.min_scalar_type(NUM_KEYS - 1)
+
+
+def read_act_keys(file: str) -> np.ndarray:
+    # Returns the <bg,bk,row> key (see ddr4.pack_bank_row) of every ACT in the trace, in order.
+    trace = ddr4.read_commands(file)
+    acts = trace[trace['cmd'] == ddr4.CMD_ACT]
+    return ddr4.pack_bank_row(acts['bg'], acts['bk'], acts['row'])
+
+
+def key_to_str(key: int) -> str:
+    return '_'.join(str(x) for x in ddr4.unpack_bank_row(key))
+
+
+class RowActs(NamedTuple):
+    # ACTs of a trace grouped by <bg,bk,row> key, rows are ordered by key.
+    keys: np.ndarray        # unique keys
+    first: np.ndarray       # index of the first ACT to each key
+    counts: np.ndarray      # number of ACTs to each key
+    starts: np.ndarray      # start of each key's ACT indices in act_idxs
+    act_idxs: np.ndarray    # ACT indices (0-based, in trace order) grouped by key
+
+    def actidxs(self, i: int) -> np.ndarray:
+        return self.act_idxs[self.starts[i]:self.starts[i] + self.counts[i]]
+
+
+def index_acts(file: str) -> RowActs:
+    # Reads the trace once and groups the ACT indices by row with a counting sort over the dense key space: the ACTs
+    # per key, their cumulative sum as the start of each key's group, and a stable argsort of the 16-bit keys, which
+    # numpy implements as a radix sort that scatters the ACTs into their groups. All steps are linear in the trace
+    # length.
+    act_keys = read_act_keys(file).astype(KEY_DTYPE)
+    all_counts = np.bincount(act_keys, minlength=NUM_KEYS)
+    keys = np.flatnonzero(all_counts)
+    counts = all_counts[keys]
+    starts = np.cumsum(counts) - counts
+    act_idxs = np.argsort(act_keys, kind='stable')
+    return RowActs(keys, act_idxs[starts], counts, starts, act_idxs)
+
+
 def calculate_act2act_distance(act2actidxs):
     # print("#Rows: ", len(act2actidxs.keys()))
-    distances = []
-    for row, vals in act2actidxs.items():
-        if len(vals) < 15:
-            continue
-        for cur, next in zip(vals, vals[1:]):
-            if next-cur < 0:
-                print(cur, next)
-                exit(0)
-            distances.append(next-cur)
-        # calculate the standard deviation
-        std = statistics.stdev(distances)
-        # print(row, f"min={min(distances)}", f"max={max(distances)}", f"median={median(distances)}", f"avg={mean(distances):.3f}", f"std={std}", distances, sep=', ')
+    distances = [np.diff(vals) for vals in act2actidxs.values() if len(vals) >= 15]
+    return np.concatenate(distances).tolist() if distances else []
 
-    return distances
 
-
-def extract_actidxs_per_row(file: str, target_rows: list, nbanks: int):
-    row2actidx = defaultdict(list)
-    act_counter = 0
+def extract_actidxs_per_row(file: str, acts: RowActs, target_rows: np.ndarray):
     print(f"Processing file: {file}")
-    with open(file, "r") as f:
-        for line in f.readlines():
-            parts = line.split(' ')
-            ts = parts[0]
-            cmd = parts[1]
-            if ts != "ERROR:" and cmd == "ACT":
-                act_counter += 1
-                try:
-                    kv_pairs = {kv.split('=')[0]: int(kv.split('=')[1],2) for kv in parts[2:]}
-                except:
-                    print("ERROR in kv_pairs: ", parts)
-                    exit(0)
-                key = '_'.join([str(x) for x in kv_pairs.values()])
-                if key in target_rows:
-                    row2actidx[key].append(act_counter)
+    # Rows in order of their first ACT, ACTs are numbered starting from 1.
+    target_rows = target_rows[np.argsort(acts.first[target_rows], kind='stable')]
+    row2actidx = {key_to_str(int(acts.keys[i])): acts.actidxs(i) + 1 for i in target_rows.tolist()}
 
     # print(row2actidx)
+    return row2actidx
 
-    f_dist = open("act2act_distances_per_bank.txt", "a")
 
+def distances_per_row(row2actidx) -> list[int]:
+    # Returns the distances between consecutive ACTs of all rows, as written to act2act_distances_per_bank.csv.
     resultperrow = dict()
     for row, actidxs in row2actidx.items():
         # calculate difference between two consecutive actidxs
-        result = []
-        for cur, next in zip(actidxs, actidxs[1:]):
-            dist = next-cur
-            # if dist < 17 or dist > 23:
-            result.append(dist)
-        print(row, result)
+        result = np.diff(actidxs)
+        print(row, result.tolist())
         resultperrow[row] = result
         # print(f"Row {row} has {len(actidxs)} accesses. Distances: {result}")
 
-    f_dist.write(str(nbanks) + ", ")
-    f_dist.write(",".join(str(x) for result in resultperrow.values() for x in result))
-    f_dist.write("\n")
-
     sum_other_values = 0
     for row, distances in resultperrow.items():
-        # get the most frequent value in the distances list
-        most_frequent = max(set(distances), key=distances.count)
+        # get the most frequent value in the distances list (the smallest one if there are several)
+        values, counts = np.unique(distances, return_counts=True)
+        most_frequent = int(values[np.argmax(counts)])
         # print("row: ", row, "most frequent distance: ", most_frequent)
         # print how many times a value other than the most frequent value occurs
-        # other_values = [x for x in distances if x != most_frequent]
-        other_values = [x for x in distances if x < 0.9*most_frequent or x > 1.1*most_frequent]
-        print("row=", row, "most_frequent=", most_frequent, "other values=", len(other_values))
-        sum_other_values += len(other_values)
-    print("avg_other_values=", sum_other_values/len(resultperrow))
+        other_values = np.count_nonzero((distances < 0.9*most_frequent) | (distances > 1.1*most_frequent))
+        print("row=", row, "most_frequent=", most_frequent, "other values=", other_values)
+        sum_other_values += other_values
+    if resultperrow:
+        print("avg_other_values=", sum_other_values/len(resultperrow))
+    else:
+        # All rows have the same number of ACTs (or there are none), so no row is above the average
+        print("[-] No row with more ACTs than the average row.")
 
-    f_dist.close()
+    return [x for result in resultperrow.values() for x in result.tolist()]
+
+
+def process_trace(file: str) -> tuple[list[int], list[int], list[int]]:
+    # Returns the hot rows, the distances of all hot rows, and the distances of hot rows with at least 15 ACTs.
+    acts = index_acts(file)
+    target_rows = detect_most_activated_rows(acts)
+    row2actidx = extract_actidxs_per_row(file, acts, target_rows)
+    return acts.keys[target_rows].tolist(), distances_per_row(row2actidx), calculate_act2act_distance(row2actidx)
+
+
+# Runs process_trace() with its output captured, such that the output of parallel workers does not interleave.
+def process_trace_logged(file: str) -> tuple[str, tuple[list[int], list[int], list[int]]]:
+    with contextlib.redirect_stdout(io.StringIO()) as log:
+        result = process_trace(file)
+    return log.getvalue(), result
 
-    exit(0)
-    return row2actidx
 
+def find_traces(data_path: str) -> dict[int, list[str]]:
+    # Walks the data directory once and groups the decoded traces by their number of banks.
+    regex = re.compile(r"nbanks=([0-9]+)-.*_cmd\.csv$")
+    traces = dict()
+    for dirpath, _, filenames in os.walk(data_path):
+        for filename in filenames:
+            match = regex.search(filename)
+            if match:
+                traces.setdefault(int(match.group(1)), []).append(os.path.join(dirpath, filename))
+    return {nbanks: sorted(files) for nbanks, files in sorted(traces.items())}
 
-def detect_most_activated_rows(file: str):
-    bg_bk_row__actcnt = defaultdict(int)
-    with open(file, "r") as f:
-        for line in f.readlines():
-            parts = line.split(' ')
-            ts = parts[0]
-            cmd = parts[1]
-            if ts != "ERROR:" and cmd == "ACT":
-                try:
-                    kv_pairs = {kv.split('=')[0]: int(kv.split('=')[1],2) for kv in parts[2:]}
-                    key = '_'.join([str(x) for x in kv_pairs.values()])
-                    bg_bk_row__actcnt[key] += 1
-                except:
-                    print("ERROR in kv_pairs: ", parts)
-                    exit(0)
-    # sort bg_bk_row__actcnt by value
-    average = sum(bg_bk_row__actcnt.values()) / len(bg_bk_row__actcnt)
-    sorted_bg_bk_row__actcnt = dict(sorted(bg_bk_row__actcnt.items(), key=lambda item: item[1], reverse=True))
-    filtered_bg_bk_row__actcnt = {
-        k: v for k, v in sorted_bg_bk_row__actcnt.items() if v > average
-    }
+
+def detect_most_activated_rows(acts: RowActs) -> np.ndarray:
+    # Returns the rows (indices into acts.keys) with more ACTs than the average row, in descending order of ACTs.
+    # sort bg_bk_row__actcnt by value, rows with the same count in order of their first ACT
+    order = activations.ranked(acts)
+    average = acts.counts.sum() / len(acts.counts) if len(acts.counts) else 0
+    hot = acts.counts[order] > average
 
     print("Row ACT Counts:")
-    for i, (k, count) in enumerate(sorted_bg_bk_row__actcnt.items()):
-        bg, bk, row = k.split('_')
-        print(f"{i+1:4d}\t{count:>5} x ({bg},{bk},{row})   {'→ ✔︎' if k in filtered_bg_bk_row__actcnt else ''}")
+    for i, (key, count, is_hot) in enumerate(zip(acts.keys[order].tolist(), acts.counts[order].tolist(), hot.tolist())):
+        bg, bk, row = ddr4.unpack_bank_row(key)
+        print(f"{i+1:4d}\t{count:>5} x ({bg},{bk},{row})   {'→ ✔︎' if is_hot else ''}")
 
     # print(bg_bk_row__actcnt)
-    print(f"[i] Reduced {len(sorted_bg_bk_row__actcnt)} to {len(filtered_bg_bk_row__actcnt)} rows by average {average}.")
+    print(f"[i] Reduced {len(order)} to {np.count_nonzero(hot)} rows by average {average}.")
 
-    return list(filtered_bg_bk_row__actcnt.keys())
+    return order[hot]
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Process number of banks and path to decoded trace files.")
-    parser.add_argument('--nbanks', type=int, required=False, help='Number of banks (integer)')
+    parser.add_argument('--nbanks', type=int, required=False, help='Number of banks (integer), all from 1 to 16 if not given')
     parser.add_argument('--data-path', type=str, required=True,
                         help='Path to the decoded trace files as found in the mcsee-data archive under e2-sledgehammer/decoded/')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                        help='Number of traces processed in parallel (default: number of CPUs)')
 
     args = parser.parse_args()
 
     DATA_PATH = args.data_path
 
-    # Check if DATA_PATH contains any CSV files
-    csv_files = glob.glob(os.path.join(DATA_PATH, '**', '*.csv'), recursive=True)
-    if not csv_files:
-        print(f"ERROR: No CSV files found in directory '{DATA_PATH}'. Please provide a valid path containing decoded trace CSV files.")
+    # Check if DATA_PATH contains any decoded traces
+    traces = find_traces(DATA_PATH)
+    if not traces:
+        print(f"ERROR: No _cmd.csv files found in directory '{DATA_PATH}'. Please provide a valid path containing decoded trace CSV files.")
         sys.exit(1)
 
     banks = []
@@ -146,19 +182,40 @@ if __name__ == '__main__':
 
     print(f"Number of banks: {args.nbanks}")
 
-    outfile = open("result.txt", "w")
+    for bk in banks:
+        if bk not in traces:
+            print(f"WARNING: No decoded traces for nbanks={bk} found in '{DATA_PATH}', skipping.")
+    work = [(bk, file) for bk in banks for file in traces.get(bk, [])]
+    results = []
+    if len(work) > 1 and args.jobs > 1:
+        # The output of each trace is printed in order of the work items, independent of the order the workers finish.
+        with multiprocessing.Pool(min(args.jobs, len(work))) as pool:
+            for log, result in pool.imap(process_trace_logged, (file for _, file in work)):
+                print(log, end="")
+                results.append(result)
+    else:
+        results = [process_trace(file) for _, file in work]
 
+    # Results are written in order of the number of banks and trace, independent of the order the workers finish.
+    outfile = open("result.txt", "w")
+    f_dist = open("act2act_distances_per_bank.csv", "w")
 
     for bk in banks:
         all_results = []
         all_target_rows = set()
-        for file in glob.glob(f"{DATA_PATH}/**/*nbanks={bk}-*_cmd.csv", recursive=True):
-            target_rows = detect_most_activated_rows(file)
-            all_target_rows = all_target_rows.union(target_rows)
-            row2actidx = extract_actidxs_per_row(file, target_rows, bk)
-            distances = calculate_act2act_distance(row2actidx)
+        for (nbanks, _), (target_rows, row_distances, distances) in zip(work, results):
+            if nbanks != bk:
+                continue
+            all_target_rows.update(target_rows)
+            f_dist.write(str(nbanks) + ", ")
+            f_dist.write(",".join(str(x) for x in row_distances))
+            f_dist.write("\n")
             all_results += distances
 
+        if not all_results:
+            if bk in traces:
+                print(f"WARNING: No row with at least 15 ACTs for nbanks={bk}, skipping.")
+            continue
         _min = min(all_results)
         _max = max(all_results)
         _median = median(all_results)
@@ -167,4 +224,5 @@ if __name__ == '__main__':
         outfile.write(f"nbanks={bk}, min={_min}, max={_max}, median={_median}, avg={_avg:.3f}, std={statistics.stdev(all_results):.3f}, nrows={len(all_target_rows)}, N={len(all_results)} \n")
         outfile.flush()
 
+    f_dist.close()
     outfile.close()
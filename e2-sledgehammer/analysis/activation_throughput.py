@@ -4,13 +4,51 @@ import os
 import re
 import sys
 import csv
-import pickle
+import argparse
+import multiprocessing
 import matplotlib.pyplot as plt
 import numpy as np
 from collections import defaultdict
+from pathlib import Path
+from typing import Optional
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from mcsee import artifacts, ddr4, series
 
-def parse_commands(filename: str, new_filename: str):
+
+def parse_commands(filename: str, new_filename: str, reference: bool = False, write_binary: bool = False):
+    if reference:
+        return parse_commands_reference(filename, new_filename)
+
+    return decode_samples(ddr4.read_samples(filename), new_filename, write_binary)
+
+def deglitch_and_parse_commands(filename: str, new_filename: str, dupfree_filename: Optional[str] = None, threshold: int = 4,
+                                write_binary: bool = False):
+    # Fused remove_duplicates() + parse_commands(), the deglitched samples are only written to a file if requested
+    if dupfree_filename is None:
+        samples = ddr4.deglitch_samples(filename, threshold, candidate_offset=1)
+    else:
+        with open(dupfree_filename, 'w') as dupfree_file:
+            samples = ddr4.deglitch_samples(filename, threshold, candidate_offset=1, dupfree_file=dupfree_file)
+    return decode_samples(samples, new_filename, write_binary)
+
+def decode_samples(samples: ddr4.Samples, new_filename: str, write_binary: bool = False):
+    commands, _, _ = ddr4.decode_to_file(samples, new_filename, write_binary)
+
+    # Count the ACTs between each two consecutive REFs, starting at the first REF.
+    is_act = commands.cmd == ddr4.CMD_ACT
+    acts_before_ref = np.cumsum(is_act)[commands.cmd == ddr4.CMD_REF]
+    acts_per_trefi = np.diff(acts_before_ref).tolist()
+    t_act2act = np.diff(commands.time[is_act]).tolist()
+
+    print_statistics(acts_per_trefi, t_act2act)
+    return acts_per_trefi, t_act2act
+
+def print_statistics(acts_per_trefi: list, t_act2act: list):
+    print(f"ACTs/tREFI statistics [min/max/avg/median]: {min(acts_per_trefi)}/{max(acts_per_trefi)}/{np.mean(acts_per_trefi):.3f}/{np.median(acts_per_trefi)}")
+    print(f"ACT2ACT statistics [min/max/avg/median] in ns: {min(t_act2act)*1e09}/{max(t_act2act)*1e09}/{np.mean(t_act2act)*1e09}/{np.median(t_act2act)*1e09}")
+
+def parse_commands_reference(filename: str, new_filename: str):
     outfile = open(new_filename, 'w')
     earliest_act_per_bank = defaultdict(str)
     acts_per_trefi = list()
@@ -181,58 +219,116 @@ def plot_histogram(tras_durations: list, filename: str):
     plt.savefig(filename, dpi=600)
 
 def remove_duplicates(filename: str, new_filename: str, threshold: int = 4):
-    # remove lines that are all zero except for timestamp and CS
-    outfile = open(new_filename, 'w')
-    with open(filename, newline='\n') as f:
-        reader = csv.DictReader(f, delimiter=',', )
-        outfile.write(','.join(reader.fieldnames) + '\n')
-        candidate = None
-        row_last = None
-        counter = 0
-        for row in reader:
-            row_current = {k: v for k, v in row.items() if k != 'Time' and k != 'clk'}
-            if row_last == row_current:
-                counter += 1
-                if counter == 1:
-                    candidate = row
-            else:
-                if counter >= threshold and candidate is not None:
-                    outfile.write(','.join(candidate.values()) + '\n')
-                    candidate = None
-                counter = 0
-            row_last = row_current 
-    outfile.close() 
+    # Keep the second sample of every run of more than `threshold` identical samples (ignoring timestamp and clk)
+    with open(new_filename, 'w') as outfile:
+        outfile.write(','.join(ddr4.read_header(filename)) + '\n')
+        for lines in ddr4.deglitch(filename, threshold, candidate_offset=1):
+            outfile.writelines(lines)
 
 def replace_file_ending(filename: str, new_ending: str):
     return '.'.join(filename.split('.')[:-1]) + new_ending
 
-if __name__ == "__main__":
-    filename = sys.argv[1]
-    
+def process_capture(filename: str, reference_decoder: bool = False, write_dupfree: bool = False,
+                    write_binary: bool = False, threshold: int = 4) -> Optional[tuple[list, list]]:
+    # Returns (acts_per_trefi, t_act2act) if the capture was decoded, or None if its results are up to date
     # Replace file ending of filename by _dupfree.csv
     # file_dupfree = filename.replace(".txt", "_dupfree.csv")
     #file_dupfree = filename.split('.')[:-1].append('_dupfree.csv')
     file_dupfree = replace_file_ending(filename, '_dupfree.csv')
-    print(f"[>] Processing {filename}")
-    if not os.path.isfile(file_dupfree):
-        print(f"[>] Removing duplicates from {filename} and saving to {file_dupfree}")
-        remove_duplicates(filename, file_dupfree)
-
     file_cmd = replace_file_ending(filename, '_cmd.csv')
     # file_cmd = filename.replace(".txt", "_cmd.csv")
-    file_actrate = replace_file_ending(filename, '_actspertrefi.pkl')
+    file_actrate = replace_file_ending(filename, '_actspertrefi.series')
     # file_actrate = filename.replace(".txt", "_tras.pkl")
-    if not os.path.isfile(file_cmd) or not os.path.isfile(file_actrate):
-        print(f"[>] Parsing commands from {file_dupfree} and saving to {file_cmd}")
-        acts_per_trefi, t_act2act = parse_commands(file_dupfree, file_cmd)
-        with open(file_actrate, 'wb') as f:
-            pickle.dump(acts_per_trefi, f)
+    print(f"[>] Processing {filename}")
+
+    # Derived files are only reused if the manifest confirms they were built from the same input, parameters and code
+    manifest = artifacts.Manifest(replace_file_ending(filename, '_manifest.json'), [__file__] + artifacts.package_files())
+
+    if reference_decoder:
+        # The reference decoder only reads from the _dupfree.csv file
+        key = manifest.stage_key("dupfree", [filename], {"threshold": threshold}, [file_dupfree])
+        if not manifest.is_fresh("dupfree", key):
+            print(f"[>] Removing duplicates from {filename} and saving to {file_dupfree}")
+            with artifacts.atomic_outputs(file_dupfree) as (tmp_dupfree,):
+                remove_duplicates(filename, tmp_dupfree, threshold)
+            manifest.record("dupfree", key, [file_dupfree])
+        inputs, params, outputs = [file_dupfree], {"decoder": "reference"}, [file_cmd, file_actrate]
+    else:
+        inputs, params = [filename], {"decoder": "vectorized", "threshold": threshold}
+        outputs = [file_cmd, file_actrate] + ([file_dupfree] if write_dupfree else []) \
+            + ([ddr4.binary_path(file_cmd)] if write_binary else [])
+
+    key = manifest.stage_key("decode", inputs, params, outputs)
+    if manifest.is_fresh("decode", key):
+        print(f"[>] {file_actrate} is up to date, skipping {filename}")
+        return None
+
+    # Also if --write-binary is given with the reference decoder, which only writes the _cmd.csv file
+    ddr4.remove_stale_binary(file_cmd, outputs)
+    with artifacts.atomic_outputs(*outputs) as tmp_outputs:
+        tmp = dict(zip(outputs, tmp_outputs))
+        if reference_decoder:
+            print(f"[>] Parsing commands from {file_dupfree} and saving to {file_cmd}")
+            acts_per_trefi, t_act2act = parse_commands(file_dupfree, tmp[file_cmd], reference=True)
+        else:
+            print(f"[>] Removing duplicates from {filename} and parsing commands to {file_cmd}")
+            acts_per_trefi, t_act2act = deglitch_and_parse_commands(
+                filename, tmp[file_cmd], tmp.get(file_dupfree), threshold, write_binary=write_binary)
+        series.save_series(tmp[file_actrate], acts_per_trefi, np.int64, **capture_metadata(filename))
+    manifest.record("decode", key, outputs)
+    return acts_per_trefi, t_act2act
+
+def capture_metadata(filename: str) -> dict:
+    # Stored in the header of the _actspertrefi.series file
+    match = re.search(r"sledgehammer-nbanks=([0-9]+)--([0-9]+)", os.path.basename(filename))
+    if not match:
+        return {"capture": os.path.basename(filename)}
+    return {"capture": os.path.basename(filename), "nbanks": int(match.group(1)), "run": int(match.group(2))}
+
+def find_captures(path: str) -> list[str]:
+    # All raw captures below `path`, ordered by number of banks and run for deterministic result files
+    regex = re.compile(r"sledgehammer-nbanks=([0-9]+)--([0-9]+)\.csv$")
+    captures = [str(p) for p in Path(path).rglob("sledgehammer-nbanks=*.csv") if regex.search(p.name)]
+    return sorted(captures, key=lambda c: (*map(int, regex.search(c).groups()), c))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze the activation throughput of Sledgehammer captures.")
+    parser.add_argument('path', type=str,
+                        help='Path to a decoded capture, e.g., sledgehammer-nbanks=1--00000.csv, or to a directory '
+                             'whose captures are all processed')
+    parser.add_argument('--reference-decoder', action='store_true',
+                        help='Use the (slow) row-by-row command decoder instead of the vectorized one')
+    parser.add_argument('--write-dupfree', action='store_true',
+                        help='Also write the deglitched samples to a _dupfree.csv file when removing duplicates')
+    parser.add_argument('--write-binary', action='store_true',
+                        help='Also write the decoded commands to a binary _cmd.npy file (not supported by the reference decoder)')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                        help='Number of captures processed in parallel if a directory is given (default: number of CPUs)')
+    parser.add_argument('--threshold', type=int, default=4,
+                        help='Minimum number of identical samples for a sample to be kept when removing duplicates')
+    args = parser.parse_args()
+
+    if os.path.isdir(args.path):
+        filenames = find_captures(args.path)
+        print(f"[>] Found {len(filenames)} captures in {args.path}")
+    else:
+        filenames = [args.path]
+
+    work = [(filename, args.reference_decoder, args.write_dupfree, args.write_binary, args.threshold)
+            for filename in filenames]
+    if len(work) > 1 and args.jobs > 1:
+        with multiprocessing.Pool(min(args.jobs, len(work))) as pool:
+            results = pool.starmap(process_capture, work)
+    else:
+        results = [process_capture(*w) for w in work]
+
+    # The result files are written by this process only, in the order of the captures (not of completion)
+    for filename, result in zip(filenames, results):
+        if result is None:
+            continue
+        acts_per_trefi, t_act2act = result
         write_resultfile(filename, acts_per_trefi, "acts-per-trefi")
         write_resultfile(filename, t_act2act, "act2act")
-    else:
-        print(f"[>] Loading acts_per_trefi from {file_actrate}")
-        with open(file_actrate, 'rb') as f:
-            acts_per_trefi = pickle.load(f)
 
 
     # file_actrate = filename.replace(".txt", "_plot.png")
@@ -4,8 +4,12 @@ import matplotlib.pyplot as plt
 import numpy as np
 import glob
 import os
-import pickle
 import sys
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+from mcsee import series
 
 # Unified LaTeX-style plot settings
 plt.rcParams.update({
@@ -35,15 +39,15 @@ nbanks = list(range(1, 17))
 all_data_median = []
 all_data_median_per_bank = []
 
-# Generate mock data
+# Group the memory-mapped series by the number of banks stored in their header
+series_per_bank = defaultdict(list)
+for file in sorted(glob.glob("../../data/series/sledgehammer-nbanks=*--0000?_actspertrefi.series")):
+   print(f"Processing file: {file}")
+   values, metadata = series.load_series(file)
+   series_per_bank[metadata["nbanks"]].append(values)
+
 for num_banks in nbanks:
-   cur_bank = []
-   for file in glob.glob(f"../../data/pickled/sledgehammer-nbanks={num_banks}--0000?_actspertrefi.pkl"):
-      print(f"Processing file: {file}")
-      with open(file, 'rb') as f:
-         vals = pickle.load(f)
-         for x in vals:
-            cur_bank.append(int(x))
+   cur_bank = np.concatenate(series_per_bank[num_banks]) if series_per_bank[num_banks] else np.empty(0)
    all_data_median.append(np.mean(cur_bank))
    all_data_median_per_bank.append(np.mean(cur_bank)//num_banks)
 
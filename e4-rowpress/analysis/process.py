@@ -4,14 +4,18 @@ import os
 import re
 import sys
 import csv
-import pickle
 import argparse
+import multiprocessing
 import tqdm
 
 import matplotlib.pyplot as plt
 import numpy as np
 
 from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from mcsee import artifacts, ddr4, series
 
 
 pressed_bg = "bg=01"
@@ -27,32 +31,58 @@ def debug_print(msg, debug):
         print(msg)
 
 def remove_dups(filename: str, new_filename: str, threshold: int = 4, debug=False):
-    # Only read file once, store lines in memory for tqdm
-    with open(filename, newline='\n') as f:
-        lines = f.readlines()
-    total_lines = len(lines)
-    reader = csv.DictReader(lines, delimiter=',')
-    outfile = open(new_filename, 'w')
-    debug_print(f"reader.fieldnames {reader.fieldnames}", debug)
-    outfile.write(','.join(reader.fieldnames) + '\n')
-    counter = 0
-    candidate = None
-    row_last = None
-    for row in tqdm.tqdm(reader, total=total_lines-1, desc=f"remove_dups: {os.path.basename(filename)}"):
-        row_current = {k: v for k, v in row.items() if k != 'Time' and k != 'clk'}
-        if all(v == '0' for v in row_current.values()):
-            continue
-        if row_last == row_current:
-            counter += 1
+    # Stream the file in chunks, the progress bar counts the bytes read
+    header = ddr4.read_header(filename)
+    debug_print(f"reader.fieldnames {header}", debug)
+    with open(new_filename, 'w') as outfile, \
+            tqdm.tqdm(total=os.path.getsize(filename), unit='B', unit_scale=True,
+                      desc=f"remove_dups: {os.path.basename(filename)}") as progress:
+        outfile.write(','.join(header) + '\n')
+        for lines in ddr4.deglitch(filename, threshold, skip_idle=True, on_chunk=progress.update):
+            outfile.writelines(lines)
+
+def parse_commands(filename: str, new_filename: str, debug=False, reference=False, write_binary=False):
+    if reference:
+        return parse_commands_reference(filename, new_filename, debug=debug)
+
+    debug_print("[DEBUG] Entering parse_commands", debug)
+    debug_print(f"[DEBUG] Input filename: {filename}", debug)
+    debug_print(f"[DEBUG] Output filename: {new_filename}", debug)
+    return decode_samples(ddr4.read_samples(filename), new_filename, debug=debug, write_binary=write_binary)
+
+def deglitch_and_parse_commands(filename: str, new_filename: str, dupfree_filename=None, threshold: int = 4, debug=False,
+                                write_binary=False):
+    # Fused remove_dups() + parse_commands(), the deglitched samples are only written to a file if requested
+    debug_print(f"[DEBUG] Deglitching {filename} in memory", debug)
+    with tqdm.tqdm(total=os.path.getsize(filename), unit='B', unit_scale=True,
+                   desc=f"remove_dups: {os.path.basename(filename)}") as progress:
+        if dupfree_filename is None:
+            samples = ddr4.deglitch_samples(filename, threshold, skip_idle=True, on_chunk=progress.update)
         else:
-            if counter >= threshold and candidate is not None:
-                outfile.write(','.join(candidate.values()) + '\n')
-            candidate = row
-            counter = 0
-        row_last = row_current
-    outfile.close()
+            with open(dupfree_filename, 'w') as dupfree_file:
+                samples = ddr4.deglitch_samples(filename, threshold, skip_idle=True, dupfree_file=dupfree_file,
+                                                on_chunk=progress.update)
+    return decode_samples(samples, new_filename, debug=debug, write_binary=write_binary)
+
+def decode_samples(samples: ddr4.Samples, new_filename: str, debug=False, write_binary=False):
+    # The row-by-row decoder always skipped the second sample of the file.
+    keep = np.arange(len(samples.time)) != 1
+    samples = ddr4.Samples(samples.fieldnames, samples.time[keep], samples.pins[keep])
+    if write_binary:
+        debug_print(f"[DEBUG] Writing binary trace to {ddr4.binary_path(new_filename)}", debug)
+    commands, tras_ns, open_row = ddr4.decode_to_file(samples, new_filename, write_binary)
+    debug_print(f"[DEBUG] Decoded {len(commands.cmd)} commands from {len(samples.time)} samples", debug)
+
+    pressed = (tras_ns > 0) \
+        & (commands.bg == int(pressed_bg.split('=')[1], 2)) \
+        & (commands.bk == int(pressed_bk.split('=')[1], 2)) \
+        & np.isin(open_row, [int(ra.split('=')[1], 2) for ra in pressed_row])
+    tras_durations = tras_ns[pressed].tolist()
+    debug_print(f"[DEBUG] Exiting parse_commands. tRAS durations collected: {len(tras_durations)}", debug)
+    return tras_durations
 
-def parse_commands(filename: str, new_filename: str, debug=False):
+def parse_commands_reference(filename: str, new_filename: str, debug=False):
+    # Row-by-row decoder, kept to check the output of the vectorized decoder.
     debug_print("[DEBUG] Entering parse_commands", debug)
     debug_print(f"[DEBUG] Input filename: {filename}", debug)
     debug_print(f"[DEBUG] Output filename: {new_filename}", debug)
@@ -167,8 +197,8 @@ def write_resultfile(filename: str, tras_durations: list):
         regex = re.compile(r"no_aggr_acts=2-no_reads=([0-9]+)-.*")
         match = regex.search(os.path.basename(filename))
         num_reads = int(match.group(1)) if match else 0
-        minv = min(tras_durations)
-        maxv = max(tras_durations)
+        minv = np.min(tras_durations)
+        maxv = np.max(tras_durations)
         mean = np.mean(tras_durations)
         median = np.median(tras_durations)
         std = np.std(tras_durations)
@@ -241,11 +271,75 @@ def plot_histogram(tras_durations: list, filename: str):
 #             row_last = row_current 
 #     outfile.close() 
 
+def process_capture(filename: str, reference_decoder=False, write_dupfree=False, write_binary=False, debug=False,
+                    threshold: int = 4):
+    print(f"[>] Processing {filename}")
+    file_dupfree = filename.replace(".csv", "_dupfree.csv")
+    file_cmd = filename.replace(".csv", "_cmd.csv")
+    file_tras = filename.replace(".csv", "_tras.series")
+
+    # Derived files are only reused if the manifest confirms they were built from the same input, parameters and code
+    manifest = artifacts.Manifest(filename.replace(".csv", "_manifest.json"), [__file__] + artifacts.package_files())
+
+    if reference_decoder:
+        # The reference decoder only reads from the _dupfree.csv file
+        key = manifest.stage_key("dupfree", [filename], {"threshold": threshold}, [file_dupfree])
+        if not manifest.is_fresh("dupfree", key):
+            with artifacts.atomic_outputs(file_dupfree) as (tmp_dupfree,):
+                remove_dups(filename, tmp_dupfree, threshold, debug=debug)
+            manifest.record("dupfree", key, [file_dupfree])
+        inputs, params, outputs = [file_dupfree], {"decoder": "reference"}, [file_cmd, file_tras]
+    else:
+        inputs, params = [filename], {"decoder": "vectorized", "threshold": threshold}
+        outputs = [file_cmd, file_tras] + ([file_dupfree] if write_dupfree else []) \
+            + ([ddr4.binary_path(file_cmd)] if write_binary else [])
+
+    key = manifest.stage_key("decode", inputs, params, outputs)
+    if manifest.is_fresh("decode", key):
+        print(f"[>] {file_tras} is up to date, loading tRAS durations")
+        tras_durations, _ = series.load_series(file_tras)
+        return tras_durations
+
+    # Also if --write-binary is given with the reference decoder, which only writes the _cmd.csv file
+    ddr4.remove_stale_binary(file_cmd, outputs)
+    with artifacts.atomic_outputs(*outputs) as tmp_outputs:
+        tmp = dict(zip(outputs, tmp_outputs))
+        if reference_decoder:
+            print(f"[>] Parsing commands from {file_dupfree}")
+            tras_durations = parse_commands(file_dupfree, tmp[file_cmd], debug=debug, reference=True)
+        else:
+            print(f"[>] Removing duplicates and parsing commands from {filename}")
+            tras_durations = deglitch_and_parse_commands(
+                filename, tmp[file_cmd], tmp.get(file_dupfree), threshold, debug=debug,
+                write_binary=write_binary)
+        series.save_series(tmp[file_tras], tras_durations, np.float64, **capture_metadata(filename))
+    manifest.record("decode", key, outputs)
+    return tras_durations
+
+def capture_metadata(filename: str) -> dict:
+    # Stored in the header of the _tras.series file
+    match = re.search(r"no_reads=([0-9]+)-.*--([0-9]+)", os.path.basename(filename))
+    if not match:
+        return {"capture": os.path.basename(filename)}
+    return {"capture": os.path.basename(filename), "num_reads": int(match.group(1)), "run": int(match.group(2))}
+
+def find_captures(data_path: str):
+    # All raw captures in data_path, ordered by number of column reads for deterministic result files
+    regex = re.compile(r"no_aggr_acts=2-no_reads=([0-9]+)-victimrow=[0-9]+--[0-9]+\.csv$")
+    captures = [fname for fname in os.listdir(data_path) if regex.match(fname)]
+    return sorted(captures, key=lambda fname: (int(regex.match(fname).group(1)), fname))
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Process DRAM experiment CSV files.")
     parser.add_argument('--data-path', type=str, required=True, help='Path to directory containing experiment CSV files, e.g., e4-rowpress/decoded/ of the mcsee-data archive')
     parser.add_argument('--debug', action='store_true', help='Enable debug output')
     parser.add_argument('--plot', action='store_true', help='Enable plotting of tRAS histograms')
+    parser.add_argument('--reference-decoder', action='store_true', help='Use the (slow) row-by-row command decoder instead of the vectorized one')
+    parser.add_argument('--write-dupfree', action='store_true', help='Also write the deglitched samples to a _dupfree.csv file')
+    parser.add_argument('--write-binary', action='store_true', help='Also write the decoded commands to a binary _cmd.npy file (not supported by the reference decoder)')
+    parser.add_argument('--all-captures', action='store_true', help='Process every no_reads= capture in the data path instead of the ten captures of the paper')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='Number of captures processed in parallel (default: number of CPUs)')
+    parser.add_argument('--threshold', type=int, default=4, help='Minimum number of identical samples for a sample to be kept when removing duplicates')
     args = parser.parse_args()
 
     filenames = [
@@ -260,6 +354,9 @@ if __name__ == "__main__":
         "no_aggr_acts=2-no_reads=80-victimrow=64--00000.csv",
         "no_aggr_acts=2-no_reads=128-victimrow=64--00000.csv"
     ]
+    if args.all_captures:
+        filenames = find_captures(args.data_path)
+        print(f"[>] Found {len(filenames)} captures in {args.data_path}")
 
     missing_files = []
     for fname in filenames:
@@ -273,19 +370,17 @@ if __name__ == "__main__":
             print(f"  {mf}")
         sys.exit(1)
 
-    for fname in filenames:
-        filename = os.path.join(args.data_path, fname)
-        print(f"[>] Processing {filename}")
-        file_dupfree = filename.replace(".csv", "_dupfree.csv")
-        remove_dups(filename, file_dupfree, debug=args.debug)
-
-        print(f"[>] Parsing commands from {file_dupfree}")
-        file_cmd = filename.replace(".csv", "_cmd.csv")
-        file_tras = filename.replace(".csv", "_tras.pkl")
-        tras_durations = parse_commands(file_dupfree, file_cmd, debug=args.debug)
-        with open(file_tras, 'wb') as f:
-            pickle.dump(tras_durations, f)
+    work = [(os.path.join(args.data_path, fname), args.reference_decoder, args.write_dupfree, args.write_binary, args.debug,
+             args.threshold) for fname in filenames]
+    if len(work) > 1 and args.jobs > 1:
+        with multiprocessing.Pool(min(args.jobs, len(work))) as pool:
+            results = pool.starmap(process_capture, work)
+    else:
+        results = [process_capture(*w) for w in work]
 
+    # The result file and plots are written by this process only, in the order of the captures (not of completion)
+    for fname, tras_durations in zip(filenames, results):
+        filename = os.path.join(args.data_path, fname)
         write_resultfile(filename, tras_durations)
 
         if args.plot:
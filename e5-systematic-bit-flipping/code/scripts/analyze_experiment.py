@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 import argparse
-from collections import Counter
 import csv
+import json
 from dataclasses import dataclass
 import multiprocessing
 import os
@@ -9,12 +9,19 @@ from pathlib import Path
 import sys
 from typing import Optional
 
+import numpy as np
 
-BG_BITS = 3
-BK_BITS = 2
-ROW_BITS = 16
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+from mcsee import activations, artifacts, ddr5
+
+
+BG_BITS, BK_BITS, ROW_BITS = ddr5.KEY_WIDTHS
 SUBCHANNEL_LSB = 6
 
+# Per-experiment cache of the ACT counts of every iteration (see read_act_cache()).
+ACT_CACHE_NAME = "act_histograms.json"
+ACT_CACHE_TOP_K = 16
+
 
 legacy_data_fmt = False
 
@@ -34,7 +41,7 @@ class ExpIteration:
     phys: int
     dram: int
     principal_dram: int
-    most_activated: int  # address bits encoded with concat_bg_bk_row()
+    most_activated: int  # address bits encoded with ddr5.pack_bank_row()
 
     def bits_flipped(self) -> list[int]:
         return bits_set(self.dram ^ self.principal_dram)
@@ -65,67 +72,107 @@ def addr_bits_to_str(addr_bits: tuple) -> str:
     return f"bg={addr_bits[0]:03b} bk={addr_bits[1]:02b} row={addr_bits[2]:016b}"
 
 
-# Returns a list of all ACT commands. An ACT command is formatted as the concatenated bits of <bg, bk, row>.
-def get_acts_from_trace(trace_file: Path) -> list[int]:
-    with trace_file.open("r") as f:
-        reader = csv.DictReader(f)
+# Returns all ACT commands. An ACT command is formatted as the concatenated bits of <bg, bk, row>.
+def get_acts_from_trace(trace_file: Path) -> np.ndarray:
+    trace = ddr5.read_trace(trace_file, use_cache=True)
+    is_act = trace.is_cmd("act")
+    return ddr5.pack_bank_row(trace.bg[is_act], trace.bk[is_act], trace.row[is_act])
+
+
+# Positions of the ACT histograms of an iteration are (rank of the trace file, index of the ACT in the file), packed
+# into one integer, such that the partial histograms of its trace files can be merged in any order.
+FILE_RANK_SHIFT = 40
+
+
+def get_act_histogram(trace_file: Path, file_rank: int) -> activations.Histogram:
+    histogram = activations.histogram(get_acts_from_trace(trace_file))
+    return histogram._replace(first=(file_rank << FILE_RANK_SHIFT) | histogram.first)
+
+
+def get_act_histogram_task(task: tuple[int, Path, int]) -> tuple[int, activations.Histogram]:
+    iter_idx, trace_file, file_rank = task
+    return iter_idx, get_act_histogram(trace_file, file_rank)
+
+
+# The ACT cache of an experiment directory stores, for every iteration, the addresses of its 'exp_cfg.csv' and the
+# ACT_CACHE_TOP_K most activated addresses with their number of ACTs. An entry is reused as long as the stamp of the
+# iteration (names, sizes, and modification times of 'exp_cfg.csv' and the trace files) does not change, such that
+# later runs (e.g., with a different --margin) do not read any trace file. Like the manifests of E2 and E4, the cache
+# is keyed on the code of this script and of the mcsee package, so it is dropped whenever that code changes. The cache
+# only holds the iterations found by the last run.
+def act_cache_code_version() -> str:
+    return artifacts.code_version([__file__] + artifacts.package_files())
+
+
+def act_cache_path(exp_dir: Path) -> Path:
+    return exp_dir / "data" / ACT_CACHE_NAME
+
+
+def read_act_cache(exp_dir: Path) -> dict:
+    try:
+        with act_cache_path(exp_dir).open() as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get("code") != act_cache_code_version() or cache.get("legacy_data_fmt") != legacy_data_fmt:
+        return {}
+    return cache["iterations"]
 
-        acts = []
-        for line in reader:
-            if line["cmd"] != "act":
-                continue
-            bg = int(line["bg"], 2)
-            bk = int(line["bk"], 2)
-            row = int(line["row"], 2)
-            bits = concat_bg_bk_row(bg, bk, row)
-            acts.append(bits)
-            assert split_bg_bk_row(bits) == (bg, bk, row), "Check that concat-split is a NOP."
-    return acts
 
+def write_act_cache(exp_dir: Path, entries: dict):
+    cache = {"code": act_cache_code_version(), "legacy_data_fmt": legacy_data_fmt, "iterations": entries}
+    with artifacts.atomic_outputs(str(act_cache_path(exp_dir))) as (tmp,):
+        with open(tmp, "w") as f:
+            json.dump(cache, f, separators=(",", ":"))
 
-def concat_bg_bk_row(bg: int, bk: int, row: int) -> int:
-    return (((bg << BK_BITS) | bk) << ROW_BITS) | row
 
+def iteration_stamp(exp_dir: Path, iter_name: str, trace_files: list[Path]) -> list:
+    files = [exp_dir / iter_name / "exp_cfg.csv"] + trace_files
+    return sorted([str(f.relative_to(exp_dir)), f.stat().st_size, f.stat().st_mtime_ns] for f in files)
 
-def split_bg_bk_row(bits: int) -> tuple[int, int, int]:
-    bg = (bits >> (BK_BITS + ROW_BITS)) & ((1 << BG_BITS) - 1)
-    bk = (bits >> (ROW_BITS)) & ((1 << BK_BITS) - 1)
-    row = bits & ((1 << ROW_BITS) - 1)
-    return bg, bk, row
 
+def act_cache_entry(stamp: list, exp_cfg: tuple, histogram: activations.Histogram) -> dict:
+    # The most activated addresses first, ties broken by the first ACT.
+    top = activations.ranked(histogram)[:ACT_CACHE_TOP_K]
+    return {"stamp": stamp, "exp_cfg": list(exp_cfg), "num_acts": histogram.num_acts,
+            "keys": histogram.keys[top].tolist(), "counts": histogram.counts[top].tolist()}
 
-def get_addr_data_for_iter(exp_dir: Path, iter_name: str, min_margin: int) -> Optional[ExpIteration]:
-    # STEP 1: Parse exp_csv.csv.
-    virt, phys, dram, principal_dram = read_exp_cfg(exp_dir, iter_name)
 
-    print(f"[{iter_name}] Loaded 'exp_cfg.csv'. Bit flips at bits", *bits_set(dram ^ principal_dram))
+def histogram_from_cache(entry: dict) -> activations.Histogram:
+    # Only holds the top addresses, in order, which is all activations.most_activated_two() needs.
+    keys = np.array(entry["keys"], dtype=np.int64)
+    return activations.Histogram(keys, np.array(entry["counts"], dtype=np.int64), np.arange(len(keys)), entry["num_acts"])
 
-    # STEP 2: Parse trace files.
-    acts = []
+
+# Lists the trace files of an iteration, or returns None if it has no decoded traces.
+def get_trace_files(exp_dir: Path, iter_name: str) -> Optional[list[Path]]:
     iter_dir = exp_dir / "data" / "decoded" / iter_name
     if not iter_dir.is_dir():
       return None
-    for trace_file in iter_dir.iterdir():
-        trace_acts = get_acts_from_trace(trace_file)
-        acts += trace_acts
-    print(f"[{iter_name}] Loaded {len(acts)} activations.")
+    # Skip the '.csv.cache' sidecars written by ddr5.read_trace().
+    return [trace_file for trace_file in iter_dir.iterdir() if trace_file.suffix == ".csv"]
+
+
+def get_addr_data_for_iter(iter_name: str, exp_cfg: tuple[int, int, int, int], histogram: activations.Histogram,
+                           min_margin: int) -> Optional[ExpIteration]:
+    virt, phys, dram, principal_dram = exp_cfg
+    print(f"[{iter_name}] Loaded {histogram.num_acts} activations.")
 
-    # STEP 3: Find most accessed addresses.
-    # List of (act, count) tuples sorted in descending order of counts.
-    counts = Counter(acts).most_common()
+    # STEP 3: Find the two most accessed addresses.
+    most_activated, first_count, second_count = (activations.most_activated_two(histogram) if histogram.num_acts
+                                                 else (None, 0, 0))
 
     # STEP 4: Check data quality.
-    if not counts or counts[0][1] < 100:
-        print(f"[{iter_name}] Error: Most accessed <bg,bk> has ({counts[0][1] if counts else 0}) less than 100 accesses. Discarding...")
+    if first_count < 100:
+        print(f"[{iter_name}] Error: Most accessed <bg,bk> has ({first_count}) less than 100 accesses. Discarding...")
         return None
 
-    margin = counts[0][1] / counts[1][1] if len(counts) > 1 else float("+inf")
+    margin = first_count / second_count if second_count else float("+inf")
     print(f"[{iter_name}] Ratio between most and second most accessed <bg,bk>: {margin:.2f}")
     if margin < min_margin:
         print(f"[{iter_name}] Ratio is less than {min_margin}. Discarding...")
         return None
 
-    most_activated = counts[0][0]
     return ExpIteration(iter_name, virt, phys, dram, principal_dram, most_activated)
 
 
@@ -236,6 +283,83 @@ def analyze_results(results: list[tuple[list, list]]) -> None:
             print(f"{contrib:2d} ({percentage:3.0f}%/{contributor_bit_counts[contrib]:2d})", end=" ")
         print()
 
+# Returns the observations (description, DRAM address difference, <bg,bk,row> difference) of all groups: every
+# iteration against its principal, and the principals of all groups against the principal of the first group.
+def get_observations(groups: list[list[ExpIteration]]) -> list[tuple[str, int, int]]:
+    observations = []
+    reference = None
+    for iterations in groups:
+        principals = [iteration for iteration in iterations if iteration.dram == iteration.principal_dram]
+        if not principals:
+            continue
+        principal = principals[0]
+        if reference is None:
+            reference = principal
+        elif principal is not reference:
+            observations.append((f"principal 0x{principal.dram:010x} vs. 0x{reference.dram:010x}",
+                                 principal.dram ^ reference.dram, principal.most_activated ^ reference.most_activated))
+        for iteration in iterations:
+            if iteration is principal:
+                continue
+            observations.append((f"{iteration.name} (principal 0x{principal.dram:010x})",
+                                 iteration.dram ^ principal.dram, iteration.most_activated ^ principal.most_activated))
+    return observations
+
+
+# Solves for XOR address functions with Gaussian elimination over GF(2): the <bg,bk,row> bit i of an address x is
+# assumed to be parity(masks[i] & x), so every observation (dx, dy) is a linear equation parity(masks[i] & dx) = bit i
+# of dy for every i. Rows of the system are bit-packed into integers (dx, and dy for all functions at once).
+# Returns the masks (using only address bits that are determined by the observations), the mask of the undetermined
+# address bits, and the observations that contradict the ones before them along with the function bits they
+# contradict in.
+def solve_addr_functions(observations: list[tuple[str, int, int]]) -> tuple[list[int], int, list[tuple[str, int]]]:
+    basis = {}  # pivot bit -> (dx, dy), the pivot being the highest bit set in dx
+    conflicts = []
+    for description, dx, dy in observations:
+        while dx and dx.bit_length() - 1 in basis:
+            pivot_dx, pivot_dy = basis[dx.bit_length() - 1]
+            dx, dy = dx ^ pivot_dx, dy ^ pivot_dy
+        if dx:
+            basis[dx.bit_length() - 1] = (dx, dy)
+        elif dy:
+            conflicts.append((description, dy))
+
+    # Reduce to reduced row echelon form, such that every row contains exactly one pivot bit.
+    for pivot in sorted(basis):
+        pivot_dx, pivot_dy = basis[pivot]
+        for other, (dx, dy) in basis.items():
+            if other != pivot and dx & bit(pivot):
+                basis[other] = (dx ^ pivot_dx, dy ^ pivot_dy)
+
+    # With all undetermined address bits set to zero, every pivot bit directly is part of the functions it maps to.
+    masks = [0] * (ROW_BITS + BK_BITS + BG_BITS)
+    for pivot, (_, dy) in basis.items():
+        for i in bits_set(dy):
+            masks[i] |= bit(pivot)
+    observed = 0
+    for _, dx, _ in observations:
+        observed |= dx
+    undetermined = observed & ~sum(bit(pivot) for pivot in basis)
+    return masks, undetermined, conflicts
+
+
+def print_addr_functions(groups: list[list[ExpIteration]]) -> None:
+    observations = get_observations(groups)
+    print(f"[+] Solving for the address functions over GF(2) with {len(observations)} observations...")
+    masks, undetermined, conflicts = solve_addr_functions(observations)
+
+    addr_function_map = get_addr_function_map()
+    for description, dy in conflicts:
+        print(f"[-] Conflicting observation {description}: contradicts earlier observations in",
+              *[addr_function_map[i] for i in bits_set(dy)])
+
+    for i, mask in enumerate(masks):
+        print(f"{addr_function_map[i]:>5s}: 0x{mask:010x} >", *bits_set(mask))
+    if undetermined:
+        print(f"[-] Address bits that are only determined up to combinations of others (0x{undetermined:010x}):",
+              *bits_set(undetermined))
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--legacy-data-fmt",
@@ -245,22 +369,86 @@ if __name__ == "__main__":
     parser.add_argument("--find-constraint",
             help="find the constraint function (e.g., subchannel) by checking which bitflips retain visibility of ACTs",
             action="store_true")
+    parser.add_argument("--jobs", type=int, default=min(os.cpu_count(), 64),
+            help="number of trace files read in parallel (default: number of CPUs, at most 64)")
+    parser.add_argument("--solve",
+            help="also solve for the XOR address functions over GF(2), using the observations of all groups together",
+            action="store_true")
+    parser.add_argument("--rebuild-cache",
+            help=f"read all trace files again instead of reusing the ACT counts cached in 'data/{ACT_CACHE_NAME}'",
+            action="store_true")
     parser.add_argument("exp_dirs", nargs='+')
     args = parser.parse_args()
     legacy_data_fmt = args.legacy_data_fmt
 
+    # STEP 1: Parse exp_cfg.csv of all iterations of all experiments, and list their trace files. Iterations that are
+    #         up to date in the ACT cache are taken from there.
+    iterations = []  # (index in iter_data, exp_dir, name, exp_cfg, stamp) of every iteration that has decoded traces
     iter_data = []
+    histograms = []
+    files_left = []
+    tasks = []
+    # The ACT cache of an experiment is rewritten with only the iterations found in this run, such that entries of
+    # deleted iterations are dropped.
+    old_act_caches = {}
+    act_caches = {}
     for exp_dir in args.exp_dirs:
         exp_dir = Path(exp_dir)
         iter_names = [iter_dir.name for iter_dir in exp_dir.iterdir()
                       if iter_dir.name.startswith("it")]
         iter_names.sort()
         print(f"Processing {len(iter_names)} iterations in '{exp_dir}'...")
-
-        with multiprocessing.Pool(min(os.cpu_count(), 64)) as pool:
-            # FIRST PART: Read ACTs from trace files, decide on most accessed address per iteration (or drop it if the
-            #             margin is not sufficiently large).
-            iter_data += pool.starmap(get_addr_data_for_iter, ((exp_dir, iter_name, args.margin) for iter_name in iter_names))
+        old_act_caches[exp_dir] = {} if args.rebuild_cache else read_act_cache(exp_dir)
+        act_caches[exp_dir] = {}
+
+        for iter_name in iter_names:
+            trace_files = get_trace_files(exp_dir, iter_name)
+            stamp = iteration_stamp(exp_dir, iter_name, trace_files) if trace_files is not None else None
+            cached = old_act_caches[exp_dir].get(iter_name)
+            if cached is not None and cached["stamp"] == stamp:
+                exp_cfg = tuple(cached["exp_cfg"])
+            else:
+                cached = None
+                exp_cfg = read_exp_cfg(exp_dir, iter_name)
+            print(f"[{iter_name}] Loaded 'exp_cfg.csv'. Bit flips at bits", *bits_set(exp_cfg[2] ^ exp_cfg[3]))
+            iter_data.append(None)
+            if trace_files is None:
+                continue
+            iterations.append((len(iter_data) - 1, exp_dir, iter_name, exp_cfg, stamp))
+            if cached is not None:
+                act_caches[exp_dir][iter_name] = cached
+                histograms.append(histogram_from_cache(cached))
+                files_left.append(0)
+            else:
+                histograms.append(activations.EMPTY)
+                files_left.append(len(trace_files))
+                tasks += [(len(iterations) - 1, trace_file, rank) for rank, trace_file in enumerate(trace_files)]
+    print(f"[+] {len(iterations) - sum(n > 0 for n in files_left)} iterations loaded from the ACT cache, "
+          f"reading {len(tasks)} trace files.")
+
+    # STEP 2: Read ACTs from all trace files of all experiments in one pool, and decide on the most accessed address
+    #         of an iteration (or drop it if the margin is not sufficiently large) as soon as all its files are read.
+    def finish_iteration(i: int, from_files: bool):
+        data_idx, exp_dir, iter_name, exp_cfg, stamp = iterations[i]
+        if from_files:
+            act_caches[exp_dir][iter_name] = act_cache_entry(stamp, exp_cfg, histograms[i])
+        iter_data[data_idx] = get_addr_data_for_iter(iter_name, exp_cfg, histograms[i], args.margin)
+        histograms[i] = None
+
+    for i, num_files in enumerate(files_left):
+        if num_files == 0:
+            finish_iteration(i, from_files=False)
+    with multiprocessing.Pool(max(1, min(args.jobs, len(tasks)))) as pool:
+        for i, histogram in pool.imap_unordered(get_act_histogram_task, tasks):
+            histograms[i] = activations.merge(histograms[i], histogram)
+            files_left[i] -= 1
+            if files_left[i] == 0:
+                finish_iteration(i, from_files=True)
+
+    for exp_dir, entries in act_caches.items():
+        if entries != old_act_caches[exp_dir] or not act_cache_path(exp_dir).is_file():
+            write_act_cache(exp_dir, entries)
+            print(f"[+] Updated ACT cache '{act_cache_path(exp_dir)}'.")
 
     if not iter_data:
         print(f"[-] Error: No iteration data in the following experiment directories:")
@@ -291,7 +479,7 @@ if __name__ == "__main__":
         iterations_by_principal[iteration.principal_dram].append(iteration)
 
     # Process the data.
-    with multiprocessing.Pool(min(os.cpu_count(), 64)) as pool:
+    with multiprocessing.Pool(max(1, min(args.jobs, len(iterations_by_principal)))) as pool:
         results = pool.map(process_group, iterations_by_principal.values())
 
     # Results is a list of (contributors, bits analyzed).
@@ -306,3 +494,6 @@ if __name__ == "__main__":
         sys.exit(0)
 
     analyze_results(results)
+
+    if args.solve:
+        print_addr_functions(list(iterations_by_principal.values()))
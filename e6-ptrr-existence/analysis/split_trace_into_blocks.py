@@ -1,119 +1,148 @@
 #!/usr/bin/env python3
-from collections import Counter
-import csv
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
 from pathlib import Path
 import sys
-
-
-def read_file(file: Path):
-    with file.open("r") as f:
-        reader = csv.DictReader(f, delimiter=",")
-        return list(reader)
-
-
-data_dir = Path(sys.argv[1])
-print(f"[+] Data directory is '{data_dir}'.")
-
-blocks_written = 0
-
-for it_dir in (data_dir / "data/decoded").iterdir():
-    files = [f for f in it_dir.iterdir() if f.suffix == ".csv"]
-    files.sort()
-    print(f"[+] Found {len(files)} decoded traces in '{it_dir.name}'.")
-    
-    block_dir = data_dir / "data/blocks" / it_dir.name
-    print(f"[+] Writing block traces for '{it_dir.name}' to '{block_dir}'.")
-
-    for file in files:
-        print(f"[+] >>> {file}")
-
-        # Load commands
-        cmds = read_file(file)
-        acts = [cmd for cmd in cmds if cmd["cmd"] == "act"]
-        print(f"[+] Loaded {len(cmds)} DDRx commands, including {len(acts)} ACTs.")
-
-        # Determine most activated (BG,BA).
-        counter = Counter((act["bg"], act["bk"]) for act in acts)
-        counts = counter.most_common()
-        print("[+] Most commonly activated (BG,BA) tuples:")
-        for (bg, ba), count in counts[:3]:
-            print(f"    ({bg},{ba}): {count}x")
-        ratio = 0
-        if len(counts) >= 1 and len(counts[0]) >= 1 and len(counts[1]) >= 1:
-            ratio = counts[0][1] / counts[1][1]
-            print("[+] ({},{}) was activated {:.1f} times more often than ({},{}).".format(*counts[0][0], ratio, *counts[1][0]))
-
-        if ratio < 10:
-            print("[-] No (BG,BA) tuple was activated much more often than the other ones.")
-            print(f"[-] Skipping this file ({file.name})...")
+from typing import Optional
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from mcsee import blockstore, ddr5
+
+
+# Splits one decoded trace into blocks and writes them as CSV files to `block_dir` (unless it is None). Returns the
+# blocks as (block number, indices of its commands in the trace), or None if the trace was skipped.
+def split_trace(file: Path, block_dir: Optional[Path]) -> Optional[list[tuple[int, np.ndarray]]]:
+    blocks = []
+    print(f"[+] >>> {file}")
+
+    # Load commands
+    trace = ddr5.read_trace(file, use_cache=True)
+    is_act = trace.is_cmd("act")
+    print(f"[+] Loaded {len(trace)} DDRx commands, including {np.count_nonzero(is_act)} ACTs.")
+
+    # Determine most activated (BG,BA).
+    banks = ddr5.most_activated_banks(trace)
+    counts = [((trace.field_str("bg", bg), trace.field_str("bk", bk)), count) for (bg, bk), count in banks]
+    print("[+] Most commonly activated (BG,BA) tuples:")
+    for (bg, ba), count in counts[:3]:
+        print(f"    ({bg},{ba}): {count}x")
+    ratio = 0
+    if len(counts) >= 1 and len(counts[0]) >= 1 and len(counts[1]) >= 1:
+        ratio = counts[0][1] / counts[1][1]
+        print("[+] ({},{}) was activated {:.1f} times more often than ({},{}).".format(*counts[0][0], ratio, *counts[1][0]))
+
+    if ratio < 10:
+        print("[-] No (BG,BA) tuple was activated much more often than the other ones.")
+        print(f"[-] Skipping this file ({file.name})...")
+        return None
+
+    # Filter CMDs to only consider that (BG,BA) tuple.
+    most_common_bg = counts[0][0][0]
+    most_common_ba = counts[0][0][1]
+    bg, bk = banks[0][0]
+    idxs = np.flatnonzero(((trace.bg == bg) | (trace.bg == ddr5.NO_BG)) & ((trace.bk == bk) | (trace.bk == ddr5.NO_BK)))
+    print(f"[+] Ignoring commands with (BG,BA) != ({most_common_bg},{most_common_ba}), {len(idxs)} commands remain.")
+
+    # Create blocks of commands: a new block starts wherever two commands are at least 1000 ns apart.
+    timestamps_ns = trace.time_sec()[idxs] * 1e9
+    block_starts = np.concatenate(([0], np.flatnonzero(np.diff(timestamps_ns) >= 1000) + 1))
+    block_ends = np.append(block_starts[1:], len(idxs))
+    act_counts = np.add.reduceat(is_act[idxs].astype(np.int64), block_starts)
+
+    # Remove all blocks with less than 20 ACTs, i.e., noise.
+    not_noise = act_counts >= 20
+    block_starts, block_ends, act_counts = block_starts[not_noise], block_ends[not_noise], act_counts[not_noise]
+
+    print(f"[+] Trace contains {len(block_starts)} blocks.")
+
+    # Create statistics over # ACTs per block.
+    act_counts_sorted = np.sort(act_counts).tolist()
+    first_quartile = act_counts_sorted[len(act_counts_sorted) // 4]
+    median = act_counts_sorted[len(act_counts_sorted) // 2]
+    third_quartile = act_counts_sorted[3 * len(act_counts_sorted) // 4]
+    print("Block statistics (# ACTs):", end="")
+    print(f"{act_counts_sorted[0]} / {first_quartile} / {median} / {third_quartile} / {act_counts_sorted[-1]}")
+
+    # Now, we only consider blocks with ACT counts withing 10% of the maximum ACT count.
+    for i in np.flatnonzero(act_counts > act_counts_sorted[-1] * 0.9).tolist():
+        cmds = idxs[block_starts[i]:block_ends[i]]
+        blocks.append((i, cmds))
+        if block_dir is None:
             continue
 
-        # Filter CMDs to only consider that (BG,BA) tuple.
-        most_common_bg = counts[0][0][0]
-        most_common_ba = counts[0][0][1]
-        cmds = list(filter(lambda cmd: (cmd["bg"] == most_common_bg or cmd["bg"] == "") and (cmd["bk"] == most_common_ba or cmd["bk"] == ""), cmds))
-        print(f"[+] Ignoring commands with (BG,BA) != ({most_common_bg},{most_common_ba}), {len(cmds)} commands remain.")
-
-        # Create blocks of commands.
-        blocks = []
-
-        block_start = None
-        block_current = None
-        block_cmds = []
-        for cmd in cmds:
-            timestamp_ns = float(cmd["timestamp_sec"]) * 1e9
-            if block_start is None:
-                block_start = timestamp_ns
-                block_current = timestamp_ns
-                block_cmds = [cmd]
-                continue
-            assert block_start is not None and block_current is not None
-
-            # Check if this is close enough to be in the same block.
-            if timestamp_ns - block_current >= 1000:  # 1000 ns
-                # Too far apart.
-                blocks.append((block_start, block_current, block_cmds))
-                block_start = timestamp_ns
-                block_current = timestamp_ns
-                block_cmds = [cmd]
-            else:
-                block_current = timestamp_ns
-                block_cmds.append(cmd)
-        if block_start is not None:
-            blocks.append((block_start, block_current, block_cmds))
-
-
-        # Remove all blocks with less than 20 ACTs, i.e., noise.
-        def count_acts(block):
-            return sum(cmd["cmd"] == "act" for cmd in block[2])
-        blocks = [block for block in blocks if count_acts(block) >= 20]
-        
-        print(f"[+] Trace contains {len(blocks)} blocks.")
-
-        # Create statistics over # ACTs per block.
-        act_counts = [sum(cmd["cmd"] == "act" for cmd in block[2]) for block in blocks]
-        act_counts.sort()
-        first_quartile = act_counts[len(act_counts) // 4]
-        median = act_counts[len(act_counts) // 2]
-        third_quartile = act_counts[3 * len(act_counts) // 4]
-        print("Block statistics (# ACTs):", end="")
-        print(f"{act_counts[0]} / {first_quartile} / {median} / {third_quartile} / {act_counts[-1]}")
-
-        # Now, we only consider blocks with ACT counts withing 10% of the maximum ACT count.
-        for i, (start, end, cmds) in enumerate(blocks):
-            acts = [cmd for cmd in cmds if cmd["cmd"] == "act"]
-            if len(acts) <= act_counts[-1] * 0.9:
-                continue
-
-            # Write block to file.
-            block_file = Path(block_dir / file.stem / f"block_{i:03d}.csv")
-            block_file.parent.mkdir(parents=True, exist_ok=True)
-            print(f"[+] Writing block with {len(cmds)} commands to {block_file.name}.")
-            with block_file.open("w") as f:
-                writer = csv.DictWriter(f, fieldnames=["timestamp_sec", "cmd", "bg", "bk", "row", "col"])
-                writer.writeheader()
-                for cmd in cmds:
-                    writer.writerow(cmd)
-                blocks_written += 1
-
-print(f"[+] Extracted {blocks_written} blocks from '{data_dir.name}'.")
+        # Write block to file. The lines are copied verbatim from the trace, terminated like csv.DictWriter does.
+        block_file = Path(block_dir / file.stem / f"block_{i:03d}.csv")
+        block_file.parent.mkdir(parents=True, exist_ok=True)
+        print(f"[+] Writing block with {len(cmds)} commands to {block_file.name}.")
+        with block_file.open("wb") as f:
+            f.write(",".join(ddr5.FIELDNAMES).encode() + b"\r\n")
+            f.write(b"".join(line + b"\r\n" for line in ddr5.read_lines(file, trace, cmds)))
+
+    return blocks
+
+
+# Runs split_trace() for a (trace file, block directory) task with its output captured, such that the output of
+# parallel workers does not interleave.
+def split_trace_logged(task: tuple[Path, Optional[Path]]) -> tuple[str, Optional[list[tuple[int, np.ndarray]]]]:
+    with contextlib.redirect_stdout(io.StringIO()) as log:
+        blocks = split_trace(*task)
+    return log.getvalue(), blocks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split the decoded traces of an E6 run into hammering blocks.")
+    parser.add_argument("data_dir", type=Path)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                        help="number of trace files split in parallel (default: number of CPUs)")
+    parser.add_argument("--block-store", action="store_true",
+                        help=f"write all blocks to a single 'data/{blockstore.STORE_NAME}' file instead of one CSV file per block")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir
+    print(f"[+] Data directory is '{data_dir}'.")
+
+    # Every (iteration, trace file) pair is an independent task.
+    tasks = []
+    for it_dir in sorted((data_dir / "data/decoded").iterdir()):
+        files = [f for f in it_dir.iterdir() if f.suffix == ".csv"]
+        files.sort()
+        print(f"[+] Found {len(files)} decoded traces in '{it_dir.name}'.")
+
+        block_dir = data_dir / "data/blocks" / it_dir.name
+        if args.block_store:
+            tasks += [(file, None) for file in files]
+        else:
+            print(f"[+] Writing block traces for '{it_dir.name}' to '{block_dir}'.")
+            tasks += [(file, block_dir) for file in files]
+
+    # The workers only return the command indices of the blocks, the block store is written by this process.
+    store_path = data_dir / "data" / blockstore.STORE_NAME
+    with contextlib.ExitStack() as stack:
+        store = stack.enter_context(blockstore.BlockStoreWriter(store_path)) if args.block_store else None
+
+        # The logs are printed in task order as soon as all preceding tasks are done.
+        summary = {}
+        pool = stack.enter_context(multiprocessing.Pool(max(1, min(args.jobs, len(tasks)))))
+        for (file, _), (log, blocks) in zip(tasks, pool.imap(split_trace_logged, tasks)):
+            print(log, end="")
+            it_name = file.parent.name
+            traces, skipped, written = summary.get(it_name, (0, 0, 0))
+            summary[it_name] = (traces + 1, skipped + (blocks is None), written + len(blocks or []))
+            if store is not None and blocks:
+                trace = ddr5.read_trace(file, use_cache=True)
+                for i, cmds in blocks:
+                    store.add(it_name, file.stem, i, trace, cmds)
+
+    if args.block_store:
+        print(f"[+] Wrote all blocks to '{store_path}'.")
+
+    print("[+] Summary (traces / skipped traces / blocks written):")
+    for it_name, (traces, skipped, written) in summary.items():
+        print(f"    {it_name}: {traces} / {skipped} / {written}")
+    blocks_written = sum(written for _, _, written in summary.values())
+    print(f"[+] Extracted {blocks_written} blocks from '{data_dir.name}'.")
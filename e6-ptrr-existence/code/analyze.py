@@ -1,16 +1,14 @@
 #!/usr/bin/env python3
 from collections import Counter
-import csv
 from pathlib import Path
 import statistics
 import sys
 from termcolor import colored
 
+import numpy as np
 
-def read_file(file: Path) -> list[dict]:
-    with file.open("r") as f:
-        reader = csv.DictReader(f, delimiter=",")
-        return list(reader)
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from mcsee import ddr5
 
 
 data_dir = Path(sys.argv[1])
@@ -24,15 +22,15 @@ for file in files:
     print(f"[+] >>> {file.name}")
 
     # Load commands
-    cmds = read_file(file)
-    print(f"[+] Loaded {len(cmds)} DDRx commands.")
+    trace = ddr5.read_trace(file, use_cache=True)
+    print(f"[+] Loaded {len(trace)} DDRx commands.")
 
     # Determine most activated (bg,bk).
-    acts = [cmd for cmd in cmds if cmd["cmd"] == "act"]
-    print(f"[+] Loaded {len(acts)} ACTs.")
+    is_act = trace.is_cmd("act")
+    print(f"[+] Loaded {np.count_nonzero(is_act)} ACTs.")
 
-    counter = Counter((act["bg"], act["bk"]) for act in acts)
-    counts = counter.most_common()
+    banks = ddr5.most_activated_banks(trace)
+    counts = [((trace.field_str("bg", bg), trace.field_str("bk", bk)), count) for (bg, bk), count in banks]
     print("[+] Most commonly activated (BG,BA) tuples:")
     for (bg, ba), count in counts[:3]:
         print(f"    ({bg},{ba}): {count}x")
@@ -47,8 +45,9 @@ for file in files:
     # Filter CMDs to only consider that (BG,BA) tuple.
     most_common_bg = counts[0][0][0]
     most_common_ba = counts[0][0][1]
-    cmds = list(filter(lambda cmd: (cmd["bg"] == most_common_bg or cmd["bg"] == "") and (cmd["bk"] == most_common_ba or cmd["bk"] == ""), cmds))
-    print(f"[+] Ignoring commands with (BG,BA) != ({most_common_bg},{most_common_ba}), {len(cmds)} commands remain.")
+    bg, bk = banks[0][0]
+    idxs = np.flatnonzero(((trace.bg == bg) | (trace.bg == ddr5.NO_BG)) & ((trace.bk == bk) | (trace.bk == ddr5.NO_BK)))
+    print(f"[+] Ignoring commands with (BG,BA) != ({most_common_bg},{most_common_ba}), {len(idxs)} commands remain.")
 
     # for cmd in cmds:
     #     if cmd["cmd"] != "act":
@@ -56,26 +55,29 @@ for file in files:
     #     timestamp_ns = float(cmd["timestamp_sec"]) * 1e9
     #     print(f"{timestamp_ns:.0f} {cmd['row']}")
 
-    # Create blocks of ACTs.
+    # Create blocks of ACTs. A block is a tuple (start, end, indices of its commands in the trace).
+    timestamps_sec = trace.time_sec()
+    timestamps_ns = timestamps_sec * 1e9
     blocks = []
 
     block_start = None
     block_current = None
     block_cmds = []
-    for cmd in cmds:
-        timestamp_ns = float(cmd["timestamp_sec"]) * 1e9
+    for idx in idxs.tolist():
+        timestamp_ns = float(timestamps_ns[idx])
         if block_start is None:
             block_start = timestamp_ns
             block_current = timestamp_ns
-            block_cmds = [cmd]
+            block_cmds = [idx]
             continue
         assert block_start is not None and block_current is not None
 
-        if cmd["cmd"] == "act":
-            print(f"ACT {timestamp_ns:.1f} {cmd['row']} ({int(cmd['row'], 2) & 0x3ff})")
-        elif cmd["cmd"] in ["rd", "rda", "wr", "wra"]:
-            print(f"{cmd['cmd'].upper():<3s} {timestamp_ns:.1f} {cmd['col']} ({int(cmd['col'], 2)})")
-        elif cmd["cmd"] == "pre_pb":
+        cmd = trace.cmd_names[trace.cmd[idx]]
+        if cmd == "act":
+            print(f"ACT {timestamp_ns:.1f} {trace.field_str('row', trace.row[idx])} ({int(trace.row[idx]) & 0x3ff})")
+        elif cmd in ["rd", "rda", "wr", "wra"]:
+            print(f"{cmd.upper():<3s} {timestamp_ns:.1f} {trace.field_str('col', trace.col[idx])} ({int(trace.col[idx])})")
+        elif cmd == "pre_pb":
             print("PRE")
 
         # Check if this is close enough to be in the same block.
@@ -85,24 +87,24 @@ for file in files:
             print("BLOCK")
             block_start = timestamp_ns
             block_current = timestamp_ns
-            block_cmds = [cmd]
+            block_cmds = [idx]
         else:
             block_current = timestamp_ns
-            block_cmds.append(cmd)
+            block_cmds.append(idx)
     if block_start is not None:
         blocks.append((block_start, block_current, block_cmds))
 
 
     # Remove all blocks with less than 20 ACTs, i.e., noise.
     def count_acts(block):
-        return sum(cmd["cmd"] == "act" for cmd in block[2])
+        return int(np.count_nonzero(is_act[block[2]]))
 
     blocks = [block for block in blocks if count_acts(block) >= 20]
     
     print(f"[+] Got {len(blocks)} blocks.")
 
     # Create statistics over # ACTs per block.
-    act_counts = [sum(cmd["cmd"] == "act" for cmd in block[2]) for block in blocks]
+    act_counts = [count_acts(block) for block in blocks]
     act_counts.sort()
     first_quartile = act_counts[len(act_counts) // 4]
     median = act_counts[len(act_counts) // 2]
@@ -113,17 +115,16 @@ for file in files:
 
     # Now, we only consider blocks with ACT counts within 5 % of the median.
     for start, end, cmds in blocks:
-        acts = [cmd for cmd in cmds if cmd["cmd"] == "act"]
+        acts = [idx for idx in cmds if is_act[idx]]
         if not 0.95 * median <= len(acts) <= 1.05 * median:
             continue
 
-        # Write block to file.
+        # Write block to file. The lines are copied verbatim from the trace, terminated like csv.DictWriter does.
         block_file = Path("block_cmds.csv")
-        with block_file.open("w") as f:
-            writer = csv.DictWriter(f, fieldnames=["timestamp_sec", "cmd", "bg", "bk", "row", "col"])
-            writer.writeheader()
-            for cmd in cmds:
-                writer.writerow(cmd)
+        with block_file.open("wb") as f:
+            f.write(",".join(ddr5.FIELDNAMES).encode() + b"\r\n")
+            for line in ddr5.read_lines(file, trace, cmds):
+                f.write(line + b"\r\n")
 
         print(f">>> {start:.1f} -> {end:.1f}: {len(acts)} ACTs")
         print(f"    {(end - start) / max(len(acts) - 1, 1):.1f} ns between ACTs")
@@ -132,8 +133,8 @@ for file in files:
         same_row = []
         different_row = []
         for i in range(1, len(acts)):
-            distance = (float(acts[i]["timestamp_sec"]) - float(acts[i-1]["timestamp_sec"])) * 1e9
-            if acts[i]["row"] == acts[i-1]["row"]:
+            distance = (float(timestamps_sec[acts[i]]) - float(timestamps_sec[acts[i-1]])) * 1e9
+            if trace.row[acts[i]] == trace.row[acts[i-1]]:
                 same_row.append(distance)
             else:
                 different_row.append(distance)
@@ -141,7 +142,7 @@ for file in files:
             print(f"Same row: {min(same_row):.1f} / {statistics.mean(same_row):.1f} / {max(same_row):.1f} ns")
         print(f"Diff row: {min(different_row):.1f} / {statistics.mean(different_row):.1f} / {max(different_row):.1f} ns")
 
-        rows = [int(cmd["row"], 2) & 0x3ff for cmd in acts]
+        rows = [int(trace.row[idx]) & 0x3ff for idx in acts]
         color_for_row = dict()
         for i, (row, _) in enumerate(Counter(rows).most_common(2)):
             color_for_row[row] = ["red", "green", "yellow", "magenta"][i]
@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-import csv
+import argparse
 from collections import defaultdict
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
@@ -7,7 +7,14 @@ import numpy as np
 import sys
 from pathlib import Path
 
-block_file = Path(sys.argv[1])
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from mcsee import blockstore, ddr5
+
+parser = argparse.ArgumentParser(description="Plot the commands of a single block.")
+parser.add_argument("block_file", type=Path, help="block_NNN.csv file, or a block store if --block is given")
+parser.add_argument("--block", type=int, help="index entry of the block in the block store (see split_trace_into_blocks.py --block-store)")
+args = parser.parse_args()
+block_file = args.block_file
 
 
 # NUM_ROWS = 8
@@ -16,35 +23,41 @@ NUM_ROWS = 1
 fig, ax = plt.subplots(NUM_ROWS, figsize=(10,2), dpi=300)
 ax = [ax]
 
-with block_file.open("r") as f:
-    reader = csv.DictReader(f)
-    cmds = list(reader)
+if args.block is not None:
+    trace = blockstore.BlockStore(block_file).block(args.block)
+else:
+    trace = ddr5.read_trace(block_file)
+cmds = [trace.cmd_names[code] for code in trace.cmd.tolist()]
+timestamps_us = (trace.time_sec() * 1e6).tolist()
+rows = trace.row.tolist()
 
 # Print types of commands present.
-cmd_types = set([cmd["cmd"] for cmd in cmds])
+cmd_types = set(cmds)
 print(cmd_types)
 
 # Check this is all in the same bank.
-bank_groups = set([cmd["bg"] for cmd in cmds if cmd["bg"]])
+bank_groups = set([trace.field_str("bg", bg) for bg in trace.bg.tolist() if bg != ddr5.NO_BG])
 assert len(bank_groups) == 1
-banks = set([cmd["bk"] for cmd in cmds if cmd["bk"]])
+banks = set([trace.field_str("bk", bk) for bk in trace.bk.tolist() if bk != ddr5.NO_BK])
 assert len(banks) == 1
 print(f"BG={list(bank_groups)[0]}, BA={list(banks)[0]}")
 
 # Trim all commands from beginning of block until first ACT.
 first_act_idx = None
 last_act_idx = None
-for j, cmd in enumerate(cmds):
-    if cmd["cmd"] == "act" and float(cmd["timestamp_sec"])*1e6 >= 666 and first_act_idx is None:
+for j, (cmd, timestamp) in enumerate(zip(cmds, timestamps_us)):
+    if cmd == "act" and timestamp >= 666 and first_act_idx is None:
         first_act_idx = j
         continue
-    elif float(cmd["timestamp_sec"])*1e6 >= 697:
+    elif timestamp >= 697:
         last_act_idx = j
         break
 cmds = cmds[first_act_idx:last_act_idx]
+timestamps_us = timestamps_us[first_act_idx:last_act_idx]
+rows = rows[first_act_idx:last_act_idx]
 
-first_timestamp = float(cmds[0]["timestamp_sec"]) * 1e6
-last_timestamp = float(cmds[-1]["timestamp_sec"]) * 1e6
+first_timestamp = timestamps_us[0]
+last_timestamp = timestamps_us[-1]
 print(f"Delta: {last_timestamp - first_timestamp:.1f} us")
 
 # Tuples of (timestamp,row) for different commands.
@@ -55,12 +68,11 @@ open_row = None
 last_cmd = None
 last_cmd_timestamp = None
 
-for cmd in cmds:
-    if cmd["cmd"] == "act":
-        open_row = int(cmd["row"], 2)
-    timestamp = float(cmd["timestamp_sec"]) * 1e6
+for cmd, timestamp, row in zip(cmds, timestamps_us, rows):
+    if cmd == "act":
+        open_row = row
     timestamp = timestamp - first_timestamp
-    key = cmd["cmd"]
+    key = cmd
     if key.startswith("pre"):
         key = "pre"
 
@@ -74,7 +86,7 @@ for cmd in cmds:
             row = open_row
     # classified_cmds[key].append((timestamp, f"0x{row:04x}"))
     classified_cmds[key].append((timestamp, f"{row-0xf000:d}"))
-    if cmd["cmd"] in ["pre_pb", "pre_sb"]:
+    if cmd in ["pre_pb", "pre_sb"]:
         if last_cmd == "act":
             print(f"ACT->PRE (row = 0x{open_row:04x}): {timestamp - last_cmd_timestamp:.3f} ns")
             act_pre_regions.append((last_cmd_timestamp, timestamp))
@@ -1,81 +1,84 @@
 #!/usr/bin/env python3
-import csv
-import json
+import argparse
+import numpy as np
 import sys
 from pathlib import Path
 
-data_dir = Path(sys.argv[1])
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from mcsee import blockstore, ddr5, events
+
+parser = argparse.ArgumentParser(description="Extract the pTRR mitigation events from the blocks of an E6 run.")
+parser.add_argument("data_dir", type=Path)
+parser.add_argument("--block-store", action="store_true",
+                    help=f"read the blocks from 'data/{blockstore.STORE_NAME}' (see split_trace_into_blocks.py --block-store)")
+args = parser.parse_args()
+data_dir = args.data_dir
 
-block_files = []
 
-for it_dir in (data_dir / "data/blocks").iterdir():
-    if not it_dir.is_dir():
-        continue
-    for trace_dir in it_dir.iterdir():
-        if not trace_dir.is_dir():
+# List of (block file, index entry in the block store). For the block store, the block file is the path the block
+# would have as a CSV file, such that the output does not depend on where the blocks are stored.
+block_files = []
+store = None
+
+if args.block_store:
+    store = blockstore.BlockStore(data_dir / "data" / blockstore.STORE_NAME)
+    for block_id in range(len(store)):
+        it_name, trace_name, block = store.name(block_id)
+        block_files.append((data_dir / "data/blocks" / it_name / trace_name / f"block_{block:03d}.csv", block_id))
+else:
+    for it_dir in (data_dir / "data/blocks").iterdir():
+        if not it_dir.is_dir():
             continue
-        for block_file in trace_dir.iterdir():
-            if not block_file.is_file():
+        for trace_dir in it_dir.iterdir():
+            if not trace_dir.is_dir():
                 continue
-            block_files.append(block_file)
+            for block_file in trace_dir.iterdir():
+                # Skip the '.csv.cache' sidecars written by earlier versions of ddr5.read_trace().
+                if not block_file.is_file() or block_file.suffix != ".csv":
+                    continue
+                block_files.append((block_file, None))
 block_files.sort()
 print(f"[+] Found {len(block_files)} block traces in '{data_dir}'.")
 
-out_file = data_dir / "data/mitigation_events.json"
-json_data = []
+out_file = data_dir / "data" / events.EVENTS_NAME
 
 total_acts = 0
 num_events = 0
 
-for i, block_file in enumerate(block_files):
-    print(block_file)
-    with block_file.open("r") as f:
-        reader = csv.DictReader(f)
-        cmds = list(reader)
-
-    t_start = float(cmds[0]["timestamp_sec"]) * 1e9
-
-    timestamps_and_rows = []
-
-    for cmd in cmds:
-        if cmd["cmd"] == "act":
-            row = int(cmd["row"], 2)
-            timestamp = float(cmd["timestamp_sec"]) * 1e9 - t_start
-            timestamp = round(timestamp)
-            timestamps_and_rows.append((timestamp, row))
-
-    event_idxs = []
-
-    for j in range(len(timestamps_and_rows) - 2):
-        rows = [row for _, row in timestamps_and_rows[j:j+3]]
-        rows.sort()
-        if rows[1] == rows[0] + 1 and rows[2] == rows[0] + 2:
-            if not event_idxs or j - event_idxs[-1] >= 2:
-                event_idxs.append(j)
-
-    duration = timestamps_and_rows[-1][0]
-
-    data_for_block = []
-    for j in event_idxs:
-        rows = [row for _, row in timestamps_and_rows[j:j+3]]
-        data_for_block.append({
-            "timestamp_ns": timestamps_and_rows[j][0],
-            "act_number": j,
-            "rows": rows
+# The events of every block are written right away, only the totals are kept.
+with events.EventWriter(out_file) as writer:
+    for i, (block_file, block_id) in enumerate(block_files):
+        print(block_file)
+        trace = store.block(block_id) if store is not None else ddr5.read_trace(block_file)
+        timestamps_ns = trace.time_sec() * 1e9
+        is_act = trace.is_cmd("act")
+
+        t_start = timestamps_ns[0]
+
+        act_timestamps = np.rint(timestamps_ns[is_act] - t_start).astype(np.int64)
+        act_rows = np.asarray(trace.row[is_act])
+        event_idxs = events.find_events(act_rows)
+
+        duration = int(act_timestamps[-1])
+
+        data_for_block = []
+        for j, timestamp in zip(event_idxs.tolist(), act_timestamps[event_idxs].tolist()):
+            data_for_block.append({
+                "timestamp_ns": timestamp,
+                "act_number": j,
+                "rows": act_rows[j:j+3].tolist()
+            })
+        writer.add({
+            "file": str(block_file),
+            "duration_ns": duration,
+            "num_acts": len(act_rows),
+            "events": data_for_block
         })
-    json_data.append({
-        "file": str(block_file),
-        "duration_ns": duration,
-        "num_acts": len(timestamps_and_rows),
-        "events": data_for_block
-    })
 
-    total_acts += len(timestamps_and_rows)
-    num_events += len(data_for_block)
+        total_acts += len(act_rows)
+        num_events += len(data_for_block)
 
-    print(f"[+] Extracted {len(data_for_block)} mitigation events from block '{block_file}'.")
+        print(f"[+] Extracted {len(data_for_block)} mitigation events from block '{block_file}'.")
 
-with out_file.open("w") as f:
-    json.dump(json_data, f, indent=4)
-print(f"[+] Write mitigation event data to '{out_file}'.")
+print(f"[+] Write mitigation event data to '{out_file}' (summary per block: '{events.summary_path(out_file)}').")
 print(f"[+] Summary: Found {num_events} mitigation events, analyzing {total_acts} ACTs.")
@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
-import json
-import math
+import argparse
 import statistics
 import sys
 from pathlib import Path
@@ -9,6 +8,9 @@ import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib.ticker import MultipleLocator, AutoMinorLocator
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from mcsee import binomial, events
+
 # ── LaTeX‐style settings ───────────────────────────────────────────────────────
 plt.rcParams.update({
     "text.usetex": False,
@@ -24,33 +26,50 @@ plt.rcParams.update({
 
 def main():
     # ── I/O setup ──────────────────────────────────────────────────────────────
-    in_file = Path(sys.argv[1])
-    out_file = Path(sys.argv[2]) if len(sys.argv) > 2 else Path("plot_intel_ptrr_distribution.pdf")
-
-    # ── Load JSON data ─────────────────────────────────────────────────────────
-    with in_file.open() as f:
-        data = json.load(f)
-
-    block_act_counts   = []
-    block_event_counts = []
-    for block in data:
-        block_act_counts.append(block["num_acts"])
-        block_event_counts.append(len(block["events"]))
-
-    num_blocks   = len(data)
+    parser = argparse.ArgumentParser(description="Plot the distribution of mitigation events per block and fit a binomial model.")
+    parser.add_argument("in_file", type=Path, help="mitigation_events.jsonl, its summary table, or a mitigation_events.json")
+    parser.add_argument("out_file", type=Path, nargs="?", default=Path("plot_intel_ptrr_distribution.pdf"))
+    parser.add_argument("--block-sizes", type=int, nargs="+",
+                        help="block sizes n to fit B(n, p) for (default: mean number of ACTs per block)")
+    parser.add_argument("--p-range", type=float, nargs=2, metavar=("MIN", "MAX"),
+                        help="range of p to fit (default: a factor of two around the observed event rate)")
+    parser.add_argument("--p-steps", type=int, default=1001, help="number of values of p to fit")
+    args = parser.parse_args()
+    in_file = args.in_file
+    out_file = args.out_file
+
+    # ── Load per-block summary ─────────────────────────────────────────────────
+    # Only the number of ACTs and events per block are needed, not the events themselves.
+    summary = events.read_summary(in_file)
+    block_act_counts   = summary.num_acts.tolist()
+    block_event_counts = summary.num_events.tolist()
+
+    num_blocks   = len(summary)
     total_events = sum(block_event_counts)
     total_acts   = sum(block_act_counts)
     p = total_events / total_acts
 
     # ── Compute distribution & binomial model ──────────────────────────────────
-    max_events = max(block_event_counts)
-    counts = np.zeros(max_events + 1, dtype=int)
-    for ev in block_event_counts:
-        counts[ev] += 1
+    counts = np.bincount(summary.num_events)
 
     x = np.arange(len(counts))
     n = round(statistics.mean(block_act_counts))
-    dist = np.array([math.comb(n, k) * (1-p)**(n-k) * p**k for k in x])
+    dist = binomial.pmf(x, n, p)
+
+    # ── Fit sweep over block sizes and p ───────────────────────────────────────
+    block_sizes = args.block_sizes or [n]
+    p_min, p_max = args.p_range or (p / 2, p * 2)
+    fit = binomial.fit(block_event_counts, block_sizes, np.linspace(p_min, p_max, args.p_steps))
+    plotted = binomial.fit(block_event_counts, [n], [p])
+    print(f"[+] {num_blocks} blocks, {total_events} events, {total_acts} ACTs: p = {p:.6f}")
+    print(f"[+] Plotted B({n}, {p:.6f}): log-likelihood = {plotted.log_likelihood[0, 0]:.2f}, "
+          f"chi2 = {plotted.chi2[0, 0]:.2f} ({plotted.dof} dof)")
+    for i, block_size in enumerate(fit.n):
+        j = np.argmax(fit.log_likelihood[i])
+        print(f"[+] n = {block_size}: MLE p = {fit.mle_p[i]:.6f}, best p on grid = {fit.p[j]:.6f} "
+              f"(log-likelihood = {fit.log_likelihood[i, j]:.2f}, chi2 = {fit.chi2[i, j]:.2f})")
+    best_n, best_p = fit.best()
+    print(f"[+] Best fit on grid: B({best_n}, {best_p:.6f})")
 
     # ── Figure sizing to 229.5 pt width, reduced margins ────────────────────────
     fig_width_pt = 229.5*1.05
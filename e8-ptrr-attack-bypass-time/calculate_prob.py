@@ -1,6 +1,11 @@
+import argparse
 import numpy as np
 import matplotlib.pyplot as plt
-import math
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from mcsee import bypass
 
 # Configure Matplotlib for LaTeX rendering and specific font
 plt.rcParams['text.usetex'] = True
@@ -10,42 +15,30 @@ plt.rcParams['font.family'] = 'serif'
 # If you face font issues, ensure LaTeX is correctly set up and fonts are accessible.
 # For example: plt.rcParams['font.serif'] = ['Latin Modern Roman'] + plt.rcParams['font.serif']
 
-# Define constants
-pth = 0.091 / 100 * 2
-
-# Time durations in seconds
-sec_in_a_week = 7 * 24 * 60 * 60
-sec_in_a_day = 24 * 60 * 60
-sec_in_an_hour = 60 * 60
-
-# Attack attempts
-attacks_in_a_week = sec_in_a_week / 0.032
-attacks_in_a_day = sec_in_a_day / 0.032
-attacks_in_an_hour = sec_in_an_hour / 0.032
+# The figure shows the first pTRR probability and tRC; the table holds the full grid.
+parser = argparse.ArgumentParser(description="Calculate the success probability of bypassing pTRR (Fig. 12).")
+parser.add_argument("--pth", type=float, nargs="+", default=[bypass.PTH],
+                    help="pTRR probabilities (for two aggressors) to evaluate")
+parser.add_argument("--trc-ns", type=float, nargs="+", default=[bypass.TRC_NS], help="tRC values to evaluate")
+parser.add_argument("--window-ms", type=float, default=bypass.REFRESH_WINDOW_MS, help="refresh window, i.e., duration of an attempt")
+parser.add_argument("--durations-sec", type=float, nargs="+", default=[],
+                    help="attack durations to evaluate in addition to 1 week, 1 day, and 1 hour")
+parser.add_argument("--table", type=Path, default=Path("attack_success.csv"), help="output table of the full grid")
+args = parser.parse_args()
 
 # Rowhammer threshold range
 # MATLAB's 1000:1000:30000 includes 30000, so np.arange needs stop+step
 RTH = np.arange(1000, 30001, 1000)
 
-# Initialize arrays
-psuccess_week = np.zeros_like(RTH, dtype=float)
-psuccess_day = np.zeros_like(RTH, dtype=float)
-psuccess_hour = np.zeros_like(RTH, dtype=float)
-
-# Loop for calculations
-for i, NRH in enumerate(RTH):
-    nfmax = math.floor((32000000 / 45 - NRH) / 2)
-    # MATLAB's 0:nfmax includes nfmax, so np.arange needs stop+1
-    nf = np.arange(0, nfmax + 1)
-
-    # Calculate psuccess (sum of a series)
-    term1 = (1 - pth/2)**(nf + NRH)
-    term2 = (pth/2)**nf
-    psuccess = np.sum(term1 * term2)
-
-    psuccess_week[i] = 1 - (1 - psuccess)**attacks_in_a_week
-    psuccess_day[i] = 1 - (1 - psuccess)**attacks_in_a_day
-    psuccess_hour[i] = 1 - (1 - psuccess)**attacks_in_an_hour
+# All combinations are evaluated at once with the closed form of the series (see mcsee/bypass.py).
+durations = [bypass.SEC_IN_A_WEEK, bypass.SEC_IN_A_DAY, bypass.SEC_IN_AN_HOUR] + args.durations_sec
+grid = bypass.evaluate(RTH, args.pth, args.trc_ns, durations, args.window_ms)
+bypass.write_table(args.table, grid)
+print(f"[+] Wrote {grid.p_success.size} grid points to '{args.table}'.")
+
+psuccess_week = grid.p_success[:, 0, 0, 0]
+psuccess_day = grid.p_success[:, 0, 0, 1]
+psuccess_hour = grid.p_success[:, 0, 0, 2]
 
 # --- Plotting ---
 # Constants for figure size to match MATLAB's export behavior
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import math
+import multiprocessing
+import os
+import sys
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from mcsee import bypass, events
+
+# Number of ACTs a mitigation event takes (the three consecutive rows refreshed by pTRR).
+EVENT_ACTS = 3
+# Number of aggressors the measured blocks alternate between. The thresholds (like nrh of the closed-form model in
+# mcsee/bypass.py) count the ACTs to one aggressor, so a run of r ACTs hammers each aggressor r // AGGRESSORS times.
+AGGRESSORS = 2
+# z-value of the 95% confidence intervals.
+Z_95 = 1.959963984540054
+
+
+# Per-block statistics of the mitigation process, all in ACTs.
+class BlockStats(NamedTuple):
+    num_acts: np.ndarray  # ACTs of the block
+    lead: np.ndarray      # ACTs before the first event (num_acts if there is none)
+    trail: np.ndarray     # ACTs after the last event (unused if there is none)
+    max_gap: np.ndarray   # longest run of ACTs between two events of the block (0 if there are less than two)
+    has_event: np.ndarray
+
+
+def read_block_stats(events_file: Path) -> BlockStats:
+    rows = []
+    for block in events.iter_blocks(events_file):
+        num_acts = block["num_acts"]
+        act_numbers = np.array([event["act_number"] for event in block["events"]], dtype=np.int64)
+        if len(act_numbers) == 0:
+            rows.append((num_acts, num_acts, 0, 0, False))
+            continue
+        gaps = np.diff(act_numbers) - EVENT_ACTS
+        rows.append((num_acts, act_numbers[0], num_acts - act_numbers[-1] - EVENT_ACTS, gaps.max(initial=0), True))
+    if not rows:
+        return BlockStats(*(np.empty(0, dtype=np.int64) for _ in range(4)), np.empty(0, dtype=bool))
+    columns = list(zip(*rows))
+    return BlockStats(*(np.array(column, dtype=np.int64) for column in columns[:4]), np.array(columns[4], dtype=bool))
+
+
+# Simulates `num_windows` refresh windows, each made up of `blocks_per_window` blocks drawn at random from the
+# measured ones, and returns how many windows contain a run without a mitigation event in which each aggressor gets
+# at least nrh ACTs, for every nrh in `thresholds`.
+def simulate_windows(stats: BlockStats, thresholds: np.ndarray, num_windows: int, blocks_per_window: int,
+                     seed: np.random.SeedSequence) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(len(stats.num_acts), size=(num_windows, blocks_per_window))
+
+    # Scan the blocks of all windows at once: `run` is the number of ACTs since the last event.
+    longest = np.zeros(num_windows, dtype=np.int64)
+    run = np.zeros(num_windows, dtype=np.int64)
+    for i in range(blocks_per_window):
+        b = blocks[:, i]
+        has_event = stats.has_event[b]
+        longest = np.maximum(longest, np.where(has_event, np.maximum(run + stats.lead[b], stats.max_gap[b]), 0))
+        run = np.where(has_event, stats.trail[b], run + stats.num_acts[b])
+    longest = np.maximum(longest, run)
+
+    per_aggressor = longest // AGGRESSORS
+    return (per_aggressor[:, np.newaxis] >= thresholds[np.newaxis, :]).sum(axis=0)
+
+
+def simulate_windows_task(task: tuple) -> np.ndarray:
+    return simulate_windows(*task)
+
+
+# Wilson score interval of a binomial proportion.
+def wilson_interval(successes: np.ndarray, trials: int, z: float = Z_95) -> tuple[np.ndarray, np.ndarray]:
+    p = successes / trials
+    denominator = 1 + z**2 / trials
+    center = (p + z**2 / (2 * trials)) / denominator
+    half_width = z * np.sqrt(p * (1 - p) / trials + z**2 / (4 * trials**2)) / denominator
+    return np.maximum(center - half_width, 0.0), np.minimum(center + half_width, 1.0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monte Carlo simulation of bypassing pTRR, replaying the mitigation "
+                                                 "events measured in E7.")
+    parser.add_argument("events_file", type=Path, help="mitigation_events.jsonl (or .json) written by extract_events.py")
+    parser.add_argument("--thresholds", type=int, nargs="+", default=list(range(1000, 30001, 1000)),
+                        help="Rowhammer thresholds to evaluate, in ACTs per aggressor")
+    parser.add_argument("--windows", type=int, default=1_000_000, help="number of simulated refresh windows")
+    parser.add_argument("--batch-size", type=int, default=10_000, help="number of windows simulated per task")
+    parser.add_argument("--trc-ns", type=float, default=bypass.TRC_NS)
+    parser.add_argument("--window-ms", type=float, default=bypass.REFRESH_WINDOW_MS)
+    parser.add_argument("--pth", type=float, default=bypass.PTH, help="pTRR probability of the closed-form model")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                        help="number of batches simulated in parallel (default: number of CPUs)")
+    parser.add_argument("--out", type=Path, default=Path("simulated_attack_success.csv"))
+    args = parser.parse_args()
+
+    stats = read_block_stats(args.events_file)
+    if len(stats.num_acts) == 0:
+        print(f"[-] '{args.events_file}' does not contain any blocks.")
+        sys.exit(1)
+    thresholds = np.array(args.thresholds, dtype=np.int64)
+    print(f"[+] Read {len(stats.num_acts)} blocks with {stats.num_acts.sum()} ACTs from '{args.events_file}'.")
+
+    # A refresh window is made up of as many measured blocks as ACTs fit into it.
+    acts_per_window = args.window_ms * 1e6 / args.trc_ns
+    blocks_per_window = max(1, round(acts_per_window / stats.num_acts.mean()))
+    print(f"[+] Simulating {args.windows} refresh windows of {blocks_per_window} blocks "
+          f"({blocks_per_window * stats.num_acts.mean():.0f} of {acts_per_window:.0f} ACTs).")
+
+    # All thresholds are evaluated on the same simulated windows.
+    num_tasks = math.ceil(args.windows / args.batch_size)
+    seeds = np.random.SeedSequence(args.seed).spawn(num_tasks)
+    tasks = [(stats, thresholds, min(args.batch_size, args.windows - i * args.batch_size), blocks_per_window, seed)
+             for i, seed in enumerate(seeds)]
+    successes = np.zeros(len(thresholds), dtype=np.int64)
+    with multiprocessing.Pool(max(1, min(args.jobs, num_tasks))) as pool:
+        for counts in pool.imap_unordered(simulate_windows_task, tasks):
+            successes += counts
+
+    p_attempt = successes / args.windows
+    p_low, p_high = wilson_interval(successes, args.windows)
+    closed_form = np.exp(bypass.log_attempt_probability(thresholds, args.pth, args.trc_ns, args.window_ms))
+    durations = {"week": bypass.SEC_IN_A_WEEK, "day": bypass.SEC_IN_A_DAY, "hour": bypass.SEC_IN_AN_HOUR}
+
+    with args.out.open("w", newline="") as f:
+        writer = csv.writer(f)
+        header = ["nrh", "windows", "successes", "p_attempt", "p_attempt_low", "p_attempt_high", "p_attempt_closed_form"]
+        for name in durations:
+            header += [f"p_success_{name}", f"p_success_{name}_low", f"p_success_{name}_high"]
+        writer.writerow(header)
+        for i, nrh in enumerate(thresholds.tolist()):
+            row = [nrh, args.windows, successes[i], p_attempt[i], p_low[i], p_high[i], closed_form[i]]
+            for duration in durations.values():
+                # The success probability is monotonic in p_attempt, so the interval carries over.
+                row += [bypass.success_probability(np.log(p), duration, args.window_ms) if p > 0 else 0.0
+                        for p in (p_attempt[i], p_low[i], p_high[i])]
+            writer.writerow(row)
+
+            print(f"    nrh = {nrh:5d}: p_attempt = {p_attempt[i]:.3e} [{p_low[i]:.3e}, {p_high[i]:.3e}], "
+                  f"closed form = {closed_form[i]:.3e}")
+    print(f"[+] Wrote simulated success probabilities to '{args.out}'.")
@@ -0,0 +1 @@
+"""Shared helpers for analyzing the command traces captured with McSee."""
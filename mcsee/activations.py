@@ -0,0 +1,81 @@
+"""ACT counts per bank or row, and selection of the most activated ones.
+
+The experiments identify the hammered bank or rows of a trace by counting the
+ACTs per address. Addresses are packed into one integer key per ACT with the
+pack_bank()/pack_bank_row() functions of the DDR4 and DDR5 readers, and
+histogram() counts all keys at once. Of several addresses with the same number
+of ACTs, the one activated first ranks higher, like with Counter.most_common().
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+
+def pack_key(fields, widths) -> np.ndarray:
+    """Concatenates the bits of `fields` (most significant first), each `widths[i]` bits wide, into int64 keys."""
+    key = np.int64(0)
+    for field, width in zip(fields, widths):
+        key = (key << width) | np.asarray(field, dtype=np.int64)
+    return key
+
+
+def unpack_key(key: int, widths) -> tuple[int, ...]:
+    """Inverse of pack_key() for a single key."""
+    fields = []
+    for width in reversed(widths):
+        fields.append(key & ((1 << width) - 1))
+        key >>= width
+    return tuple(reversed(fields))
+
+
+class Histogram(NamedTuple):
+    keys: np.ndarray    # unique keys, sorted
+    counts: np.ndarray  # number of ACTs to each key
+    first: np.ndarray   # position of the first ACT to each key
+    num_acts: int
+
+
+EMPTY = Histogram(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), 0)
+
+
+def histogram(keys: np.ndarray) -> Histogram:
+    """Counts the ACTs per key; positions are the indices into `keys`."""
+    keys = np.asarray(keys, dtype=np.int64)
+    if len(keys) and 0 <= keys.min() and keys.max() < len(keys):
+        # Dense keys (e.g., banks) are counted without sorting, which is about ten times faster than np.unique().
+        counts = np.bincount(keys)
+        first = np.full(len(counts), len(keys), dtype=np.int64)
+        np.minimum.at(first, keys, np.arange(len(keys)))
+        unique = np.flatnonzero(counts)
+        return Histogram(unique, counts[unique], first[unique], len(keys))
+    unique, first, counts = np.unique(keys, return_index=True, return_counts=True)
+    return Histogram(unique, counts, first.astype(np.int64), len(keys))
+
+
+def merge(a: Histogram, b: Histogram) -> Histogram:
+    """Merges two histograms whose positions are comparable, independently of the order of merging."""
+    keys, inverse = np.unique(np.concatenate((a.keys, b.keys)), return_inverse=True)
+    counts = np.bincount(inverse, weights=np.concatenate((a.counts, b.counts)), minlength=len(keys)).astype(np.int64)
+    first = np.full(len(keys), np.iinfo(np.int64).max)
+    np.minimum.at(first, inverse, np.concatenate((a.first, b.first)))
+    return Histogram(keys, counts, first, a.num_acts + b.num_acts)
+
+
+def ranked(histogram: Histogram) -> np.ndarray:
+    """Returns the indices of the keys in descending order of ACTs, ties in order of their first ACT.
+
+    Only `counts` and `first` are used, so any histogram-like tuple with these fields works.
+    """
+    return np.lexsort((histogram.first, -histogram.counts))
+
+
+def most_activated_two(histogram: Histogram) -> tuple[int, int, int]:
+    """Returns the most activated key with its number of ACTs, and the number of ACTs of the runner-up (0 if none)."""
+    counts = histogram.counts
+    if len(counts) < 2:
+        return int(histogram.keys[0]), int(counts[0]), 0
+    # argpartition instead of a full sort, the histograms of E5 have one key per row.
+    top_two = counts[np.argpartition(counts, len(counts) - 2)[-2:]]
+    first, second = int(top_two.max()), int(top_two.min())
+    candidates = np.flatnonzero(counts == first)
+    return int(histogram.keys[candidates[np.argmin(histogram.first[candidates])]]), first, second
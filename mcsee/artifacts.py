@@ -0,0 +1,114 @@
+"""Content-addressed bookkeeping for the files derived from a capture.
+
+Every processing stage (e.g., deglitching or decoding a capture) is identified by
+a key that hashes the contents of its input files, its parameters, the names of
+its output files, and the source code that produces them (the script and all of
+the mcsee package, see package_files()). A per-capture manifest
+(a JSON file next to the capture) records the key and the sizes of the outputs of
+every finished stage. A stage is only skipped if its recorded key matches and all
+of its outputs are still present, so changed inputs, parameters, or code, as well
+as files left behind by an interrupted run, cause the stage to be redone.
+
+Outputs are written through atomic_outputs(), which renames them into place only
+after the stage finished successfully.
+"""
+import contextlib
+import hashlib
+import json
+import os
+from typing import Iterator, Optional
+
+
+DIGEST_CHUNK_SIZE = 1 << 24
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(DIGEST_CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def package_files() -> list[str]:
+    """Returns the source files of the mcsee package, to be hashed along with a script as the code of its stages."""
+    head = os.path.dirname(os.path.abspath(__file__))
+    return sorted(os.path.join(head, name) for name in os.listdir(head) if name.endswith(".py"))
+
+
+def code_version(code_files: list[str]) -> str:
+    """Returns one digest of the contents of `code_files` (see package_files())."""
+    return hashlib.sha256(b''.join(file_digest(f).encode() for f in code_files)).hexdigest()
+
+
+def tmp_path(path: str) -> str:
+    # Only prefixes the name, such that derived names (e.g., ddr4.binary_path) map temporary files onto each other.
+    head, tail = os.path.split(path)
+    return os.path.join(head, f".tmp{os.getpid()}-{tail}")
+
+
+@contextlib.contextmanager
+def atomic_outputs(*paths: str) -> Iterator[list[str]]:
+    """Yields temporary paths for `paths` and moves them into place if the block completes without an exception."""
+    tmp_paths = [tmp_path(path) for path in paths]
+    try:
+        yield tmp_paths
+        for tmp, path in zip(tmp_paths, paths):
+            os.replace(tmp, path)
+    finally:
+        for tmp in tmp_paths:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+
+class Manifest:
+    """Records which stages of a capture are up to date, see the module docstring."""
+
+    def __init__(self, path: str, code_files: list[str]):
+        self.path = path
+        self.entries = {"digests": {}, "stages": {}}
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+        self.code_version = code_version(code_files)
+
+    def digest(self, path: str) -> str:
+        # Digests are reused as long as the size and modification time of the file do not change.
+        stat = os.stat(path)
+        entry = self.entries["digests"].get(os.path.basename(path))
+        if entry is None or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+            entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_digest(path)}
+            self.entries["digests"][os.path.basename(path)] = entry
+        return entry["sha256"]
+
+    def stage_key(self, stage: str, inputs: list[str], params: dict, outputs: list[str]) -> str:
+        description = {
+            "stage": stage,
+            "inputs": [self.digest(path) for path in inputs],
+            "params": params,
+            "outputs": [os.path.basename(path) for path in outputs],
+            "code": self.code_version,
+        }
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+    def is_fresh(self, stage: str, key: str) -> bool:
+        entry: Optional[dict] = self.entries["stages"].get(stage)
+        if entry is None or entry["key"] != key:
+            return False
+        head = os.path.dirname(self.path)
+        for name, size in entry["outputs"].items():
+            path = os.path.join(head, name)
+            if not os.path.isfile(path) or os.path.getsize(path) != size:
+                return False
+        return True
+
+    def record(self, stage: str, key: str, outputs: list[str]):
+        self.entries["stages"][stage] = {
+            "key": key,
+            "outputs": {os.path.basename(path): os.path.getsize(path) for path in outputs},
+        }
+        with atomic_outputs(self.path) as (tmp,):
+            with open(tmp, 'w') as f:
+                json.dump(self.entries, f, indent=4)
@@ -0,0 +1,90 @@
+"""Vectorized binomial model for the number of mitigation events per block.
+
+All functions evaluate the model for every number of events `k` and for all
+models (block size `n`, event probability `p`) at once: `n` and `p` are
+broadcast against each other, and the result has the shape
+`broadcast(n, p).shape + k.shape`. The probabilities are computed in the log
+domain from log-gamma values, so large block sizes (e.g., n = 8192) neither
+need big integers nor overflow.
+"""
+import functools
+import math
+from typing import NamedTuple
+
+import numpy as np
+
+
+@functools.lru_cache(maxsize=None)
+def _log_factorials(n_max: int) -> np.ndarray:
+    # log(i!) = lgamma(i + 1) for i = 0, ..., n_max
+    return np.array([math.lgamma(i + 1) for i in range(n_max + 1)])
+
+
+def log_pmf(k, n, p) -> np.ndarray:
+    """Returns log P[X = k] for X ~ B(n, p); -inf if k is not in [0, n]."""
+    k = np.asarray(k, dtype=np.int64)
+    n, p = np.broadcast_arrays(np.asarray(n, dtype=np.int64), np.asarray(p, dtype=np.float64))
+    n, p = n.reshape(n.shape + (1,) * k.ndim), p.reshape(p.shape + (1,) * k.ndim)
+
+    log_fact = _log_factorials(int(n.max(initial=0)))
+    valid = (k >= 0) & (k <= n)
+    k_valid = np.where(valid, k, 0)
+    log_binom = log_fact[n] - log_fact[k_valid] - log_fact[n - k_valid]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # 0 * log(0) is 0, i.e., P[X = 0] = 1 for p = 0 and P[X = n] = 1 for p = 1.
+        successes = np.where(k_valid == 0, 0.0, k_valid * np.log(p))
+        failures = np.where(n - k_valid == 0, 0.0, (n - k_valid) * np.log1p(-p))
+    return np.where(valid, log_binom + successes + failures, -np.inf)
+
+
+def pmf(k, n, p) -> np.ndarray:
+    """Returns P[X = k] for X ~ B(n, p)."""
+    return np.exp(log_pmf(k, n, p))
+
+
+def cdf(k, n, p) -> np.ndarray:
+    """Returns P[X <= k] for X ~ B(n, p)."""
+    k = np.asarray(k, dtype=np.int64)
+    j = np.arange(max(int(k.max(initial=0)), 0) + 1)
+    cumulative = np.minimum(np.cumsum(pmf(j, n, p), axis=-1), 1.0)
+    return np.where(k >= 0, cumulative[..., np.clip(k, 0, None)], 0.0)
+
+
+class Fit(NamedTuple):
+    n: np.ndarray               # block sizes of the grid
+    p: np.ndarray               # event probabilities of the grid
+    log_likelihood: np.ndarray  # (len(n), len(p)), log-likelihood of the observed event counts
+    chi2: np.ndarray            # (len(n), len(p)), Pearson's chi-squared statistic of the histogram
+    dof: int                    # degrees of freedom of chi2
+    mle_p: np.ndarray           # maximum-likelihood p for each block size, in closed form
+
+    def best(self) -> tuple[int, float]:
+        """Returns the (n, p) of the grid with the highest likelihood."""
+        i, j = np.unravel_index(np.argmax(self.log_likelihood), self.log_likelihood.shape)
+        return int(self.n[i]), float(self.p[j])
+
+
+def fit(event_counts, n_values, p_values) -> Fit:
+    """Evaluates B(n, p) for every n in `n_values` and p in `p_values` against the per-block `event_counts`."""
+    event_counts = np.asarray(event_counts, dtype=np.int64)
+    n = np.asarray(n_values, dtype=np.int64)[:, np.newaxis]
+    p = np.asarray(p_values, dtype=np.float64)[np.newaxis, :]
+
+    observed = np.bincount(event_counts)
+    k = np.arange(len(observed))
+    log_probs = log_pmf(k, n, p)
+    with np.errstate(invalid="ignore"):
+        # Unobserved k do not contribute, even if they are impossible under the model.
+        log_likelihood = np.sum(np.where(observed > 0, observed * log_probs, 0.0), axis=-1)
+
+    # The last bin collects all k >= max(event_counts), such that the expected counts sum up to the number of blocks.
+    expected = len(event_counts) * np.exp(log_probs)
+    expected[..., -1] = len(event_counts) * (1.0 - cdf(len(observed) - 2, n, p))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = np.where(expected > 0, (observed - expected) ** 2 / expected, np.where(observed > 0, np.inf, 0.0))
+    chi2 = terms.sum(axis=-1)
+    # One degree of freedom is lost to the number of blocks, and one to the estimated p.
+    dof = max(len(observed) - 2, 1)
+
+    mle_p = event_counts.mean() / n[:, 0] if len(event_counts) else np.full(n.shape[0], np.nan)
+    return Fit(n[:, 0], p[0], log_likelihood, chi2, dof, mle_p)
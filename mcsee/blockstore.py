@@ -0,0 +1,165 @@
+"""Single-file store for the hammering blocks cut out of decoded DDR5 traces.
+
+Instead of one small CSV file per block, all blocks of a run are stored in one
+file: the commands of all blocks as the packed columns of ddr5.Trace, followed by
+an index with one entry (iteration, trace, block, start, end) per block, where
+[start, end) is the block's range in the columns. BlockStore memory-maps the file,
+so every block is a zero-copy slice of the columns.
+
+File layout: an 8-byte magic, the length of a JSON header as uint64, the JSON
+header itself, the columns, and the index, each aligned to ddr5.COLUMN_ALIGNMENT.
+"""
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+from mcsee import artifacts, ddr5
+
+
+STORE_MAGIC = b"MCSBLKS\x02"
+STORE_NAME = "blocks.store"
+
+INDEX_DTYPE = np.dtype([
+    ("iteration", "<u4"),  # index into BlockStore.iterations
+    ("trace", "<u4"),      # index into BlockStore.traces
+    ("block", "<u4"),      # number of the block within its trace (as in block_NNN.csv)
+    ("start", "<i8"),
+    ("end", "<i8"),
+])
+
+
+def _align(pos: int) -> int:
+    return -(-pos // ddr5.COLUMN_ALIGNMENT) * ddr5.COLUMN_ALIGNMENT
+
+
+class BlockStoreWriter:
+    """Appends blocks to a new store; the store is moved into place by close()."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        # Temporary names are unique per process, such that concurrent writers of the same store do not collide.
+        self.tmp_path = Path(artifacts.tmp_path(str(self.path)))
+        self.parts = {name: open(artifacts.tmp_path(f"{self.path}.{name}.part"), "wb") for name, _ in ddr5._COLUMNS}
+        self.num_cmds = 0
+        self.index = []
+        self.iterations = []
+        self.traces = []
+        self.cmd_names = list(ddr5.CMD_NAMES)
+        self.widths = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._remove_parts()
+
+    def _id(self, names: list, name: str) -> int:
+        if name not in names:
+            names.append(name)
+        return names.index(name)
+
+    def add(self, iteration: str, trace_name: str, block: int, trace: ddr5.Trace, idxs: np.ndarray):
+        """Appends the commands at `idxs` of `trace` as block number `block` of `trace_name` in `iteration`."""
+        # Command codes are per trace, map them onto the codes of the store.
+        codes = np.array([self._id(self.cmd_names, name) for name in trace.cmd_names], dtype=np.uint8)
+        for name, dtype in ddr5._COLUMNS:
+            values = codes[trace.cmd[idxs]] if name == "cmd" else getattr(trace, name)[idxs]
+            self.parts[name].write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+        for name, width in trace.widths.items():
+            self.widths[name] = max(self.widths.get(name, 0), width)
+
+        self.index.append((self._id(self.iterations, iteration), self._id(self.traces, trace_name), block,
+                           self.num_cmds, self.num_cmds + len(idxs)))
+        self.num_cmds += len(idxs)
+
+    def close(self):
+        for part in self.parts.values():
+            part.close()
+        header = json.dumps({
+            "num_cmds": self.num_cmds,
+            "num_blocks": len(self.index),
+            "cmd_names": self.cmd_names,
+            "widths": self.widths,
+            "iterations": self.iterations,
+            "traces": self.traces,
+        }).encode()
+        with self.tmp_path.open("wb") as f:
+            f.write(STORE_MAGIC)
+            f.write(np.uint64(len(header)).tobytes())
+            f.write(header)
+            for name, _ in ddr5._COLUMNS:
+                f.write(b"\0" * (_align(f.tell()) - f.tell()))
+                with open(self.parts[name].name, "rb") as part:
+                    shutil.copyfileobj(part, f)
+            f.write(b"\0" * (_align(f.tell()) - f.tell()))
+            f.write(np.array(self.index, dtype=INDEX_DTYPE).tobytes())
+        os.replace(self.tmp_path, self.path)
+        self._remove_parts()
+
+    def _remove_parts(self):
+        for part in self.parts.values():
+            part.close()
+            Path(part.name).unlink(missing_ok=True)
+        self.tmp_path.unlink(missing_ok=True)
+
+
+class BlockStore:
+    """Read-only, memory-mapped view of a store written by BlockStoreWriter."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with self.path.open("rb") as f:
+            if f.read(len(STORE_MAGIC)) != STORE_MAGIC:
+                raise ValueError(f"'{self.path}' is not a block store")
+            header_len = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+            header = json.loads(f.read(header_len))
+        self.iterations = header["iterations"]
+        self.traces = header["traces"]
+
+        num_cmds = header["num_cmds"]
+        pos = len(STORE_MAGIC) + 8 + header_len
+        columns = {}
+        for name, dtype in ddr5._COLUMNS:
+            pos = _align(pos)
+            columns[name] = self._map(dtype, pos, num_cmds)
+            pos += dtype.itemsize * num_cmds
+        self.commands = ddr5.Trace(**columns, cmd_names=tuple(header["cmd_names"]), widths=header["widths"])
+        self.index = self._map(INDEX_DTYPE, _align(pos), header["num_blocks"])
+        self._ids = None
+
+    def _map(self, dtype: np.dtype, offset: int, length: int) -> np.ndarray:
+        if length == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self.path, dtype=dtype, mode="r", offset=offset, shape=(length,))
+
+    def __len__(self):
+        return len(self.index)
+
+    def block(self, block_id: int) -> ddr5.Trace:
+        """Returns the commands of the block with index entry `block_id` as slices of the memory-mapped columns."""
+        start, end = int(self.index[block_id]["start"]), int(self.index[block_id]["end"])
+        columns = {name: getattr(self.commands, name)[start:end] for name, _ in ddr5._COLUMNS}
+        return ddr5.Trace(**columns, cmd_names=self.commands.cmd_names, widths=self.commands.widths)
+
+    def name(self, block_id: int) -> tuple[str, str, int]:
+        """Returns (iteration, trace, block number) of the block with index entry `block_id`."""
+        entry = self.index[block_id]
+        return self.iterations[entry["iteration"]], self.traces[entry["trace"]], int(entry["block"])
+
+    def find(self, iteration: str, trace_name: str, block: int) -> int:
+        """Returns the index entry of a block, as identified by the names of its block_NNN.csv file."""
+        if self._ids is None:
+            # Built on the first lookup: (iteration, trace, block number) -> index entry.
+            names = zip((self.iterations[i] for i in self.index["iteration"].tolist()),
+                        (self.traces[i] for i in self.index["trace"].tolist()), self.index["block"].tolist())
+            self._ids = {name: block_id for block_id, name in enumerate(names)}
+        try:
+            return self._ids[(iteration, trace_name, block)]
+        except KeyError:
+            raise KeyError(f"No block {block} of trace '{trace_name}' in '{iteration}'") from None
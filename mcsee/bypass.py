@@ -0,0 +1,86 @@
+"""Closed-form success probability of bypassing pTRR (E8).
+
+Following HiRA (Yağlikçi et al., §9.1.2), an attack attempt hammers a row
+within one refresh window. It succeeds if the aggressor reaches `nrh` ACTs
+without a pTRR refresh, where every ACT triggers a refresh of the aggressor
+with probability `pth / 2`. The attempt may absorb `nf` refreshes of the
+other aggressor, each costing two ACTs, so
+
+    P[attempt] = sum_{nf=0}^{M} (1 - q)^(nf + nrh) q^nf,   q = pth / 2,
+    M = floor((window / tRC - nrh) / 2).
+
+This is a geometric series with ratio r = (1 - q) q, i.e.,
+
+    P[attempt] = (1 - q)^nrh (1 - r^(M + 1)) / (1 - r),
+
+which is evaluated in log space with log1p/expm1, so probabilities far below
+the double precision of 1 - P stay accurate. An attack of a given duration
+consists of duration / window independent attempts.
+"""
+import csv
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+
+PTH = 0.091 / 100 * 2      # pTRR probability of Intel's pTRR (E7), for two aggressors
+TRC_NS = 45                # DDR5 tRC
+REFRESH_WINDOW_MS = 32     # DDR5 refresh window
+SEC_IN_AN_HOUR = 60 * 60
+SEC_IN_A_DAY = 24 * SEC_IN_AN_HOUR
+SEC_IN_A_WEEK = 7 * SEC_IN_A_DAY
+
+TABLE_FIELDNAMES = ["nrh", "pth", "trc_ns", "window_ms", "duration_sec", "log_p_attempt", "p_success"]
+
+
+def log_attempt_probability(nrh, pth=PTH, trc_ns=TRC_NS, window_ms=REFRESH_WINDOW_MS) -> np.ndarray:
+    """Returns the natural log of the success probability of a single attempt; -inf if it cannot succeed."""
+    nrh, pth, trc_ns, window_ms = np.broadcast_arrays(np.asarray(nrh, dtype=np.float64), pth, trc_ns, window_ms)
+    q = pth / 2
+    log_r = np.log1p(-q) + np.log(q)
+    num_terms = np.floor((window_ms * 1e6 / trc_ns - nrh) / 2) + 1
+    with np.errstate(divide="ignore", over="ignore", invalid="ignore"):
+        log_p = nrh * np.log1p(-q) + np.log1p(-np.exp(num_terms * log_r)) - np.log1p(-np.exp(log_r))
+    # An attempt needs nrh ACTs within the refresh window.
+    return np.where(num_terms > 0, log_p, -np.inf)
+
+
+def success_probability(log_p_attempt, duration_sec, window_ms=REFRESH_WINDOW_MS) -> np.ndarray:
+    """Returns the probability that at least one of the attempts within `duration_sec` succeeds."""
+    attempts = np.asarray(duration_sec, dtype=np.float64) / (np.asarray(window_ms, dtype=np.float64) / 1e3)
+    # 1 - (1 - P[attempt])^attempts
+    with np.errstate(divide="ignore"):
+        return -np.expm1(attempts * np.log1p(-np.exp(log_p_attempt)))
+
+
+class Grid(NamedTuple):
+    nrh: np.ndarray
+    pth: np.ndarray
+    trc_ns: np.ndarray
+    duration_sec: np.ndarray
+    window_ms: float
+    log_p_attempt: np.ndarray  # (len(nrh), len(pth), len(trc_ns))
+    p_success: np.ndarray      # (len(nrh), len(pth), len(trc_ns), len(duration_sec))
+
+
+def evaluate(nrh, pth=(PTH,), trc_ns=(TRC_NS,), duration_sec=(SEC_IN_AN_HOUR,),
+             window_ms=REFRESH_WINDOW_MS) -> Grid:
+    """Evaluates every combination of thresholds, pTRR probabilities, tRCs, and attack durations at once."""
+    nrh, pth, trc_ns, duration_sec = (np.atleast_1d(np.asarray(v, dtype=np.float64))
+                                      for v in (nrh, pth, trc_ns, duration_sec))
+    log_p = log_attempt_probability(nrh[:, None, None], pth[None, :, None], trc_ns[None, None, :], window_ms)
+    p_success = success_probability(log_p[..., None], duration_sec, window_ms)
+    return Grid(nrh, pth, trc_ns, duration_sec, window_ms, log_p, p_success)
+
+
+def write_table(path: Path, grid: Grid):
+    """Writes one row per grid point, in the order of Grid.p_success."""
+    with Path(path).open("w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(TABLE_FIELDNAMES)
+        for idx in np.ndindex(grid.p_success.shape):
+            i, j, k, d = idx
+            writer.writerow([f"{grid.nrh[i]:g}", repr(float(grid.pth[j])), f"{grid.trc_ns[k]:g}", f"{grid.window_ms:g}",
+                             f"{grid.duration_sec[d]:g}", repr(float(grid.log_p_attempt[i, j, k])),
+                             repr(float(grid.p_success[idx]))])
@@ -0,0 +1,360 @@
+"""Vectorized deglitcher and decoder for DDR4 command/address pin captures.
+
+This is the simple decoder used by the E2 (Sledgehammer) and E4 (RowPress)
+analyses: it only distinguishes REF, PRE, ACT and RD commands. The samples are
+loaded as integer arrays and classified with a lookup table; only the stateful
+ACT->PRE pairing runs in Python, and it does so over the (much smaller) array of
+decoded commands.
+
+Decoded commands are written as text (`_cmd.csv`) and, optionally, as a binary
+`_cmd.npy` file holding a memory-mappable structured array (COMMAND_DTYPE).
+
+Raw captures are first deglitched, i.e., reduced to the samples whose pin values
+are stable for more than `threshold` consecutive samples. This is done in
+fixed-size chunks so that memory usage does not depend on the capture size.
+"""
+import itertools
+import os
+from typing import Callable, Iterator, NamedTuple, Optional, TextIO
+
+import numpy as np
+
+from mcsee import activations
+
+
+CMD_NONE = 0
+CMD_REF = 1
+CMD_PRE = 2
+CMD_ACT = 3
+CMD_RD = 4
+
+# Pins forming the row address (ra=...) and column address (col=...), MSB first.
+ROW_PINS = ("a16", "a15", "a14", "a13", "a7", "a6", "a5", "a4", "a3", "a2", "a1", "a0")
+COL_PINS = ("a7", "a6", "a5", "a4", "a3", "a2", "a1", "a0")
+
+# Widths of the <bg, bk, row> keys of pack_bank_row().
+KEY_WIDTHS = (2, 2, len(ROW_PINS))
+
+# Command code for each value of the pins (ACT, A16, A15, A14), in this bit order.
+#   REF: ACT=H, A16=L, A15=L, A14=H
+#   PRE: ACT=H, A16=L, A15=H, A14=L
+#   ACT: ACT=L
+#   RD:  ACT=H, A16=H, A15=L, A14=H
+_CMD_LUT = np.full(16, CMD_NONE, dtype=np.uint8)
+_CMD_LUT[0b0101] = CMD_REF
+_CMD_LUT[0b0110] = CMD_PRE
+_CMD_LUT[0b1000:] = CMD_ACT
+_CMD_LUT[0b0001] = CMD_RD
+
+# Record layout of the binary `_cmd.npy` traces.
+COMMAND_DTYPE = np.dtype([
+    ("time", "<f8"),     # in seconds
+    ("cmd", "u1"),       # one of the CMD_* codes
+    ("bg", "u1"),
+    ("bk", "u1"),
+    ("row", "<u4"),      # only meaningful for ACT
+    ("col", "<u2"),      # only meaningful for RD
+    ("tras_ns", "<f8"),  # ACT->PRE duration, only meaningful for PRE (NaN otherwise)
+])
+
+_CMD_BY_NAME = {"REF": CMD_REF, "PRE": CMD_PRE, "ACT": CMD_ACT, "RD": CMD_RD}
+
+# Columns that are ignored when comparing consecutive samples.
+UNSTABLE_COLUMNS = ("Time", "clk")
+
+# Number of raw samples that are processed at once by deglitch().
+DEGLITCH_CHUNK_SIZE = 1 << 16
+
+# tRAS bounds (in ns) outside of which a warning is written to the trace.
+TRAS_MIN_NS = 31.8
+TRAS_MAX_NS = 9 * 7800
+
+
+class Samples(NamedTuple):
+    fieldnames: list[str]  # pin names, i.e., all columns except 'Time'
+    time: np.ndarray       # float64, in seconds
+    pins: np.ndarray       # uint8, one column per entry in fieldnames
+
+    def pin(self, name: str) -> np.ndarray:
+        return self.pins[:, self.fieldnames.index(name)]
+
+
+class Commands(NamedTuple):
+    time: np.ndarray  # float64, in seconds
+    cmd: np.ndarray   # uint8, one of the CMD_* codes
+    bg: np.ndarray    # uint8
+    bk: np.ndarray    # uint8
+    row: np.ndarray   # uint32, bits of ROW_PINS (only meaningful for ACT)
+    col: np.ndarray   # uint16, bits of COL_PINS (only meaningful for RD)
+
+
+def read_header(filename: str) -> list[str]:
+    with open(filename, newline='\n') as f:
+        return f.readline().rstrip('\r\n').split(',')
+
+
+def _to_samples(header: list[str], values: np.ndarray) -> Samples:
+    if values.size == 0:
+        values = np.empty((0, len(header)))
+    time_idx = header.index('Time')
+    fieldnames = [name for name in header if name != 'Time']
+    time = values[:, time_idx]
+    pins = np.delete(values, time_idx, axis=1).astype(np.uint8)
+    return Samples(fieldnames, time, pins)
+
+
+def read_samples(filename: str) -> Samples:
+    values = np.loadtxt(filename, delimiter=',', skiprows=1, ndmin=2)
+    return _to_samples(read_header(filename), values)
+
+
+def deglitch(filename: str, threshold: int = 4, candidate_offset: int = 0, skip_idle: bool = False,
+             chunk_size: int = DEGLITCH_CHUNK_SIZE,
+             on_chunk: Optional[Callable[[int], None]] = None) -> Iterator[list[str]]:
+    """Yields, chunk by chunk, the raw lines of the samples that survive deglitching.
+
+    A run of identical samples (ignoring UNSTABLE_COLUMNS) is kept if it is longer
+    than `threshold` samples, and is represented by its sample at index
+    `candidate_offset`. The run that is still open at the end of the file is
+    dropped. With `skip_idle`, samples whose pins are all zero are removed before
+    looking for runs. `on_chunk` is called with the number of characters read.
+    """
+    with open(filename, newline='\n') as f:
+        header = f.readline().rstrip('\r\n').split(',')
+        key_cols = [i for i, name in enumerate(header) if name not in UNSTABLE_COLUMNS]
+
+        # State of the run that is still open at the end of the previous chunk.
+        run_len = 0
+        run_key = None
+        candidate = None
+
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if not lines:
+                break
+            if on_chunk is not None:
+                on_chunk(sum(map(len, lines)))
+
+            keys = np.loadtxt(lines, delimiter=',', usecols=key_cols, dtype=np.uint8, comments=None, ndmin=2)
+            if len(keys) != len(lines):
+                # np.loadtxt skips empty lines, so drop them to keep the indices aligned.
+                lines = [line for line in lines if line.strip()]
+            idxs = np.flatnonzero(keys.any(axis=1)) if skip_idle else np.arange(len(keys))
+            keys = keys[idxs]
+            n = len(keys)
+            if n == 0:
+                continue
+
+            def line_at(i):
+                return lines[idxs[i]].rstrip('\r\n') + '\n'
+
+            change = np.empty(n, dtype=bool)
+            change[0] = run_len == 0 or bool((keys[0] != run_key).any())
+            np.any(keys[1:] != keys[:-1], axis=1, out=change[1:])
+            starts = np.flatnonzero(change)
+
+            # Extend the open run by the samples at the beginning of this chunk.
+            prefix = starts[0] if len(starts) else n
+            if candidate is None and run_len <= candidate_offset < run_len + prefix:
+                candidate = line_at(candidate_offset - run_len)
+            run_len += prefix
+            run_key = keys[-1].copy()
+            if not len(starts):
+                yield []
+                continue
+
+            survivors = []
+            if run_len > threshold and candidate is not None:
+                survivors.append(candidate)
+            run_lengths = np.diff(starts)
+            for start in starts[:-1][run_lengths > max(threshold, candidate_offset)]:
+                survivors.append(line_at(start + candidate_offset))
+
+            run_len = n - starts[-1]
+            candidate = line_at(starts[-1] + candidate_offset) if run_len > candidate_offset else None
+            yield survivors
+
+
+def deglitch_samples(filename: str, threshold: int = 4, candidate_offset: int = 0, skip_idle: bool = False,
+                     dupfree_file: Optional[TextIO] = None,
+                     on_chunk: Optional[Callable[[int], None]] = None) -> Samples:
+    """Deglitches a raw capture (see deglitch()) and returns the surviving samples.
+
+    The samples are kept in memory instead of going through an intermediate
+    `_dupfree.csv` file; they are only written to `dupfree_file` if one is given.
+    """
+    header = read_header(filename)
+    if dupfree_file is not None:
+        dupfree_file.write(','.join(header) + '\n')
+
+    chunks = []
+    for lines in deglitch(filename, threshold, candidate_offset, skip_idle, on_chunk=on_chunk):
+        if not lines:
+            continue
+        if dupfree_file is not None:
+            dupfree_file.writelines(lines)
+        chunks.append(np.loadtxt(lines, delimiter=',', comments=None, ndmin=2))
+
+    values = np.concatenate(chunks) if chunks else np.empty((0, len(header)))
+    return _to_samples(header, values)
+
+
+def pack_bits(samples: Samples, names: tuple) -> np.ndarray:
+    bits = np.zeros(len(samples.time), dtype=np.uint32)
+    for name in names:
+        bits = (bits << 1) | samples.pin(name)
+    return bits
+
+
+def decode(samples: Samples) -> Commands:
+    lut_idx = pack_bits(samples, ("act", "a16", "a15", "a14"))
+    cmd = _CMD_LUT[lut_idx]
+    keep = np.flatnonzero(cmd != CMD_NONE)
+
+    return Commands(
+        time=samples.time[keep],
+        cmd=cmd[keep],
+        bg=pack_bits(samples, ("bg1", "bg0"))[keep].astype(np.uint8),
+        bk=pack_bits(samples, ("ba1", "ba0"))[keep].astype(np.uint8),
+        row=pack_bits(samples, ROW_PINS)[keep],
+        col=pack_bits(samples, COL_PINS)[keep].astype(np.uint16),
+    )
+
+
+def write_commands(commands: Commands, outfile: TextIO) -> tuple[np.ndarray, np.ndarray]:
+    """Writes the decoded commands in the textual `_cmd.csv` format.
+
+    Every PRE is paired with the earliest ACT to its bank since the last PRE or
+    REF. Returns, per command, the ACT->PRE duration in ns (NaN if the bank was
+    not open) and the row that the ACT opened (-1 if the bank was not open).
+    """
+    num_cmds = len(commands.cmd)
+    tras_ns = np.full(num_cmds, np.nan)
+    open_row = np.full(num_cmds, -1, dtype=np.int64)
+
+    bank_names = [f"bg={bank >> 2:02b} bk={bank & 0b11:02b}" for bank in range(16)]
+    bank_act_time = [None] * 16
+    bank_act_row = [-1] * 16
+
+    lines = []
+    banks = ((commands.bg.astype(np.intp) << 2) | commands.bk).tolist()
+    for i, (t, cmd, bank, row, col) in enumerate(zip(commands.time.tolist(), commands.cmd.tolist(), banks,
+                                                     commands.row.tolist(), commands.col.tolist())):
+        if cmd == CMD_REF:
+            lines.append(f"{t:.12E} REF\n")
+            bank_act_time = [None] * 16
+            bank_act_row = [-1] * 16
+
+        elif cmd == CMD_PRE:
+            t_start = bank_act_time[bank]
+            if t_start is not None:
+                t_ns = (t - t_start if t > t_start else t_start - t) * 10**9
+                if t_ns < TRAS_MIN_NS:
+                    lines.append(f"WARNING: tRAS duration is too short: {t_ns}\n")
+                elif t_ns > TRAS_MAX_NS:
+                    lines.append(f"WARNING: tRAS duration is too long: {t_ns}\n")
+                lines.append(f"{t:.12E} PRE {bank_names[bank]} since={t_ns:.3f}ns\n")
+                tras_ns[i] = t_ns
+                open_row[i] = bank_act_row[bank]
+            else:
+                lines.append(f"{t:.12E} PRE {bank_names[bank]}\n")
+            bank_act_time[bank] = None
+            bank_act_row[bank] = -1
+
+        elif cmd == CMD_ACT:
+            lines.append(f"{t:.12E} ACT {bank_names[bank]} ra={row:012b}\n")
+            if bank_act_time[bank] is None:
+                bank_act_time[bank] = t
+                bank_act_row[bank] = row
+            else:
+                lines.append(f"ERROR: ACT without prior PRE for {bank_names[bank]}\n")
+
+        elif cmd == CMD_RD:
+            lines.append(f"{t:.12E} RD  {bank_names[bank]} col={col:08b}\n")
+
+    outfile.write(''.join(lines))
+    return tras_ns, open_row
+
+
+def binary_path(cmd_filename: str) -> str:
+    return os.path.splitext(cmd_filename)[0] + '.npy'
+
+
+def remove_stale_binary(cmd_filename: str, outputs: list[str]):
+    """Removes the binary trace of `cmd_filename` unless it is among the `outputs` about to be written.
+
+    read_commands() prefers the binary trace, so one left over from an earlier run would shadow the new `_cmd.csv`.
+    """
+    path = binary_path(cmd_filename)
+    if path not in outputs and os.path.isfile(path):
+        os.remove(path)
+
+
+def save_commands(filename: str, commands: Commands, tras_ns: np.ndarray):
+    # Only store the fields that are also part of the textual trace, all others are zero.
+    trace = np.zeros(len(commands.cmd), dtype=COMMAND_DTYPE)
+    has_bank = commands.cmd != CMD_REF
+    trace["time"] = commands.time
+    trace["cmd"] = commands.cmd
+    trace["bg"][has_bank] = commands.bg[has_bank]
+    trace["bk"][has_bank] = commands.bk[has_bank]
+    trace["row"] = np.where(commands.cmd == CMD_ACT, commands.row, 0)
+    trace["col"] = np.where(commands.cmd == CMD_RD, commands.col, 0)
+    trace["tras_ns"] = tras_ns
+    np.save(filename, trace)
+
+
+def decode_to_file(samples: Samples, cmd_filename: str, write_binary: bool = False) -> tuple[Commands, np.ndarray, np.ndarray]:
+    """Decodes the samples and writes the `_cmd.csv` trace (and its binary `_cmd.npy` if `write_binary` is set).
+
+    Returns the commands along with the tRAS durations and open rows of write_commands().
+    """
+    commands = decode(samples)
+    with open(cmd_filename, 'w') as outfile:
+        tras_ns, open_row = write_commands(commands, outfile)
+    if write_binary:
+        save_commands(binary_path(cmd_filename), commands, tras_ns)
+    return commands, tras_ns, open_row
+
+
+def read_commands(cmd_filename: str) -> np.ndarray:
+    """Loads a decoded trace as a COMMAND_DTYPE array.
+
+    The binary `_cmd.npy` file next to `cmd_filename` is memory-mapped if it
+    exists; otherwise, the textual `_cmd.csv` file is parsed.
+    """
+    if os.path.isfile(binary_path(cmd_filename)):
+        return np.load(binary_path(cmd_filename), mmap_mode='r')
+
+    records = []
+    with open(cmd_filename) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 2 or parts[0] in ("WARNING:", "ERROR:"):
+                continue
+            fields = dict(part.split('=') for part in parts[2:])
+            since = fields.get("since")
+            records.append((
+                float(parts[0]),
+                _CMD_BY_NAME[parts[1]],
+                int(fields.get("bg", "0"), 2),
+                int(fields.get("bk", "0"), 2),
+                int(fields.get("ra", "0"), 2),
+                int(fields.get("col", "0"), 2),
+                float(since[:-len("ns")]) if since is not None else np.nan,
+            ))
+    return np.array(records, dtype=COMMAND_DTYPE)
+
+
+def pack_bank(bg: np.ndarray, bk: np.ndarray) -> np.ndarray:
+    """Packs <bg, bk> into one integer key per command."""
+    return activations.pack_key((bg, bk), KEY_WIDTHS[:2])
+
+
+def pack_bank_row(bg: np.ndarray, bk: np.ndarray, row: np.ndarray) -> np.ndarray:
+    """Packs <bg, bk, row> into one integer key per command."""
+    return activations.pack_key((bg, bk, row), KEY_WIDTHS)
+
+
+def unpack_bank_row(key: int) -> tuple[int, int, int]:
+    return activations.unpack_key(key, KEY_WIDTHS)
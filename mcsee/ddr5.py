@@ -0,0 +1,289 @@
+"""Memory-mapped reader for decoded DDR5 traces.
+
+The DDR5 decoder writes one CSV file per capture with the columns
+`timestamp_sec,cmd,bg,bk,row,col`, where the address fields are binary strings
+that are empty if a command does not carry them. read_trace() parses such a file
+into packed numpy columns. For the full traces of a capture, which are read by
+several runs and scripts, it can store the columns in a sidecar file next to the
+trace (`<trace>.csv.cache`, see `use_cache`). The sidecar is keyed on the size
+and mtime of the CSV file, so later runs memory-map the columns instead of
+parsing the CSV again. Small files (e.g., the blocks of E6) are parsed directly,
+such that no sidecar is written next to each of them.
+
+Sidecar layout: an 8-byte magic, the length of a JSON header as uint64, the JSON
+header itself, and then the columns, each aligned to COLUMN_ALIGNMENT bytes.
+"""
+import json
+import mmap
+import os
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+from mcsee import activations, artifacts
+
+
+FIELDNAMES = ["timestamp_sec", "cmd", "bg", "bk", "row", "col"]
+
+# Command codes. Commands that are not listed here get the next free codes; the
+# mapping is stored per trace (see Trace.cmd_names).
+CMD_NAMES = ("act", "rd", "rda", "wr", "wra", "pre_pb", "pre_sb", "pre_ab",
+             "ref_ab", "ref_sb", "rfm_ab", "rfm_sb", "mrr", "mrw")
+CMD_ACT = CMD_NAMES.index("act")
+
+# Value of bg/bk/row/col if the field is empty in the CSV file.
+NO_BG = np.iinfo(np.uint8).max
+NO_BK = np.iinfo(np.uint8).max
+NO_ROW = np.iinfo(np.uint32).max
+NO_COL = np.iinfo(np.uint16).max
+
+# Widths of the <bg, bk, row> keys of pack_bank_row(), enough for the x8 DIMMs of our test pool.
+KEY_WIDTHS = (3, 2, 16)
+
+# Number of bytes of the CSV file that are parsed at once (rounded to complete lines).
+PARSE_CHUNK_SIZE = 1 << 22
+
+CACHE_SUFFIX = ".cache"
+CACHE_MAGIC = b"MCSDDR5\x02"
+COLUMN_ALIGNMENT = 64
+
+_COLUMNS = (
+    ("timestamp_sec", np.dtype("<f8")),
+    ("offset", np.dtype("<i8")),  # byte offset of the line in the CSV file
+    ("cmd", np.dtype("u1")),
+    ("bg", np.dtype("u1")),
+    ("bk", np.dtype("u1")),
+    ("row", np.dtype("<u4")),
+    ("col", np.dtype("<u2")),
+)
+_MISSING = {"bg": NO_BG, "bk": NO_BK, "row": NO_ROW, "col": NO_COL}
+
+
+class Trace(NamedTuple):
+    timestamp_sec: np.ndarray  # float64, same values as float(timestamp_sec) of the CSV file
+    offset: np.ndarray         # int64, byte offset of the command's line in the CSV file
+    cmd: np.ndarray            # uint8, index into cmd_names
+    bg: np.ndarray             # uint8, NO_BG if empty
+    bk: np.ndarray             # uint8, NO_BK if empty
+    row: np.ndarray            # uint32, NO_ROW if empty
+    col: np.ndarray            # uint16, NO_COL if empty
+    cmd_names: tuple           # command name of each code
+    widths: dict               # number of bits of the bg/bk/row/col strings
+
+    def __len__(self):
+        return len(self.cmd)
+
+    def code(self, name: str) -> int:
+        # Returns -1 for commands that do not appear in the trace.
+        return self.cmd_names.index(name) if name in self.cmd_names else -1
+
+    def time_sec(self) -> np.ndarray:
+        # The timestamps are stored as parsed, since not every timestamp of the decoder is a whole number of ps.
+        return self.timestamp_sec
+
+    def is_cmd(self, name: str) -> np.ndarray:
+        return self.cmd == self.code(name)
+
+    def field_str(self, name: str, value: int) -> str:
+        # Formats a bg/bk/row/col value the way it is written in the CSV file.
+        if value == _MISSING[name]:
+            return ""
+        return f"{value:0{self.widths[name]}b}"
+
+
+def cache_path(csv_path: Path) -> Path:
+    return csv_path.with_name(csv_path.name + CACHE_SUFFIX)
+
+
+def read_trace(csv_path: Path, use_cache: bool = False) -> Trace:
+    """Loads a decoded DDR5 trace, using (and creating) its sidecar cache if `use_cache` is set."""
+    csv_path = Path(csv_path)
+    if not use_cache:
+        return _parse_csv(csv_path)
+
+    stat = csv_path.stat()
+    trace = _load_cache(cache_path(csv_path), stat)
+    if trace is None:
+        trace = _parse_csv(csv_path)
+        try:
+            _write_cache(cache_path(csv_path), stat, trace)
+        except OSError as e:
+            print(f"[-] Could not write cache for '{csv_path}': {e}")
+    return trace
+
+
+def read_lines(csv_path: Path, trace: Trace, idxs: np.ndarray) -> list[bytes]:
+    """Returns the raw CSV lines (without line terminator) of the commands at `idxs`."""
+    idxs = np.asarray(idxs, dtype=np.int64)
+    if len(idxs) == 0:
+        return []
+    with Path(csv_path).open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        starts = trace.offset[idxs]
+        ends = np.where(idxs + 1 < len(trace), trace.offset[np.minimum(idxs + 1, len(trace) - 1)], len(data))
+        return [data[start:end].rstrip(b"\r\n") for start, end in zip(starts.tolist(), ends.tolist())]
+
+
+def pack_bank(bg: np.ndarray, bk: np.ndarray) -> np.ndarray:
+    """Packs <bg, bk> into one integer key per command."""
+    return activations.pack_key((bg, bk), KEY_WIDTHS[:2])
+
+
+def pack_bank_row(bg: np.ndarray, bk: np.ndarray, row: np.ndarray) -> np.ndarray:
+    """Packs <bg, bk, row> into one integer key per command."""
+    return activations.pack_key((bg, bk, row), KEY_WIDTHS)
+
+
+def unpack_bank(key: int) -> tuple[int, int]:
+    return activations.unpack_key(key, KEY_WIDTHS[:2])
+
+
+def unpack_bank_row(key: int) -> tuple[int, int, int]:
+    return activations.unpack_key(key, KEY_WIDTHS)
+
+
+def most_activated_banks(trace: Trace) -> list[tuple[tuple[int, int], int]]:
+    """Returns the (bg, bk) of every activated bank with its number of ACTs, ordered like Counter.most_common()."""
+    is_act = trace.is_cmd("act")
+    banks = activations.histogram(pack_bank(trace.bg[is_act], trace.bk[is_act]))
+    order = activations.ranked(banks)
+    return [(unpack_bank(key), count) for key, count in zip(banks.keys[order].tolist(), banks.counts[order].tolist())]
+
+
+def _gather_fields(buf: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    # Copies the bytes [starts[i], ends[i]) of every line into one fixed-width row each, padded with NUL bytes.
+    width = max(int((ends - starts).max(initial=0)), 1)
+    positions = starts[:, np.newaxis] + np.arange(width)
+    chars = buf[np.minimum(positions, len(buf) - 1)]
+    chars[positions >= ends[:, np.newaxis]] = 0
+    return chars
+
+
+def _parse_binary_field(chars: np.ndarray, lengths: np.ndarray, name: str) -> np.ndarray:
+    # Evaluates the binary strings of one field at once; the weight of each digit depends on the length of its string.
+    exponents = lengths[:, np.newaxis] - 1 - np.arange(chars.shape[1])
+    values = np.where(chars == ord("1"), np.left_shift(1, np.maximum(exponents, 0), dtype=np.int64), 0).sum(axis=1)
+    return np.where(lengths > 0, values, _MISSING[name]).astype(dict(_COLUMNS)[name])
+
+
+def _parse_chunk(buf: np.ndarray, base: int) -> dict:
+    # Parses the complete lines of `buf`, which starts at byte `base` of the CSV file.
+    newlines = np.flatnonzero(buf == ord("\n"))
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.append(newlines, len(buf))
+    if starts[-1] == len(buf):
+        starts, ends = starts[:-1], ends[:-1]
+    ends = ends - (buf[np.maximum(ends - 1, 0)] == ord("\r")) * (ends > starts)
+    # Skip empty lines (e.g., blank lines at the end of the file), which hold no fields.
+    nonempty = ends > starts
+    starts, ends = starts[nonempty], ends[nonempty]
+
+    commas = np.flatnonzero(buf == ord(","))
+    num_commas = len(FIELDNAMES) - 1
+    if len(commas) != num_commas * len(starts):
+        raise ValueError(f"expected {len(FIELDNAMES)} fields in every line")
+    commas = commas.reshape(-1, num_commas)
+    field_starts = np.column_stack((starts, commas + 1))
+    field_ends = np.column_stack((commas, ends))
+
+    fields = {"offset": base + starts.astype(np.int64)}
+    for i, name in enumerate(FIELDNAMES):
+        chars = _gather_fields(buf, field_starts[:, i], field_ends[:, i])
+        if name == "timestamp_sec":
+            # Parsing the digits as doubles yields the same values as float(timestamp_sec).
+            fields["timestamp_sec"] = chars.view(f"S{chars.shape[1]}").ravel().astype(np.float64)
+        elif name == "cmd":
+            fields["cmd_names"], fields["cmd"] = np.unique(chars.view(f"S{chars.shape[1]}").ravel(),
+                                                           return_inverse=True)
+        else:
+            lengths = field_ends[:, i] - field_starts[:, i]
+            fields[name] = _parse_binary_field(chars, lengths, name)
+            fields[name + "_width"] = int(lengths.max(initial=0))
+    return fields
+
+
+def _parse_csv(csv_path: Path) -> Trace:
+    # The file is parsed in chunks of complete lines with array operations on its bytes, such that no Python object
+    # per line or field is created and the memory used besides the columns does not depend on the size of the file.
+    size = csv_path.stat().st_size
+    data = np.memmap(csv_path, dtype=np.uint8, mode="r") if size else np.empty(0, dtype=np.uint8)
+    newline = np.flatnonzero(data[:PARSE_CHUNK_SIZE] == ord("\n"))
+    pos = int(newline[0]) + 1 if len(newline) else size  # skip the header
+
+    chunks = []
+    while pos < size:
+        end = min(pos + PARSE_CHUNK_SIZE, size)
+        if end < size:
+            newlines = np.flatnonzero(data[pos:end] == ord("\n"))
+            end = pos + int(newlines[-1]) + 1 if len(newlines) else size
+        chunks.append(_parse_chunk(np.array(data[pos:end]), pos))
+        pos = end
+    del data
+
+    # Commands are numbered like CMD_NAMES, followed by all other commands of the file in sorted order.
+    names = sorted({name.decode() for chunk in chunks for name in chunk["cmd_names"].tolist()})
+    cmd_names = list(CMD_NAMES) + [name for name in names if name not in CMD_NAMES]
+    cmd = [np.array([cmd_names.index(name.decode()) for name in chunk["cmd_names"].tolist()],
+                    dtype=np.uint8)[chunk["cmd"]] for chunk in chunks]
+
+    def column(name):
+        dtype = dict(_COLUMNS)[name]
+        return np.concatenate([chunk[name] for chunk in chunks]).astype(dtype) if chunks else np.empty(0, dtype=dtype)
+
+    widths = {name: max((chunk[name + "_width"] for chunk in chunks), default=0) for name in ("bg", "bk", "row", "col")}
+    return Trace(column("timestamp_sec"), column("offset"),
+                 np.concatenate(cmd) if chunks else np.empty(0, dtype=np.uint8),
+                 column("bg"), column("bk"), column("row"), column("col"), tuple(cmd_names), widths)
+
+
+def _column_offsets(data_start: int, num_cmds: int) -> list[int]:
+    offsets = []
+    pos = data_start
+    for _, dtype in _COLUMNS:
+        pos = -(-pos // COLUMN_ALIGNMENT) * COLUMN_ALIGNMENT
+        offsets.append(pos)
+        pos += dtype.itemsize * num_cmds
+    return offsets
+
+
+def _write_cache(path: Path, stat: os.stat_result, trace: Trace):
+    header = json.dumps({
+        "csv_size": stat.st_size,
+        "csv_mtime_ns": stat.st_mtime_ns,
+        "num_cmds": len(trace),
+        "cmd_names": trace.cmd_names,
+        "widths": trace.widths,
+    }).encode()
+    data_start = len(CACHE_MAGIC) + 8 + len(header)
+
+    # Write to a temporary file first such that an interrupted run never leaves a broken cache, and parallel workers
+    # caching the same trace do not write to the same file.
+    with artifacts.atomic_outputs(str(path)) as (tmp_path,), open(tmp_path, "wb") as f:
+        f.write(CACHE_MAGIC)
+        f.write(np.uint64(len(header)).tobytes())
+        f.write(header)
+        for (name, dtype), offset in zip(_COLUMNS, _column_offsets(data_start, len(trace))):
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(np.ascontiguousarray(getattr(trace, name), dtype=dtype).tobytes())
+
+
+def _load_cache(path: Path, stat: os.stat_result):
+    try:
+        with path.open("rb") as f:
+            if f.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+                return None
+            header_len = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+            header = json.loads(f.read(header_len))
+    except (OSError, ValueError, IndexError):
+        return None
+    if header["csv_size"] != stat.st_size or header["csv_mtime_ns"] != stat.st_mtime_ns:
+        return None
+
+    num_cmds = header["num_cmds"]
+    columns = {}
+    for (name, dtype), offset in zip(_COLUMNS, _column_offsets(len(CACHE_MAGIC) + 8 + header_len, num_cmds)):
+        if num_cmds == 0:
+            columns[name] = np.empty(0, dtype=dtype)
+        else:
+            columns[name] = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(num_cmds,))
+    return Trace(**columns, cmd_names=tuple(header["cmd_names"]), widths=header["widths"])
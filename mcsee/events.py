@@ -0,0 +1,126 @@
+"""Detection and streaming storage of the pTRR mitigation events in E6 blocks.
+
+find_events() finds the events among the ACTs of a block. extract_events.py
+writes the events of every block as soon as the block is processed, as one
+JSON object per line (`mitigation_events.jsonl`), so neither the writer nor a
+reader ever holds more than one block. Alongside, it writes a
+summary table with one row per block (`mitigation_events.jsonl.summary.csv`),
+which holds all that is needed to fit the number of events per block without
+touching the events themselves. The summary is named after the full name of its
+events file, so it is never mistaken for the summary of another events file with
+the same stem.
+
+The readers also accept the `mitigation_events.json` files written by earlier
+versions of extract_events.py (a single JSON list of the same block objects).
+"""
+import csv
+import json
+from pathlib import Path
+from typing import Iterator, NamedTuple
+
+import numpy as np
+
+from mcsee import artifacts
+
+
+EVENTS_NAME = "mitigation_events.jsonl"
+SUMMARY_SUFFIX = ".summary.csv"
+SUMMARY_FIELDNAMES = ["num_acts", "num_events", "duration_ns", "file"]
+
+
+class Summary(NamedTuple):
+    num_acts: np.ndarray     # int64, number of ACTs per block
+    num_events: np.ndarray   # int64, number of mitigation events per block
+    duration_ns: np.ndarray  # int64, time between the first command and the last ACT of the block
+    files: list              # block file of each block
+
+    def __len__(self):
+        return len(self.num_acts)
+
+
+def find_events(act_rows: np.ndarray) -> np.ndarray:
+    """Returns the indices j of the ACTs at which a mitigation event starts.
+
+    An event is a window of three ACTs j, j+1, j+2 to three consecutive rows (in
+    any order). Of overlapping events, only every other one is kept such that
+    consecutive events are at least two ACTs apart.
+    """
+    if len(act_rows) < 3:
+        return np.empty(0, dtype=np.int64)
+    windows = np.lib.stride_tricks.sliding_window_view(act_rows.astype(np.int64), 3)
+    a, b, c = windows[:, 0], windows[:, 1], windows[:, 2]
+    # Sorting network for three elements.
+    lo = np.minimum(np.minimum(a, b), c)
+    mid = np.maximum(np.minimum(a, b), np.minimum(np.maximum(a, b), c))
+    hi = np.maximum(np.maximum(a, b), c)
+    candidates = np.flatnonzero((mid == lo + 1) & (hi == lo + 2))
+
+    # A candidate is only suppressed by the previous kept one if they are adjacent, so within every run of adjacent
+    # candidates the first, third, ... candidate is kept.
+    run_starts = np.flatnonzero(np.diff(candidates, prepend=-2) != 1)
+    run_lengths = np.diff(run_starts, append=len(candidates))
+    pos_in_run = np.arange(len(candidates)) - np.repeat(run_starts, run_lengths)
+    return candidates[pos_in_run % 2 == 0]
+
+
+def summary_path(events_path: Path) -> Path:
+    events_path = Path(events_path)
+    return events_path.with_name(events_path.name + SUMMARY_SUFFIX)
+
+
+class EventWriter:
+    """Appends the results of one block at a time; both files are moved into place once all blocks are written."""
+
+    def __init__(self, events_path: Path):
+        self.paths = [str(events_path), str(summary_path(events_path))]
+        self._outputs = artifacts.atomic_outputs(*self.paths)
+
+    def __enter__(self):
+        events_tmp, summary_tmp = self._outputs.__enter__()
+        self.events_file = open(events_tmp, "w")
+        self.summary_file = open(summary_tmp, "w", newline="")
+        self.summary_writer = csv.writer(self.summary_file)
+        self.summary_writer.writerow(SUMMARY_FIELDNAMES)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.events_file.close()
+        self.summary_file.close()
+        return self._outputs.__exit__(exc_type, exc_value, traceback)
+
+    def add(self, block: dict):
+        """Writes a block object with the keys `file`, `duration_ns`, `num_acts`, and `events`."""
+        self.events_file.write(json.dumps(block) + "\n")
+        self.summary_writer.writerow([block["num_acts"], len(block["events"]), block["duration_ns"], block["file"]])
+
+
+def iter_blocks(events_path: Path) -> Iterator[dict]:
+    """Yields the block objects of an events file one at a time."""
+    events_path = Path(events_path)
+    with events_path.open() as f:
+        if events_path.suffix == ".json":
+            yield from json.load(f)
+            return
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_summary(path: Path) -> Summary:
+    """Loads the per-block summary, given either a summary table (any `.csv` file) or an events file."""
+    path = Path(path)
+    if path.suffix != ".csv" and summary_path(path).is_file():
+        path = summary_path(path)
+    if path.suffix != ".csv":
+        # No summary table (e.g., events extracted by an older version), derive it from the events.
+        rows = [(block["num_acts"], len(block["events"]), block["duration_ns"], block["file"])
+                for block in iter_blocks(path)]
+    else:
+        with path.open(newline="") as f:
+            reader = csv.reader(f)
+            next(reader)
+            rows = [(int(num_acts), int(num_events), int(duration_ns), file)
+                    for num_acts, num_events, duration_ns, file in reader]
+
+    columns = list(zip(*rows)) if rows else [(), (), (), ()]
+    return Summary(*(np.array(column, dtype=np.int64) for column in columns[:3]), list(columns[3]))
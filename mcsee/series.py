@@ -0,0 +1,47 @@
+"""Memory-mappable storage for the per-capture metric series (e.g., ACTs per tREFI).
+
+A series file consists of an 8-byte magic, the length of a JSON header as uint64,
+the JSON header itself, and the values as one contiguous array aligned to
+DATA_ALIGNMENT bytes. The header holds the dtype and length of the array as well
+as arbitrary metadata of the capture (e.g., the number of hammered banks).
+"""
+import json
+
+import numpy as np
+
+
+SERIES_MAGIC = b"MCSSER\x00\x01"
+DATA_ALIGNMENT = 64
+
+
+def save_series(path: str, values, dtype, **metadata):
+    """Writes `values` as an array of `dtype`, with `metadata` stored in the header."""
+    values = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder('<'))
+    header = json.dumps({"dtype": values.dtype.str, "length": len(values), "metadata": metadata}).encode()
+    data_start = len(SERIES_MAGIC) + 8 + len(header)
+    with open(path, 'wb') as f:
+        f.write(SERIES_MAGIC)
+        f.write(np.uint64(len(header)).tobytes())
+        f.write(header)
+        f.write(b"\0" * (-data_start % DATA_ALIGNMENT))
+        f.write(values.tobytes())
+
+
+def read_metadata(path: str) -> tuple[dict, int]:
+    """Returns the header of a series file and the offset of its values."""
+    with open(path, 'rb') as f:
+        if f.read(len(SERIES_MAGIC)) != SERIES_MAGIC:
+            raise ValueError(f"'{path}' is not a series file")
+        header_len = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+        header = json.loads(f.read(header_len))
+    data_start = len(SERIES_MAGIC) + 8 + header_len
+    return header, data_start + (-data_start % DATA_ALIGNMENT)
+
+
+def load_series(path: str) -> tuple[np.ndarray, dict]:
+    """Memory-maps the values of a series file, returns them along with the capture metadata."""
+    header, offset = read_metadata(path)
+    if header["length"] == 0:
+        return np.empty(0, dtype=header["dtype"]), header["metadata"]
+    values = np.memmap(path, dtype=header["dtype"], mode='r', offset=offset, shape=(header["length"],))
+    return values, header["metadata"]
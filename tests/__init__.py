@@ -0,0 +1,28 @@
+"""Tests of the mcsee package and the analysis scripts, run with `python -m pytest tests` from the repository root.
+
+The tests compare the vectorized code paths with the reference implementations kept in the scripts (or restated
+here) on small, fixed inputs.
+"""
+import importlib.util
+import sys
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO))
+
+
+def load_script(relpath: str):
+    """Imports an analysis script by its path (relative to the repository root) as a module.
+
+    The script's directory is put on the module path, such that it finds its sibling modules (e.g., E1's spd.py).
+    """
+    path = REPO / relpath
+    if str(path.parent) not in sys.path:
+        sys.path.insert(0, str(path.parent))
+    name = "script_" + relpath.replace("/", "_").replace("-", "_").removesuffix(".py")
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
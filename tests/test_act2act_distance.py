@@ -0,0 +1,121 @@
+from collections import Counter
+
+import numpy as np
+
+from mcsee import ddr4
+from tests import load_script
+
+act2act_distance = load_script("e2-sledgehammer/analysis/act2act_distance.py")
+
+
+def write_trace(path, keys):
+    # A decoded trace of ACTs to the <bg,bk,row> keys, each followed by a PRE to close the bank again.
+    num_acts = len(keys)
+    bg, bk, row = (np.array(field) for field in zip(*(ddr4.unpack_bank_row(key) for key in keys)))
+    commands = ddr4.Commands(
+        time=np.arange(2 * num_acts) * 50e-9,
+        cmd=np.tile(np.array([ddr4.CMD_ACT, ddr4.CMD_PRE], dtype=np.uint8), num_acts),
+        bg=np.repeat(bg, 2).astype(np.uint8),
+        bk=np.repeat(bk, 2).astype(np.uint8),
+        row=np.repeat(row, 2).astype(np.uint32),
+        col=np.zeros(2 * num_acts, dtype=np.uint16),
+    )
+    with open(path, "w") as f:
+        ddr4.write_commands(commands, f)
+
+
+# The per-row ACT indexing of act2act_distance.py before RowActs, with lists and a Counter.
+def process_trace_reference(keys):
+    ranked = Counter(keys).most_common()
+    average = len(keys) / len(ranked)
+    hot = [key for key, count in ranked if count > average]
+    actidxs = {key: [i + 1 for i, k in enumerate(keys) if k == key] for key in sorted(hot, key=keys.index)}
+    row_distances, distances = [], []
+    for idxs in actidxs.values():
+        diffs = [b - a for a, b in zip(idxs, idxs[1:])]
+        row_distances += diffs
+        if len(idxs) >= 15:
+            distances += diffs
+    return hot, row_distances, distances
+
+
+def test_process_trace_matches_reference(tmp_path):
+    rng = np.random.default_rng(0)
+    aggressors = [int(ddr4.pack_bank_row(1, 3, row)) for row in (0x507, 0x551)]
+    # Rows with more ACTs than the average row, but fewer than 15.
+    warm = [int(ddr4.pack_bank_row(1, 3, 0x600)), int(ddr4.pack_bank_row(2, 2, 7))]
+    keys = []
+    for _ in range(300):
+        r = rng.random()
+        if r < 0.3:
+            keys.append(aggressors[rng.integers(2)])
+        elif r < 0.33:
+            keys += [warm[rng.integers(2)]] * 2
+        else:
+            keys.append(int(ddr4.pack_bank_row(*rng.integers([4, 4, 1 << 12]))))
+    write_trace(tmp_path / "trace_cmd.csv", keys)
+
+    hot, row_distances, distances = act2act_distance.process_trace(str(tmp_path / "trace_cmd.csv"))
+    expected = process_trace_reference(keys)
+    assert len(expected[0]) > 3 and expected[1] != expected[2]
+    assert (hot, row_distances, distances) == expected
+
+
+def test_logged_trace_matches_trace(tmp_path, capsys):
+    # The parallel workers of the bank count sweep return the output of process_trace() instead of printing it.
+    rng = np.random.default_rng(1)
+    keys = [int(ddr4.pack_bank_row(0, 1, row)) for row in rng.integers(8, size=200)]
+    write_trace(tmp_path / "trace_cmd.csv", keys)
+    result = act2act_distance.process_trace(str(tmp_path / "trace_cmd.csv"))
+    output = capsys.readouterr().out
+
+    log, logged_result = act2act_distance.process_trace_logged(str(tmp_path / "trace_cmd.csv"))
+    assert capsys.readouterr().out == ""
+    assert log == output
+    assert logged_result == result
+
+
+def test_find_traces_groups_by_bank_count(tmp_path):
+    names = ["a/sledgehammer-nbanks=2--00001_cmd.csv", "sledgehammer-nbanks=2--00000_cmd.csv",
+             "b/sledgehammer-nbanks=10--00000_cmd.csv", "sledgehammer-nbanks=1--00000.csv",
+             "sledgehammer-nbanks=1--00000_cmd.npy"]
+    for name in names:
+        (tmp_path / name).parent.mkdir(exist_ok=True)
+        (tmp_path / name).write_text("")
+    traces = act2act_distance.find_traces(str(tmp_path))
+    assert list(traces) == [2, 10]
+    assert traces[2] == sorted(str(tmp_path / name) for name in names[:2])
+    assert traces[10] == [str(tmp_path / names[2])]
+
+
+def test_index_matches_unique(tmp_path):
+    # index_acts() before the counting sort, with np.unique() and an argsort of the inverse indices.
+    rng = np.random.default_rng(2)
+    num_keys = 1 << sum(ddr4.KEY_WIDTHS)
+    for keys in ([5], [num_keys - 1, 0, num_keys - 1], rng.integers(num_keys, size=5000).tolist(),
+                 rng.integers(20, size=5000).tolist()):
+        write_trace(tmp_path / "trace_cmd.csv", keys)
+        acts = act2act_distance.index_acts(str(tmp_path / "trace_cmd.csv"))
+        unique, first, inverse, counts = np.unique(np.array(keys, dtype=np.int64), return_index=True,
+                                                   return_inverse=True, return_counts=True)
+        assert acts.keys.tolist() == unique.tolist()
+        assert acts.first.tolist() == first.tolist()
+        assert acts.counts.tolist() == counts.tolist()
+        assert acts.act_idxs.tolist() == np.argsort(inverse, kind='stable').tolist()
+        assert all(acts.actidxs(i).tolist() == np.flatnonzero(inverse == i).tolist() for i in range(len(unique)))
+
+
+def test_trace_without_hot_rows(tmp_path, capsys):
+    # Every row has as many ACTs as the average row.
+    keys = [int(ddr4.pack_bank_row(0, 1, row)) for row in [3, 9, 4] * 20]
+    write_trace(tmp_path / "trace_cmd.csv", keys)
+    assert act2act_distance.process_trace(str(tmp_path / "trace_cmd.csv")) == ([], [], [])
+    assert "No row with more ACTs than the average row" in capsys.readouterr().out
+
+    # A trace without ACTs.
+    commands = ddr4.Commands(time=np.array([0.0]), cmd=np.array([ddr4.CMD_REF], dtype=np.uint8),
+                             bg=np.zeros(1, dtype=np.uint8), bk=np.zeros(1, dtype=np.uint8),
+                             row=np.zeros(1, dtype=np.uint32), col=np.zeros(1, dtype=np.uint16))
+    with open(tmp_path / "empty_cmd.csv", "w") as f:
+        ddr4.write_commands(commands, f)
+    assert act2act_distance.process_trace_logged(str(tmp_path / "empty_cmd.csv"))[1] == ([], [], [])
@@ -0,0 +1,56 @@
+import itertools
+from collections import Counter
+
+import numpy as np
+
+from mcsee import activations
+
+
+# What E5 computed before activations.most_activated_two(): the two most common keys with Counter.most_common().
+def most_activated_two_reference(keys):
+    counts = Counter(keys).most_common()
+    return counts[0][0], counts[0][1], counts[1][1] if len(counts) > 1 else 0
+
+
+def random_keys(rng, length, num_keys, offset=0):
+    # A few hot keys and many cold ones, such that there are ties in the top counts.
+    hot = rng.integers(num_keys, size=3)
+    keys = np.where(rng.random(length) < 0.3, hot[rng.integers(3, size=length)], rng.integers(num_keys, size=length))
+    return keys.astype(np.int64) + offset
+
+
+def test_most_activated_two_matches_counter():
+    rng = np.random.default_rng(0)
+    for length, num_keys, offset in itertools.product([1, 2, 3, 10, 1000], [1, 2, 5, 1000], [0, 1 << 30]):
+        for _ in range(10):
+            keys = random_keys(rng, length, num_keys, offset)
+            histogram = activations.histogram(keys)
+            assert activations.most_activated_two(histogram) == most_activated_two_reference(keys.tolist())
+
+
+def test_ranked_matches_counter():
+    rng = np.random.default_rng(1)
+    for length, num_keys in [(100, 10), (1000, 50), (1000, 5000)]:
+        keys = random_keys(rng, length, num_keys)
+        histogram = activations.histogram(keys)
+        ranked = activations.ranked(histogram)
+        assert list(zip(histogram.keys[ranked].tolist(), histogram.counts[ranked].tolist())) == \
+            Counter(keys.tolist()).most_common()
+
+
+def test_merge_in_any_order_matches_concatenation():
+    # E5 merges the histograms of the trace files of an iteration in the order they are read; positions are
+    # (rank of the file, index of the ACT in the file), packed like in analyze_experiment.py.
+    rng = np.random.default_rng(2)
+    files = [random_keys(rng, length, 20) for length in (50, 0, 200, 1, 120)]
+    partial = []
+    for rank, keys in enumerate(files):
+        histogram = activations.histogram(keys)
+        partial.append(histogram._replace(first=(rank << 40) | histogram.first))
+    expected = most_activated_two_reference(np.concatenate(files).tolist())
+    for order in itertools.permutations(range(len(files))):
+        merged = activations.EMPTY
+        for rank in order:
+            merged = activations.merge(merged, partial[rank])
+        assert merged.num_acts == sum(map(len, files))
+        assert activations.most_activated_two(merged) == expected
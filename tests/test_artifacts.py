@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+from mcsee import artifacts
+
+
+def make_manifest(tmp_path, code_files):
+    return artifacts.Manifest(str(tmp_path / "capture_manifest.json"), code_files)
+
+
+def run_stage(tmp_path, code_files, param=1):
+    # Returns whether the stage was fresh, and (re)builds it otherwise.
+    manifest = make_manifest(tmp_path, code_files)
+    out = str(tmp_path / "capture_cmd.csv")
+    key = manifest.stage_key("decode", [str(tmp_path / "capture.csv")], {"param": param}, [out])
+    if manifest.is_fresh("decode", key):
+        return True
+    with artifacts.atomic_outputs(out) as (tmp,):
+        with open(tmp, "w") as f:
+            f.write("decoded")
+    manifest.record("decode", key, [out])
+    return False
+
+
+@pytest.fixture
+def capture(tmp_path):
+    (tmp_path / "capture.csv").write_text("Time,clk\n0,1\n")
+    code = tmp_path / "code.py"
+    code.write_text("VERSION = 1\n")
+    return tmp_path, [str(code)]
+
+
+def test_stage_is_reused(capture):
+    tmp_path, code_files = capture
+    assert not run_stage(tmp_path, code_files)
+    assert run_stage(tmp_path, code_files)
+
+
+def test_stage_is_redone_on_changes(capture):
+    tmp_path, code_files = capture
+    run_stage(tmp_path, code_files)
+    assert not run_stage(tmp_path, code_files, param=2)
+
+    (tmp_path / "capture.csv").write_text("Time,clk\n0,0\n")
+    assert not run_stage(tmp_path, code_files, param=2)
+
+    with open(code_files[0], "a") as f:
+        f.write("VERSION = 2\n")
+    assert not run_stage(tmp_path, code_files, param=2)
+
+    os.truncate(tmp_path / "capture_cmd.csv", 0)
+    assert not run_stage(tmp_path, code_files, param=2)
+    assert run_stage(tmp_path, code_files, param=2)
+
+
+def test_package_files_cover_all_modules():
+    names = {os.path.basename(path) for path in artifacts.package_files()}
+    assert {"artifacts.py", "activations.py", "ddr4.py", "series.py"} <= names
+
+
+def test_atomic_outputs_discards_partial_files(tmp_path):
+    out = tmp_path / "out.txt"
+    with pytest.raises(RuntimeError):
+        with artifacts.atomic_outputs(str(out)) as (tmp,):
+            with open(tmp, "w") as f:
+                f.write("partial")
+            raise RuntimeError
+    assert os.listdir(tmp_path) == []
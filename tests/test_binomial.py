@@ -0,0 +1,58 @@
+import math
+
+import numpy as np
+
+from mcsee import binomial
+
+
+# The PMF of plot_determine_probability.py before mcsee.binomial.
+def pmf_reference(k, n, p):
+    return math.comb(n, k) * (1 - p)**(n - k) * p**k
+
+
+def test_pmf_matches_reference():
+    for n, p in [(10, 0.3), (60, 0.05), (1000, 0.001), (8192, 0.00091), (8192, 0.002)]:
+        k = np.arange(40)
+        expected = [pmf_reference(int(i), n, p) if i <= n else 0.0 for i in k]
+        np.testing.assert_allclose(binomial.pmf(k, n, p), expected, rtol=1e-9, atol=1e-300)
+        np.testing.assert_allclose(binomial.cdf(k, n, p), np.minimum(np.cumsum(expected), 1.0), rtol=1e-9)
+
+
+def test_edge_cases():
+    assert binomial.pmf(0, 5, 0.0) == 1.0
+    assert binomial.pmf(5, 5, 1.0) == 1.0
+    assert binomial.pmf(1, 5, 0.0) == 0.0
+    assert binomial.pmf(6, 5, 0.5) == 0.0
+    assert binomial.pmf(-1, 5, 0.5) == 0.0
+    assert binomial.cdf(-1, 5, 0.5) == 0.0
+
+
+def test_broadcasting():
+    n, p, k = np.array([[100], [200]]), np.array([0.01, 0.02, 0.03]), np.arange(7)
+    probs = binomial.pmf(k, n, p)
+    assert probs.shape == (2, 3, 7)
+    for i, j in np.ndindex(2, 3):
+        np.testing.assert_allclose(probs[i, j], [pmf_reference(int(x), int(n[i, 0]), float(p[j])) for x in k], rtol=1e-9)
+
+
+def test_fit_matches_reference():
+    rng = np.random.default_rng(0)
+    event_counts = rng.binomial(8000, 0.0009, size=500)
+    n_values, p_values = [4000, 8000], [0.0009, 0.0018]
+    fit = binomial.fit(event_counts, n_values, p_values)
+
+    observed = np.bincount(event_counts)
+    log_likelihoods = {}
+    for i, n in enumerate(n_values):
+        assert fit.mle_p[i] == event_counts.mean() / n
+        for j, p in enumerate(p_values):
+            log_likelihood = sum(math.log(pmf_reference(int(k), n, p)) for k in event_counts)
+            assert math.isclose(fit.log_likelihood[i, j], log_likelihood, rel_tol=1e-9)
+            log_likelihoods[n, p] = log_likelihood
+            expected = [len(event_counts) * pmf_reference(k, n, p) for k in range(len(observed))]
+            expected[-1] = len(event_counts) - sum(expected[:-1])
+            chi2 = sum((o - e)**2 / e for o, e in zip(observed, expected))
+            # The tail bin is 1 - CDF, which loses precision for models far off the data.
+            assert math.isclose(fit.chi2[i, j], chi2, rel_tol=1e-4)
+    assert fit.best() == max(log_likelihoods, key=log_likelihoods.get)
+    assert fit.dof == len(observed) - 2
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from mcsee import blockstore, ddr5
+from tests.test_ddr5 import make_csv
+
+COLUMNS = ("timestamp_sec", "offset", "cmd", "bg", "bk", "row", "col")
+
+
+@pytest.fixture
+def traces(tmp_path):
+    traces = {}
+    for i, name in enumerate(["trace_a", "trace_b"]):
+        path = tmp_path / f"{name}.csv"
+        path.write_bytes(make_csv(200, seed=i))
+        traces[name] = ddr5.read_trace(path)
+    return traces
+
+
+def test_blocks_round_trip(tmp_path, traces):
+    blocks = [("it=00000", "trace_a", 3, np.arange(10, 50)), ("it=00000", "trace_b", 0, np.arange(0, 25)),
+              ("it=00001", "trace_a", 3, np.arange(100, 180)), ("it=00001", "trace_b", 7, np.array([], dtype=np.int64))]
+    path = tmp_path / blockstore.STORE_NAME
+    with blockstore.BlockStoreWriter(path) as writer:
+        for iteration, trace_name, block, idxs in blocks:
+            writer.add(iteration, trace_name, block, traces[trace_name], idxs)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["blocks.store", "trace_a.csv", "trace_b.csv"]
+
+    store = blockstore.BlockStore(path)
+    assert len(store) == len(blocks)
+    for block_id, (iteration, trace_name, block, idxs) in enumerate(blocks):
+        assert store.name(block_id) == (iteration, trace_name, block)
+        assert store.find(iteration, trace_name, block) == block_id
+        trace, stored = traces[trace_name], store.block(block_id)
+        for name in COLUMNS:
+            if name == "cmd":
+                names = [stored.cmd_names[c] for c in stored.cmd.tolist()]
+                assert names == [trace.cmd_names[c] for c in trace.cmd[idxs].tolist()]
+            else:
+                np.testing.assert_array_equal(getattr(stored, name), getattr(trace, name)[idxs])
+    with pytest.raises(KeyError):
+        store.find("it=00000", "trace_a", 4)
+
+
+def test_failed_write_leaves_no_files(tmp_path, traces):
+    with pytest.raises(RuntimeError):
+        with blockstore.BlockStoreWriter(tmp_path / blockstore.STORE_NAME) as writer:
+            writer.add("it=00000", "trace_a", 0, traces["trace_a"], np.arange(5))
+            raise RuntimeError
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["trace_a.csv", "trace_b.csv"]
@@ -0,0 +1,52 @@
+import math
+
+import numpy as np
+
+from mcsee import bypass
+
+
+# The series that calculate_prob.py summed before mcsee.bypass.
+def attempt_probability_reference(nrh, pth=bypass.PTH, trc_ns=bypass.TRC_NS, window_ms=bypass.REFRESH_WINDOW_MS):
+    nf = np.arange(0, math.floor((window_ms * 1e6 / trc_ns - nrh) / 2) + 1)
+    return np.sum((1 - pth / 2)**(nf + nrh) * (pth / 2)**nf)
+
+
+def test_attempt_probability_matches_series():
+    for pth in [bypass.PTH, 0.01, 0.1]:
+        for trc_ns in [bypass.TRC_NS, 48.5]:
+            nrh = np.arange(1000, 30001, 4000)
+            expected = [attempt_probability_reference(int(x), pth, trc_ns) for x in nrh]
+            log_p = bypass.log_attempt_probability(nrh, pth, trc_ns)
+            np.testing.assert_allclose(np.exp(log_p), expected, rtol=1e-11, atol=0)
+
+
+def test_attempt_needs_nrh_acts_within_window():
+    max_acts = bypass.REFRESH_WINDOW_MS * 1e6 / bypass.TRC_NS
+    log_p = bypass.log_attempt_probability([max_acts - 1, max_acts + 1])
+    assert np.isfinite(log_p[0])
+    assert log_p[1] == -np.inf
+    assert bypass.success_probability(log_p[1], bypass.SEC_IN_A_WEEK) == 0.0
+
+
+def test_success_probability_matches_power():
+    log_p = bypass.log_attempt_probability(np.arange(1000, 6001, 1000))
+    for duration_sec in [bypass.SEC_IN_AN_HOUR, bypass.SEC_IN_A_DAY, bypass.SEC_IN_A_WEEK]:
+        attempts = duration_sec / (bypass.REFRESH_WINDOW_MS / 1e3)
+        expected = 1 - (1 - np.exp(log_p))**attempts
+        # 1 - (1 - p)^attempts itself is only accurate to about 1e-5 for the smallest p.
+        np.testing.assert_allclose(bypass.success_probability(log_p, duration_sec), expected, rtol=1e-4)
+
+
+def test_grid_matches_single_evaluations(tmp_path):
+    nrh, pth, trc_ns, durations = [1000, 2000, 3000], [bypass.PTH, 0.01], [45, 50], [60, bypass.SEC_IN_A_DAY]
+    grid = bypass.evaluate(nrh, pth, trc_ns, durations)
+    assert grid.p_success.shape == (3, 2, 2, 2)
+    for i, j, k, d in np.ndindex(grid.p_success.shape):
+        log_p = bypass.log_attempt_probability(nrh[i], pth[j], trc_ns[k])
+        assert grid.log_p_attempt[i, j, k] == log_p
+        assert grid.p_success[i, j, k, d] == bypass.success_probability(log_p, durations[d])
+
+    bypass.write_table(tmp_path / "table.csv", grid)
+    lines = (tmp_path / "table.csv").read_text().splitlines()
+    assert lines[0] == ",".join(bypass.TABLE_FIELDNAMES)
+    assert len(lines) == 1 + grid.p_success.size
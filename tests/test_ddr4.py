@@ -0,0 +1,213 @@
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from mcsee import ddr4
+from tests import REPO, load_script
+
+activation_throughput = load_script("e2-sledgehammer/analysis/activation_throughput.py")
+process = load_script("e4-rowpress/analysis/process.py")
+
+FIELDNAMES = ["Time", "clk", "cs", "act", "a16", "a15", "a14", "a13", "a12", "a11", "a10", "a9", "a8",
+              "a7", "a6", "a5", "a4", "a3", "a2", "a1", "a0", "bg1", "bg0", "ba1", "ba0"]
+PINS = FIELDNAMES[2:]
+
+# The rows E4 collects tRAS durations of, as (bg, bk, row).
+PRESSED = [(int(process.pressed_bg[3:], 2), int(process.pressed_bk[3:], 2), int(ra[3:], 2))
+           for ra in process.pressed_row]
+
+
+def command_pins(rng, cmd):
+    pins = dict.fromkeys(PINS, 0)
+    pins["cs"] = 1
+    if cmd == ddr4.CMD_ACT:
+        bg, bk, row = PRESSED[rng.integers(len(PRESSED))] if rng.random() < 0.5 \
+            else (int(rng.integers(4)), int(rng.integers(4)), int(rng.integers(1 << len(ddr4.ROW_PINS))))
+        pins["act"] = 1
+        pins.update({name: (row >> i) & 1 for i, name in enumerate(reversed(ddr4.ROW_PINS))})
+    else:
+        bg, bk = (PRESSED[0][0], PRESSED[0][1]) if rng.random() < 0.5 else (int(rng.integers(4)), int(rng.integers(4)))
+        pins["a16"], pins["a15"], pins["a14"] = {ddr4.CMD_REF: (1, 0, 1), ddr4.CMD_PRE: (1, 1, 0),
+                                                 ddr4.CMD_RD: (0, 0, 1)}[cmd]
+        if cmd == ddr4.CMD_RD:
+            col = int(rng.integers(1 << len(ddr4.COL_PINS)))
+            pins.update({name: (col >> i) & 1 for i, name in enumerate(reversed(ddr4.COL_PINS))})
+    pins["bg1"], pins["bg0"], pins["ba1"], pins["ba0"] = bg >> 1, bg & 1, bk >> 1, bk & 1
+    return [pins[name] for name in PINS]
+
+
+def make_capture(path, num_cmds: int, seed: int):
+    """Writes a raw capture of random commands, each stable for a few samples, separated by idle and glitch samples."""
+    rng = np.random.default_rng(seed)
+    samples = []
+    for i in range(num_cmds):
+        cmd = ddr4.CMD_REF if i % 40 == 0 else int(rng.choice([ddr4.CMD_ACT, ddr4.CMD_PRE, ddr4.CMD_RD]))
+        samples += [command_pins(rng, cmd)] * int(rng.integers(2, 9))
+        samples += [[0] * len(PINS)] * int(rng.integers(0, 7))
+        for _ in range(int(rng.integers(0, 3))):
+            samples.append(rng.integers(2, size=len(PINS)).tolist())
+    with open(path, "w") as f:
+        f.write(",".join(FIELDNAMES) + "\n")
+        for i, pins in enumerate(samples):
+            f.write(f"{-5e-4 + i * 1.6e-10:.9E},{i % 2}," + ",".join(map(str, pins)) + "\n")
+
+
+@pytest.fixture
+def capture(tmp_path):
+    path = tmp_path / "capture.csv"
+    make_capture(path, 400, seed=1)
+    return str(path)
+
+
+def test_e2_decoder_matches_reference(tmp_path, capture):
+    dupfree = str(tmp_path / "capture_dupfree.csv")
+    activation_throughput.remove_duplicates(capture, dupfree)
+
+    expected = activation_throughput.parse_commands(dupfree, str(tmp_path / "reference.csv"), reference=True)
+    result = activation_throughput.parse_commands(dupfree, str(tmp_path / "vectorized.csv"))
+    assert result[0] == expected[0]
+    np.testing.assert_allclose(result[1], expected[1], rtol=0, atol=1e-15)
+    assert (tmp_path / "vectorized.csv").read_text() == (tmp_path / "reference.csv").read_text()
+
+
+def test_e4_decoder_matches_reference(tmp_path, capture):
+    dupfree = str(tmp_path / "capture_dupfree.csv")
+    process.remove_dups(capture, dupfree)
+
+    expected = process.parse_commands(dupfree, str(tmp_path / "reference.csv"), reference=True)
+    result = process.parse_commands(dupfree, str(tmp_path / "vectorized.csv"))
+    assert len(expected) > 0
+    assert result == expected
+    assert (tmp_path / "vectorized.csv").read_text() == (tmp_path / "reference.csv").read_text()
+
+
+# The row-by-row deglitchers of E2 (remove_duplicates()) and E4 (remove_dups()) before they used ddr4.deglitch().
+def deglitch_reference_e2(filename: str, threshold: int):
+    with open(filename) as f:
+        lines = f.readlines()[1:]
+    survivors, candidate, row_last, counter = [], None, None, 0
+    for line in lines:
+        row_current = line.rstrip("\n").split(",")[2:]
+        if row_last == row_current:
+            counter += 1
+            if counter == 1:
+                candidate = line
+        else:
+            if counter >= threshold and candidate is not None:
+                survivors.append(candidate)
+                candidate = None
+            counter = 0
+        row_last = row_current
+    return survivors
+
+
+def deglitch_reference_e4(filename: str, threshold: int):
+    with open(filename) as f:
+        lines = f.readlines()[1:]
+    survivors, candidate, row_last, counter = [], None, None, 0
+    for line in lines:
+        row_current = line.rstrip("\n").split(",")[2:]
+        if all(v == "0" for v in row_current):
+            continue
+        if row_last == row_current:
+            counter += 1
+        else:
+            if counter >= threshold and candidate is not None:
+                survivors.append(candidate)
+            candidate = line
+            counter = 0
+        row_last = row_current
+    return survivors
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 100, ddr4.DEGLITCH_CHUNK_SIZE])
+@pytest.mark.parametrize("threshold", [1, 4])
+def test_deglitch_matches_reference(capture, chunk_size, threshold):
+    e2 = [line for lines in ddr4.deglitch(capture, threshold, candidate_offset=1, chunk_size=chunk_size)
+          for line in lines]
+    assert e2 == deglitch_reference_e2(capture, threshold)
+    e4 = [line for lines in ddr4.deglitch(capture, threshold, skip_idle=True, chunk_size=chunk_size)
+          for line in lines]
+    assert e4 == deglitch_reference_e4(capture, threshold)
+
+
+def test_e2_fused_deglitch_and_decode(tmp_path, capture):
+    activation_throughput.remove_duplicates(capture, str(tmp_path / "dupfree.csv"))
+    expected = activation_throughput.parse_commands(str(tmp_path / "dupfree.csv"), str(tmp_path / "separate.csv"))
+
+    result = activation_throughput.deglitch_and_parse_commands(capture, str(tmp_path / "fused.csv"),
+                                                               str(tmp_path / "fused_dupfree.csv"))
+    assert result == expected
+    assert (tmp_path / "fused.csv").read_text() == (tmp_path / "separate.csv").read_text()
+    assert (tmp_path / "fused_dupfree.csv").read_text() == (tmp_path / "dupfree.csv").read_text()
+
+
+def test_e4_fused_deglitch_and_decode(tmp_path, capture):
+    process.remove_dups(capture, str(tmp_path / "dupfree.csv"))
+    expected = process.parse_commands(str(tmp_path / "dupfree.csv"), str(tmp_path / "separate.csv"))
+
+    result = process.deglitch_and_parse_commands(capture, str(tmp_path / "fused.csv"), str(tmp_path / "fused_dupfree.csv"))
+    assert result == expected
+    assert (tmp_path / "fused.csv").read_text() == (tmp_path / "separate.csv").read_text()
+    assert (tmp_path / "fused_dupfree.csv").read_text() == (tmp_path / "dupfree.csv").read_text()
+
+
+def test_binary_trace_matches_text_trace(tmp_path, capture):
+    samples = ddr4.deglitch_samples(capture, candidate_offset=1)
+    cmd_file = str(tmp_path / "capture_cmd.csv")
+    ddr4.decode_to_file(samples, cmd_file)
+    text = ddr4.read_commands(cmd_file)
+
+    ddr4.decode_to_file(samples, cmd_file, write_binary=True)
+    binary = ddr4.read_commands(cmd_file)
+    assert isinstance(binary, np.memmap)
+    assert binary.dtype == ddr4.COMMAND_DTYPE
+    for name in ("cmd", "bg", "bk", "row", "col"):
+        np.testing.assert_array_equal(binary[name], text[name])
+    # The text trace rounds times to 13 significant digits and tRAS durations to ps.
+    np.testing.assert_allclose(binary["time"], text["time"], rtol=1e-12)
+    np.testing.assert_allclose(binary["tras_ns"], text["tras_ns"], rtol=0, atol=5e-4)
+    assert np.isfinite(binary["tras_ns"]).any()
+
+
+def test_e2_reference_decoder_removes_stale_binary(tmp_path, capture):
+    cmd_file = str(tmp_path / "capture_cmd.csv")
+    activation_throughput.process_capture(capture, write_binary=True)
+    assert isinstance(ddr4.read_commands(cmd_file), np.memmap)
+
+    # The reference decoder does not write a binary trace, so the one of the previous run must not shadow its output.
+    activation_throughput.process_capture(capture, reference_decoder=True, write_binary=True)
+    assert not (tmp_path / "capture_cmd.npy").exists()
+    reference = ddr4.read_commands(cmd_file)
+    assert not isinstance(reference, np.memmap)
+    assert len(reference) > 0
+
+
+def test_e4_reference_decoder_removes_stale_binary(tmp_path, capture):
+    cmd_file = str(tmp_path / "capture_cmd.csv")
+    process.process_capture(capture, write_binary=True)
+    assert isinstance(ddr4.read_commands(cmd_file), np.memmap)
+
+    process.process_capture(capture, reference_decoder=True, write_binary=True)
+    assert not (tmp_path / "capture_cmd.npy").exists()
+    assert not isinstance(ddr4.read_commands(cmd_file), np.memmap)
+
+def test_parallel_e2_run_matches_sequential(tmp_path):
+    script = REPO / "e2-sledgehammer/analysis/activation_throughput.py"
+    for jobs in (1, 3):
+        run_dir = tmp_path / f"jobs={jobs}"
+        (run_dir / "raw").mkdir(parents=True)
+        for seed, name in enumerate(["nbanks=2--00000", "nbanks=1--00001", "nbanks=1--00000"]):
+            make_capture(run_dir / "raw" / f"sledgehammer-{name}.csv", 400, seed)
+        subprocess.run([sys.executable, str(script), "raw", "--jobs", str(jobs)], cwd=run_dir, check=True,
+                       capture_output=True)
+
+    sequential, parallel = tmp_path / "jobs=1", tmp_path / "jobs=3"
+    files = sorted(p.relative_to(sequential) for p in sequential.rglob("*") if p.is_file())
+    assert sorted(p.relative_to(parallel) for p in parallel.rglob("*") if p.is_file()) == files
+    # The result files list the captures ordered by number of banks and run; the manifests hold modification times.
+    for name in files:
+        if name.suffix != ".json":
+            assert (parallel / name).read_bytes() == (sequential / name).read_bytes()
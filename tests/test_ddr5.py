@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+from mcsee import ddr5
+
+
+# Line-by-line parser of the first version of ddr5.read_trace(), kept as the reference of the chunked parser.
+def parse_reference(data: bytes):
+    lines = data.decode().split("\n")
+    offsets = [0]
+    for line in lines[:-1]:
+        offsets.append(offsets[-1] + len(line) + 1)
+    if lines and lines[-1] == "":
+        lines.pop()
+    rows = [line.rstrip("\r").split(",") for line in lines[1:]]
+    offsets = offsets[1:len(lines)]
+
+    names = sorted({row[1] for row in rows})
+    cmd_names = list(ddr5.CMD_NAMES) + [name for name in names if name not in ddr5.CMD_NAMES]
+    missing = {"bg": ddr5.NO_BG, "bk": ddr5.NO_BK, "row": ddr5.NO_ROW, "col": ddr5.NO_COL}
+    columns = {
+        "timestamp_sec": [float(row[0]) for row in rows],
+        "offset": offsets,
+        "cmd": [cmd_names.index(row[1]) for row in rows],
+    }
+    widths = {}
+    for i, name in enumerate(("bg", "bk", "row", "col"), start=2):
+        columns[name] = [int(row[i], 2) if row[i] else missing[name] for row in rows]
+        widths[name] = max((len(row[i]) for row in rows), default=0)
+    return columns, tuple(cmd_names), widths
+
+
+def make_csv(num_cmds: int, seed: int, line_end: str = "\r\n", trailing: bool = True) -> bytes:
+    rng = np.random.default_rng(seed)
+    lines = [",".join(ddr5.FIELDNAMES)]
+    t = 0.0
+    for _ in range(num_cmds):
+        t += float(rng.integers(1, 2000)) * 1e-12 * 416
+        cmd = str(rng.choice(["act", "rd", "wr", "pre_pb", "ref_ab", "nop", "mpc"]))
+        bg = format(int(rng.integers(8)), "03b") if cmd != "ref_ab" else ""
+        bk = format(int(rng.integers(4)), "02b") if cmd != "ref_ab" else ""
+        row = format(int(rng.integers(1 << 16)), "016b") if cmd == "act" else ""
+        col = format(int(rng.integers(1 << 11)), "011b") if cmd in ("rd", "wr") else ""
+        lines.append(f"{t!r},{cmd},{bg},{bk},{row},{col}")
+    return (line_end.join(lines) + (line_end if trailing else "")).encode()
+
+
+@pytest.mark.parametrize("line_end, trailing", [("\r\n", True), ("\n", True), ("\n", False), ("\r\n", False)])
+@pytest.mark.parametrize("chunk_size", [64, 1000, 1 << 22])
+def test_parser_matches_reference(tmp_path, monkeypatch, line_end, trailing, chunk_size):
+    monkeypatch.setattr(ddr5, "PARSE_CHUNK_SIZE", chunk_size)
+    data = make_csv(500, seed=chunk_size, line_end=line_end, trailing=trailing)
+    path = tmp_path / "trace.csv"
+    path.write_bytes(data)
+
+    trace = ddr5.read_trace(path, use_cache=False)
+    columns, cmd_names, widths = parse_reference(data)
+    assert trace.cmd_names == cmd_names
+    assert trace.widths == widths
+    for name, values in columns.items():
+        np.testing.assert_array_equal(getattr(trace, name), np.array(values, dtype=getattr(trace, name).dtype), name)
+
+    lines = ddr5.read_lines(path, trace, np.arange(len(trace)))
+    assert lines == [line.rstrip(b"\r") for line in data.split(b"\n")[1:len(trace) + 1]]
+
+
+@pytest.mark.parametrize("chunk_size", [64, 1 << 22])
+def test_blank_lines_are_skipped(tmp_path, monkeypatch, chunk_size):
+    monkeypatch.setattr(ddr5, "PARSE_CHUNK_SIZE", chunk_size)
+    lines = make_csv(50, seed=3).split(b"\r\n")
+    lines[10:10] = [b"", b""]
+    lines[30:30] = [b""]
+    path = tmp_path / "trace.csv"
+    path.write_bytes(b"\r\n".join(lines) + b"\r\n\r\n")
+
+    trace = ddr5.read_trace(path, use_cache=False)
+    expected = parse_reference(b"\r\n".join(line for line in lines if line) + b"\r\n")[0]
+    assert len(trace) == 50
+    for name in ("timestamp_sec", "cmd", "bg", "bk", "row", "col"):
+        np.testing.assert_array_equal(getattr(trace, name), np.array(expected[name], dtype=getattr(trace, name).dtype))
+    assert ddr5.read_lines(path, trace, np.arange(len(trace))) == [line for line in lines[1:] if line]
+
+
+def test_timestamps_are_not_rounded(tmp_path):
+    timestamps = ["1.2345678901234567e-06", "0.0123456789012345678", "5e-13", "3.3300000000000004e-08"]
+    path = tmp_path / "trace.csv"
+    path.write_text("\n".join([",".join(ddr5.FIELDNAMES)] + [f"{t},act,000,00,{0:016b}," for t in timestamps]) + "\n")
+    trace = ddr5.read_trace(path, use_cache=False)
+    assert trace.time_sec().tolist() == [float(t) for t in timestamps]
+
+
+def test_empty_trace(tmp_path):
+    path = tmp_path / "trace.csv"
+    path.write_bytes((",".join(ddr5.FIELDNAMES) + "\r\n").encode())
+    assert len(ddr5.read_trace(path, use_cache=False)) == 0
+
+
+def test_cache_round_trip(tmp_path):
+    path = tmp_path / "trace.csv"
+    path.write_bytes(make_csv(300, seed=1))
+    parsed = ddr5.read_trace(path, use_cache=True)
+    assert ddr5.cache_path(path).is_file()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["trace.csv", "trace.csv.cache"]
+
+    cached = ddr5.read_trace(path, use_cache=True)
+    assert isinstance(cached.cmd, np.memmap)
+    for name in ("timestamp_sec", "offset", "cmd", "bg", "bk", "row", "col"):
+        np.testing.assert_array_equal(getattr(cached, name), getattr(parsed, name))
+    assert cached.cmd_names == parsed.cmd_names and cached.widths == parsed.widths
+
+    # A changed trace invalidates the cache.
+    path.write_bytes(make_csv(10, seed=2))
+    assert len(ddr5.read_trace(path, use_cache=True)) == 10
@@ -0,0 +1,43 @@
+import json
+import os
+
+from tests import load_script
+from tests.test_e1_spd import make_dump
+
+analyze = load_script("e1-rfm-values/analyze.py")
+
+
+def write_corpus(directory):
+    blocks = {"A": {"rfm_req": 1, "raaimt": 80, "raammt": "6x"}, "B": {"rfm_req": 0, "raaimt": "RFU", "raammt": 0}}
+    (directory / "M1.json").write_text(json.dumps({"arfm": {"sdram_0": blocks, "sdram_1": blocks}}))
+    (directory / "M2.json").write_text(json.dumps({"arfm": {"sdram_0": {"C": {"rfm_req": 0}}}}))
+    (directory / "H1.json").write_text(json.dumps({"other": 1}))
+    (directory / "S1.json").write_text("{not json")
+    (directory / "U1.json").write_text(json.dumps({"arfm": {"sdram_0": ["A"]}}))
+    (directory / "U2.bin").write_bytes(make_dump())
+    (directory / "notes.txt").write_text("ignored")
+
+
+def test_incremental_index_matches_rebuild(tmp_path, capsys, monkeypatch):
+    write_corpus(tmp_path)
+    analyze.parse_json_files(str(tmp_path))
+    first = capsys.readouterr().out
+    assert "Total files parsed: 5\nFiles with valid RFM values: 3\nFiles with RFM Required bit set: 2\n" in first
+    assert sorted(p.name for p in tmp_path.iterdir() if p.name.startswith(".")) == [analyze.INDEX_NAME]
+    analyze.parse_json_files(str(tmp_path), rebuild_index=True)
+    assert capsys.readouterr().out == first
+
+    # Change, remove, and add files; only the changed and added files are parsed again.
+    (tmp_path / "M2.json").write_text(json.dumps({"arfm": {"sdram_1": {"A": {"rfm_req": 1, "raaimt": 48, "raammt": "3x"}}}}))
+    (tmp_path / "H1.json").unlink()
+    (tmp_path / "M3.json").write_text(json.dumps({"arfm": {}}))
+    parsed = []
+    parse_spd_file = analyze.parse_spd_file
+    monkeypatch.setattr(analyze, "parse_spd_file", lambda path: parsed.append(path) or parse_spd_file(path))
+    analyze.parse_json_files(str(tmp_path))
+    incremental = capsys.readouterr().out
+    assert sorted(map(os.path.basename, parsed)) == ["M2.json", "M3.json"]
+
+    analyze.parse_json_files(str(tmp_path), rebuild_index=True)
+    assert capsys.readouterr().out == incremental
+    assert incremental != first
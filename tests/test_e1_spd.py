@@ -0,0 +1,64 @@
+import json
+
+import numpy as np
+
+from tests import load_script
+
+analyze = load_script("e1-rfm-values/analyze.py")
+spd = analyze.spd
+
+
+def make_dump() -> bytes:
+    raw = bytearray(64)
+    raw[spd.DEVICE_TYPE_BYTE] = spd.DEVICE_TYPE_DDR5
+    # Refresh Management bytes of both SDRAMs, which must not show up as ARFM level A.
+    raw[30:32] = raw[38:40] = b"\x55\x80"
+    # First SDRAM: A = (1, 80, 6x), B = (0, 32, 3x), C not supported.
+    raw[32:34] = bytes([1 | 10 << 1 | 6 << 5, 0x80])
+    raw[34:36] = bytes([0 | 4 << 1 | 3 << 5, 0x80])
+    raw[36:38] = bytes([0xff, 0x00])
+    # Second SDRAM: A = (1, RFU, RFU), B and C not supported.
+    raw[40:42] = bytes([0xff, 0x80])
+    raw[42:44] = bytes([1 | 10 << 1 | 6 << 5, 0x00])
+    return bytes(raw)
+
+
+# The `arfm` object the SPD decoder writes for make_dump().
+DECODER_JSON = {
+    "arfm": {
+        "sdram_0": {
+            "A": {"rfm_req": 1, "raaimt": 80, "raammt": "6x"},
+            "B": {"rfm_req": 0, "raaimt": 32, "raammt": "3x"},
+        },
+        "sdram_1": {
+            "A": {"rfm_req": 1, "raaimt": "RFU", "raammt": "RFU"},
+        },
+    }
+}
+
+
+def decoded_strings(index, i):
+    strings = index["strings"].tolist()
+    return [[[strings[c] for c in level] for level in sdram] for sdram in index["codes"][i].tolist()]
+
+
+def test_dump_matches_decoder_json(tmp_path):
+    (tmp_path / "M1.json").write_text(json.dumps(DECODER_JSON))
+    (tmp_path / "M2.bin").write_bytes(make_dump())
+    index = analyze.update_index(str(tmp_path), ["M1.json", "M2.bin"])
+
+    assert index["status"].tolist() == [analyze.STATUS_OK, analyze.STATUS_OK]
+    assert decoded_strings(index, 1) == decoded_strings(index, 0)
+    np.testing.assert_array_equal(index["present"][1], index["present"][0])
+    assert decoded_strings(index, 1)[0] == [["1", "80", "6x"], ["0", "32", "3x"], ["N/A", "N/A", "N/A"]]
+
+
+def test_invalid_dumps_are_errors(tmp_path):
+    (tmp_path / "short.bin").write_bytes(make_dump()[:spd.SPD_MIN_SIZE - 1])
+    not_ddr5 = bytearray(make_dump())
+    not_ddr5[spd.DEVICE_TYPE_BYTE] = 0x0c
+    (tmp_path / "ddr4.spd").write_bytes(bytes(not_ddr5))
+    index = analyze.update_index(str(tmp_path), ["short.bin", "ddr4.spd"])
+
+    assert index["status"].tolist() == [analyze.STATUS_LOAD_ERROR] * 2
+    assert not index["present"].any()
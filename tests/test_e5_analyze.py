@@ -0,0 +1,91 @@
+import json
+
+import numpy as np
+
+from mcsee import activations, artifacts
+from tests import load_script
+
+analyze_experiment = load_script("e5-systematic-bit-flipping/code/scripts/analyze_experiment.py")
+
+NUM_FUNCTIONS = analyze_experiment.ROW_BITS + analyze_experiment.BK_BITS + analyze_experiment.BG_BITS
+ADDR_BITS = 35
+
+
+def apply_functions(masks, x):
+    # <bg,bk,row> bit i of the address x is the parity of masks[i] & x.
+    return sum((bin(mask & x).count("1") & 1) << i for i, mask in enumerate(masks))
+
+
+def random_functions(rng):
+    return [int(rng.integers(1 << ADDR_BITS)) for _ in range(NUM_FUNCTIONS)]
+
+
+def test_single_bit_observations_recover_functions():
+    rng = np.random.default_rng(0)
+    masks = random_functions(rng)
+    # Like E5: every iteration flips one address bit of its principal address.
+    observed_bits = [b for b in range(ADDR_BITS) if b not in (3, 20)]
+    observations = [(f"bit {b}", 1 << b, apply_functions(masks, 1 << b)) for b in observed_bits]
+    solved, undetermined, conflicts = analyze_experiment.solve_addr_functions(observations)
+
+    observed = sum(1 << b for b in observed_bits)
+    assert solved == [mask & observed for mask in masks]
+    assert undetermined == 0
+    assert conflicts == []
+
+
+def test_combined_observations_recover_functions():
+    rng = np.random.default_rng(1)
+    masks = random_functions(rng)
+    dxs = [int(rng.integers(1, 1 << ADDR_BITS)) for _ in range(3 * ADDR_BITS)]
+    observations = [(f"obs {i}", dx, apply_functions(masks, dx)) for i, dx in enumerate(dxs)]
+    solved, undetermined, conflicts = analyze_experiment.solve_addr_functions(observations)
+
+    assert solved == masks
+    assert undetermined == 0
+    assert conflicts == []
+    for _, dx, dy in observations:
+        assert apply_functions(solved, dx) == dy
+
+
+def test_underdetermined_and_conflicting_observations():
+    rng = np.random.default_rng(2)
+    masks = random_functions(rng)
+    # Bits 10 and 11 are only ever flipped together.
+    observations = [(f"bit {b}", 1 << b, apply_functions(masks, 1 << b)) for b in range(10)]
+    observations.append(("bits 10+11", 0b11 << 10, apply_functions(masks, 0b11 << 10)))
+    wrong = apply_functions(masks, 0b101) ^ 0b1001
+    observations.append(("wrong", 0b101, wrong))
+    solved, undetermined, conflicts = analyze_experiment.solve_addr_functions(observations)
+
+    assert undetermined == 1 << 10
+    assert conflicts == [("wrong", 0b1001)]
+    for _, dx, dy in observations[:-1]:
+        assert apply_functions(solved, dx) == dy
+    assert all(mask & ~((1 << 12) - 1) == 0 for mask in solved)
+
+
+def test_cached_histogram_selects_same_addresses(tmp_path):
+    (tmp_path / "data").mkdir()
+    rng = np.random.default_rng(3)
+    for length, num_keys in [(1, 1), (2, 2), (500, 3), (5000, 40), (5000, 1 << 21)]:
+        keys = rng.integers(num_keys, size=length)
+        keys[rng.random(length) < 0.2] = 7
+        histogram = activations.histogram(keys)
+        entry = analyze_experiment.act_cache_entry([], (1, 2, 3, 4), histogram)
+        analyze_experiment.write_act_cache(tmp_path, {"it=00000": entry})
+        cached = analyze_experiment.read_act_cache(tmp_path)["it=00000"]
+        assert cached == json.loads(json.dumps(entry))
+        assert len(cached["keys"]) <= analyze_experiment.ACT_CACHE_TOP_K
+        assert activations.most_activated_two(analyze_experiment.histogram_from_cache(cached)) == \
+            activations.most_activated_two(histogram)
+
+
+def test_act_cache_of_other_code_is_ignored(tmp_path):
+    (tmp_path / "data").mkdir()
+    analyze_experiment.write_act_cache(tmp_path, {"it=00000": {}})
+    assert analyze_experiment.read_act_cache(tmp_path) == {"it=00000": {}}
+    cache = json.loads(analyze_experiment.act_cache_path(tmp_path).read_text())
+    cache["code"] = artifacts.code_version([__file__])
+    analyze_experiment.act_cache_path(tmp_path).write_text(json.dumps(cache))
+    assert analyze_experiment.read_act_cache(tmp_path) == {}
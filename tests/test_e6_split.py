@@ -0,0 +1,94 @@
+import numpy as np
+
+from mcsee import ddr5
+from tests import load_script
+
+split_trace_into_blocks = load_script("e6-ptrr-existence/analysis/split_trace_into_blocks.py")
+
+
+def make_trace(path, seed: int):
+    """Writes a trace of hammering blocks to one bank, separated by pauses and sprinkled with other commands."""
+    rng = np.random.default_rng(seed)
+    lines = [",".join(ddr5.FIELDNAMES)]
+    t_ns = 0.0
+
+    def command(cmd, bg="", bk="", row="", col=""):
+        lines.append(f"{t_ns * 1e-9!r},{cmd},{bg},{bk},{row},{col}")
+
+    for _ in range(40):
+        # Most blocks are full, some are cut short and some are noise.
+        num_acts = int(rng.choice([100, 100 - int(rng.integers(15)), int(rng.integers(50, 90)), int(rng.integers(20))]))
+        for _ in range(num_acts):
+            command("act", "011", "10", format(int(rng.integers(1 << 16)), "016b"))
+            t_ns += float(rng.uniform(10, 60))
+            if rng.random() < 0.3:
+                command("pre_pb", "011", "10")
+            elif rng.random() < 0.05:
+                command("act", format(int(rng.integers(8)), "03b"), "01", format(int(rng.integers(1 << 16)), "016b"))
+            elif rng.random() < 0.05:
+                command("ref_ab")
+            t_ns += float(rng.uniform(10, 60))
+        t_ns += float(rng.choice([1000, 1500, 5000]))
+    path.write_bytes(("\r\n".join(lines) + "\r\n").encode())
+
+
+# The command-by-command segmentation and filtering of split_trace() before it used array operations.
+def split_reference(trace, idxs):
+    is_act = trace.is_cmd("act")
+    blocks = []
+    block_start = block_current = None
+    block_cmds = []
+    for idx, timestamp_sec in zip(idxs.tolist(), trace.time_sec()[idxs].tolist()):
+        timestamp_ns = timestamp_sec * 1e9
+        if block_start is None:
+            block_start = block_current = timestamp_ns
+            block_cmds = [idx]
+            continue
+        if timestamp_ns - block_current >= 1000:
+            blocks.append(block_cmds)
+            block_start = block_current = timestamp_ns
+            block_cmds = [idx]
+        else:
+            block_current = timestamp_ns
+            block_cmds.append(idx)
+    if block_start is not None:
+        blocks.append(block_cmds)
+
+    def count_acts(block):
+        return int(np.count_nonzero(is_act[block]))
+    blocks = [block for block in blocks if count_acts(block) >= 20]
+    max_acts = max(count_acts(block) for block in blocks)
+    return [(i, block) for i, block in enumerate(blocks) if count_acts(block) > max_acts * 0.9]
+
+
+def test_split_trace_matches_reference(tmp_path):
+    file = tmp_path / "trace.csv"
+    make_trace(file, seed=0)
+    blocks = split_trace_into_blocks.split_trace(file, tmp_path / "blocks")
+
+    trace = ddr5.read_trace(file)
+    bg, bk = ddr5.most_activated_banks(trace)[0][0]
+    idxs = np.flatnonzero(((trace.bg == bg) | (trace.bg == ddr5.NO_BG)) & ((trace.bk == bk) | (trace.bk == ddr5.NO_BK)))
+    expected = split_reference(trace, idxs)
+    assert 1 < len(expected) < 40
+    assert [(i, cmds.tolist()) for i, cmds in blocks] == expected
+
+    lines = file.read_bytes().split(b"\r\n")
+    for i, cmds in expected:
+        block_file = tmp_path / "blocks" / "trace" / f"block_{i:03d}.csv"
+        assert block_file.read_bytes() == b"".join(lines[idx + 1] + b"\r\n" for idx in [-1] + cmds)
+    assert len(list((tmp_path / "blocks" / "trace").iterdir())) == len(expected)
+
+
+def test_logged_split_matches_split(tmp_path, capsys):
+    # The parallel workers return the output of split_trace() instead of printing it.
+    file = tmp_path / "trace.csv"
+    make_trace(file, seed=1)
+    blocks = split_trace_into_blocks.split_trace(file, None)
+    output = capsys.readouterr().out
+
+    log, logged_blocks = split_trace_into_blocks.split_trace_logged((file, None))
+    assert capsys.readouterr().out == ""
+    assert log == output
+    assert [(i, cmds.tolist()) for i, cmds in logged_blocks] == [(i, cmds.tolist()) for i, cmds in blocks]
+    assert not (tmp_path / "blocks").exists()
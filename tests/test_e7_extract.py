@@ -0,0 +1,66 @@
+import subprocess
+import sys
+
+import numpy as np
+
+from mcsee import blockstore, ddr5, events
+from tests import REPO
+from tests.test_events import find_events_reference
+
+SCRIPT = REPO / "e7-ptrr-probability/analysis/extract_events.py"
+
+
+def write_block(path, rng, num_acts: int) -> list[int]:
+    """Writes a block of ACTs to a few neighbouring rows (such that there are many events), and returns the rows."""
+    lines = [",".join(ddr5.FIELDNAMES)]
+    rows = (100 + rng.integers(5, size=num_acts)).tolist()
+    t = 1.0
+    for row in rows:
+        lines.append(f"{t!r},act,011,10,{row:016b},")
+        t += 5e-8
+        if rng.random() < 0.3:
+            lines.append(f"{t!r},pre_pb,011,10,,")
+            t += 5e-8
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(("\r\n".join(lines) + "\r\n").encode())
+    return rows
+
+
+def test_events_match_reference(tmp_path):
+    rng = np.random.default_rng(0)
+    block_rows = {}
+    for it_name in ("it=00000", "it=00001"):
+        for block, num_acts in enumerate([200, 3, 2, 50]):
+            path = tmp_path / "data/blocks" / it_name / "trace" / f"block_{block:03d}.csv"
+            block_rows[str(path)] = write_block(path, rng, num_acts)
+    subprocess.run([sys.executable, str(SCRIPT), str(tmp_path)], check=True, capture_output=True)
+
+    blocks = list(events.iter_blocks(tmp_path / "data" / events.EVENTS_NAME))
+    assert [block["file"] for block in blocks] == sorted(block_rows)
+    for block in blocks:
+        rows = block_rows[block["file"]]
+        assert block["num_acts"] == len(rows)
+        assert [event["act_number"] for event in block["events"]] == find_events_reference(rows)
+        assert all(event["rows"] == rows[event["act_number"]:event["act_number"] + 3] for event in block["events"])
+    assert sum(len(block["events"]) for block in blocks) > 20
+    # The blocks are read without writing sidecar caches next to them.
+    assert not list((tmp_path / "data/blocks").rglob("*.cache"))
+
+
+def test_block_store_matches_block_files(tmp_path):
+    rng = np.random.default_rng(1)
+    paths = [tmp_path / "data/blocks/it=00000/trace" / f"block_{block:03d}.csv" for block in (0, 4)]
+    for path in paths:
+        write_block(path, rng, 100)
+    subprocess.run([sys.executable, str(SCRIPT), str(tmp_path)], check=True, capture_output=True)
+    from_files = [(path.name, path.read_text()) for path in sorted((tmp_path / "data").glob("mitigation_events.*"))]
+
+    with blockstore.BlockStoreWriter(tmp_path / "data" / blockstore.STORE_NAME) as writer:
+        for block, path in zip((0, 4), paths):
+            trace = ddr5.read_trace(path, use_cache=False)
+            writer.add("it=00000", "trace", block, trace, np.arange(len(trace)))
+    for path in paths:
+        path.unlink()
+    subprocess.run([sys.executable, str(SCRIPT), str(tmp_path), "--block-store"], check=True, capture_output=True)
+    assert [(path.name, path.read_text()) for path in sorted((tmp_path / "data").glob("mitigation_events.*"))] == \
+        from_files
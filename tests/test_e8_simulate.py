@@ -0,0 +1,59 @@
+import json
+
+import numpy as np
+
+from tests import load_script
+
+simulate_bypass = load_script("e8-ptrr-attack-bypass-time/simulate_bypass.py")
+
+
+def write_events(path, blocks):
+    # blocks: list of (num_acts, act numbers of the events)
+    with path.open("w") as f:
+        for num_acts, act_numbers in blocks:
+            events = [{"act_number": n} for n in act_numbers]
+            f.write(json.dumps({"num_acts": num_acts, "events": events}) + "\n")
+
+
+# Longest run of ACTs without an event in the concatenation of `blocks`, ACT by ACT.
+def longest_run_reference(blocks, order):
+    longest = run = 0
+    for b in order:
+        num_acts, act_numbers = blocks[b]
+        i = 0
+        while i < num_acts:
+            if i in act_numbers:
+                longest = max(longest, run)
+                run = 0
+                i += simulate_bypass.EVENT_ACTS
+            else:
+                run += 1
+                i += 1
+        longest = max(longest, run)
+    return longest
+
+
+def test_simulate_windows_matches_reference(tmp_path):
+    blocks = [(40, [10, 25]), (30, []), (50, [0]), (20, [17]), (60, [5, 30, 50])]
+    write_events(tmp_path / "events.jsonl", blocks)
+    stats = simulate_bypass.read_block_stats(tmp_path / "events.jsonl")
+
+    thresholds = np.arange(0, 80)
+    seed = np.random.SeedSequence(1)
+    counts = simulate_bypass.simulate_windows(stats, thresholds, 200, 4, seed)
+
+    order = np.random.default_rng(seed).integers(len(blocks), size=(200, 4))
+    per_aggressor = np.array([longest_run_reference(blocks, o) // simulate_bypass.AGGRESSORS for o in order.tolist()])
+    np.testing.assert_array_equal(counts, (per_aggressor[:, None] >= thresholds[None, :]).sum(axis=0))
+
+
+def test_thresholds_count_acts_per_aggressor(tmp_path):
+    write_events(tmp_path / "events.jsonl", [(100, [])])
+    stats = simulate_bypass.read_block_stats(tmp_path / "events.jsonl")
+    counts = simulate_bypass.simulate_windows(stats, np.array([50, 51, 100]), 10, 1, np.random.SeedSequence(0))
+    assert counts.tolist() == [10, 0, 0]
+
+
+def test_no_blocks(tmp_path):
+    (tmp_path / "events.jsonl").write_text("")
+    assert len(simulate_bypass.read_block_stats(tmp_path / "events.jsonl").num_acts) == 0
@@ -0,0 +1,69 @@
+import json
+
+import numpy as np
+
+from mcsee import events
+
+
+def block(name, num_acts, act_numbers):
+    return {"file": name, "duration_ns": 10 * num_acts, "num_acts": num_acts,
+            "events": [{"act_number": n} for n in act_numbers]}
+
+
+NEW_BLOCKS = [block("a/block_000.csv", 100, [5, 50]), block("a/block_001.csv", 90, [])]
+OLD_BLOCKS = [block("b/block_000.csv", 80, [1, 2, 3])]
+
+
+def test_summary_matches_events(tmp_path):
+    events_path = tmp_path / events.EVENTS_NAME
+    with events.EventWriter(events_path) as writer:
+        for b in NEW_BLOCKS:
+            writer.add(b)
+
+    assert list(events.iter_blocks(events_path)) == NEW_BLOCKS
+    for path in (events_path, events.summary_path(events_path)):
+        summary = events.read_summary(path)
+        assert summary.num_acts.tolist() == [100, 90]
+        assert summary.num_events.tolist() == [2, 0]
+        assert summary.duration_ns.tolist() == [1000, 900]
+        assert summary.files == ["a/block_000.csv", "a/block_001.csv"]
+
+
+def test_legacy_json_ignores_summary_of_other_events_file(tmp_path):
+    with events.EventWriter(tmp_path / events.EVENTS_NAME) as writer:
+        for b in NEW_BLOCKS:
+            writer.add(b)
+    legacy_path = tmp_path / "mitigation_events.json"
+    legacy_path.write_text(json.dumps(OLD_BLOCKS))
+
+    summary = events.read_summary(legacy_path)
+    assert summary.num_events.tolist() == [3]
+    assert summary.files == ["b/block_000.csv"]
+
+
+def test_empty_summary(tmp_path):
+    with events.EventWriter(tmp_path / events.EVENTS_NAME):
+        pass
+    assert len(events.read_summary(tmp_path / events.EVENTS_NAME)) == 0
+
+
+# The event loop of extract_events.py before find_events().
+def find_events_reference(act_rows):
+    event_idxs = []
+    for j in range(len(act_rows) - 2):
+        rows = sorted(act_rows[j:j+3])
+        if rows[1] == rows[0] + 1 and rows[2] == rows[0] + 2:
+            if not event_idxs or j - event_idxs[-1] >= 2:
+                event_idxs.append(j)
+    return event_idxs
+
+
+def test_find_events_matches_reference():
+    rng = np.random.default_rng(0)
+    for length in [0, 1, 2, 3, 4, 5, 10, 1000]:
+        for _ in range(20):
+            # Few distinct rows, such that there are many (overlapping) events.
+            act_rows = 100 + rng.integers(5, size=length)
+            assert events.find_events(act_rows.astype(np.uint32)).tolist() == find_events_reference(act_rows.tolist())
+    # Runs of adjacent candidates: every other one is kept.
+    assert events.find_events(np.array([1, 2, 3, 4, 5, 6, 7])).tolist() == [0, 2, 4]
@@ -0,0 +1,37 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from mcsee import series
+
+
+@pytest.mark.parametrize("values, dtype", [
+    ([120, 118, 0, 131, 2**40], np.int64),
+    ([31.875, 35.0, 1e-3, 70200.5], np.float64),
+    ([], np.int64),
+])
+def test_round_trip_matches_pickle(tmp_path, values, dtype):
+    # The series files replace the pickled lists of values of E2 and E4.
+    (tmp_path / "values.pkl").write_bytes(pickle.dumps(values))
+    series.save_series(tmp_path / "values.series", values, dtype, capture="c.csv", nbanks=3, run=0)
+
+    loaded, metadata = series.load_series(tmp_path / "values.series")
+    assert loaded.dtype == np.dtype(dtype)
+    assert loaded.tolist() == pickle.loads((tmp_path / "values.pkl").read_bytes())
+    assert metadata == {"capture": "c.csv", "nbanks": 3, "run": 0}
+
+
+def test_values_are_aligned(tmp_path):
+    for capture in ("a", "ab", "abc"):
+        series.save_series(tmp_path / "values.series", [1.0, 2.0], np.float64, capture=capture)
+        header, offset = series.read_metadata(tmp_path / "values.series")
+        assert offset % series.DATA_ALIGNMENT == 0
+        assert header["length"] == 2
+        assert (tmp_path / "values.series").stat().st_size == offset + 16
+
+
+def test_not_a_series_file(tmp_path):
+    (tmp_path / "values.pkl").write_bytes(pickle.dumps([1, 2, 3]))
+    with pytest.raises(ValueError, match="not a series file"):
+        series.load_series(tmp_path / "values.pkl")